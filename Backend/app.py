@@ -1,14 +1,25 @@
 import os
+import time
 import asyncio
-import pandas as pd
+import hashlib
 import logging
-from fastapi import FastAPI, Request, UploadFile, File, HTTPException
-from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, FileResponse
+from datetime import date
+from typing import Optional
+from fastapi import FastAPI, Request, UploadFile, File, HTTPException, Query
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from utils import (
-    bot, update_csv_files, DOCUMENTS_CSV, SHIPMENTS_CSV, TRACEABILITY_CSV,
-    init_pocketbase, setup_oauth_via_http, fetch_pocketbase_config, init_groq_client, get_groq_model
+    bot, update_csv_files, CSVValidationError, DOCUMENTS_CSV, SHIPMENTS_CSV, TRACEABILITY_CSV,
+    init_pocketbase, setup_oauth_via_http, fetch_pocketbase_config, init_groq_client, get_groq_model,
+    get_anthropic_client, get_groq_async_client, get_pocketbase_client
 )
+from directory import filter_exporters, paginate
+from framing import sse_message
+from health import HealthProber
+from metrics import REGISTRY, SharedMetrics
+from link_graph import LINK_WALK_DEFAULT_DEPTH, LINK_WALK_MAX_DEPTH
+from fda_export import XLSX_MAX_ROWS
+from sse_starlette.sse import EventSourceResponse
 from dotenv import load_dotenv
 
 # Configure logging
@@ -43,19 +54,52 @@ LANDING_DIR = os.getenv("LANDING_DIR", "Landing")
 pb_client = None
 groq_client = None
 
+def check_groq():
+    """
+    Blocking Groq check used by the health prober. Looks the configured model up
+    in the models API, which checks the key and the model without billing a
+    completion on every probe of every worker.
+    """
+    global groq_client
+    if not groq_client:
+        groq_client = init_groq_client()
+    if not groq_client:
+        raise RuntimeError("Groq client not initialized. Check API key.")
+    model = groq_client.models.retrieve(get_groq_model())
+    return {"status": "success", "message": "Groq API is working", "model": model.id}
+
+# Dependency checks run in the background; status endpoints serve the latest result
+health = HealthProber()
+health.register("groq", check_groq)
+health.register("pocketbase", fetch_pocketbase_config, healthy_if=lambda config: config.get("health") == "ok")
+
+# Read at scrape time from the current state
+REGISTRY.gauge("fdabot_reference_data_version", "Version of the published reference data snapshot",
+               lambda: bot.reference_data.current.version)
+REGISTRY.gauge("fdabot_response_cache_entries", "Cached first-turn chat responses",
+               lambda: bot.response_cache.stats()["entries"])
+
+# With several workers, each one's metrics are shared so any worker can answer a scrape for all
+shared_metrics = None
+if bot.shared_reference is not None:
+    shared_metrics = SharedMetrics(os.path.join(bot.shared_reference.directory, "metrics"), REGISTRY)
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize clients on startup"""
     global pb_client, groq_client
+
+    # Start write-behind persistence of chat sessions
+    bot.sessions.start()
     
     # Initialize PocketBase client
     try:
-        pb_client = init_pocketbase()
+        pb_client = await init_pocketbase()
         if pb_client:
             logger.info("PocketBase client initialized successfully")
             
             # Set up OAuth
-            oauth_result = setup_oauth_via_http()
+            oauth_result = await setup_oauth_via_http()
             if oauth_result:
                 logger.info("OAuth configured successfully")
             else:
@@ -71,6 +115,26 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Error initializing Groq client: {str(e)}")
 
+    health.start()
+    # Pick up reference data published by other workers (multi-worker mode)
+    bot.start_shared_reference_watch()
+    if shared_metrics:
+        shared_metrics.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush pending session writes and close pooled connections on shutdown"""
+    await health.stop()
+    await bot.stop_shared_reference_watch()
+    if shared_metrics:
+        await shared_metrics.stop()
+    await bot.sessions.stop()
+    await get_anthropic_client().close()
+    if get_groq_async_client():
+        await get_groq_async_client().close()
+    if get_pocketbase_client():
+        await get_pocketbase_client().close()
+
 @app.get("/", response_class=HTMLResponse)
 async def get_index():
     return FileResponse(f"{FRONTEND_DIR}/signup.html")
@@ -94,27 +158,45 @@ async def upload_csv(
         files["traceability_csv"] = traceability_csv
     if not files:
         return JSONResponse({"message": "No files provided."})
-    updated = await update_csv_files(files)
-    if updated:
-        return JSONResponse({"message": "CSV files updated successfully."})
+    try:
+        result = await update_csv_files(files)
+    except CSVValidationError as e:
+        return JSONResponse({"message": f"CSV file rejected: {str(e)}"}, status_code=400)
+    except Exception as e:
+        logger.error(f"Error updating CSV files: {str(e)}")
+        return JSONResponse({"message": "No valid CSV files uploaded."}, status_code=500)
+    if result:
+        return JSONResponse({"message": "CSV files updated successfully.", **result})
     else:
         return JSONResponse({"message": "No valid CSV files uploaded."})
 
 @app.post("/chat")
 async def chat(request: Request):
+    received_at = time.perf_counter()
     data = await request.json()
     message = data.get("message", "")
     exporter_id = data.get("exporter_id", None)
+    session_id = data.get("session_id", None)
+
+    # Server-Sent Events when asked for, NDJSON otherwise
+    if data.get("transport") == "sse" or "text/event-stream" in request.headers.get("accept", ""):
+        async def sse_response():
+            async for event in bot.stream_events(message, exporter_id, session_id, received_at):
+                yield sse_message(event)
+
+        return EventSourceResponse(sse_response())
 
     async def stream_response():
         # The bot.process_query now yields structured JSON data
-        async for chunk in bot.process_query(message, exporter_id):
+        async for chunk in bot.process_query(message, exporter_id, session_id, received_at):
             yield chunk
 
     return StreamingResponse(stream_response(), media_type="text/plain")
 
 @app.get("/new_chat")
-async def new_chat():
+async def new_chat(session_id: Optional[str] = None):
+    if session_id:
+        bot.sessions.clear(session_id)
     return JSONResponse({"message": "New chat window opened. Chat history cleared."})
 
 @app.get("/list_csv")
@@ -127,95 +209,126 @@ async def list_csv():
     return JSONResponse({"files": files})
 
 @app.get("/list_exporters")
-async def list_exporters():
-    # Get exporters from profiles
-    profile_exporters = [
-        {
-            "exporter_id": exporter_id,
-            "exporter_name": data.get("Exporter Name", "Unknown"),
-            "country": data.get("Country of Origin", "Unknown"),
-            "industry": data.get("Industry Focus", "Unknown"),
-            "has_profile": True
-        }
-        for exporter_id, data in bot.exporter_profiles.items()
-    ]
-    
-    # Get unique exporters from CSV files
-    csv_exporters = set()
-    exporter_names = {}
-    
+async def list_exporters(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    country: Optional[str] = None,
+    industry: Optional[str] = None,
+    has_profile: Optional[bool] = None
+):
+    # Directory is built once per data version and profile change
+    tag, all_exporters = bot.exporter_directory()
+
+    # ETag covers the data version and the requested view
+    etag = '"' + hashlib.sha1(f"{tag}|{request.url.query}".encode("utf-8")).hexdigest() + '"'
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    exporters = filter_exporters(all_exporters, country, industry, has_profile)
     try:
-        if os.path.exists(DOCUMENTS_CSV):
-            # Handle BOM and double quotes in CSV
-            docs_df = pd.read_csv(DOCUMENTS_CSV, encoding='utf-8-sig')
-            # Get the actual Exporter ID column name (might have extra quotes)
-            exporter_id_col = [col for col in docs_df.columns if 'Exporter ID' in col][0]
-            exporter_name_col = [col for col in docs_df.columns if 'Exporter Name' in col][0]
-            
-            if not docs_df.empty and exporter_id_col in docs_df.columns:
-                # Clean the exporter IDs of any quotes
-                clean_ids = docs_df[exporter_id_col].astype(str).apply(lambda x: x.strip('"'))
-                csv_exporters.update(clean_ids.dropna().unique())
-                # Store exporter names
-                for idx, row in docs_df.iterrows():
-                    eid = str(row[exporter_id_col]).strip('"')
-                    name = str(row[exporter_name_col]).strip('"')
-                    exporter_names[eid] = name
-    except Exception as e:
-        logger.error(f"Error reading documents CSV: {str(e)}")
-    
-    # Add CSV-only exporters (those without profiles)
-    profile_ids = {exp["exporter_id"] for exp in profile_exporters}
-    csv_only_exporters = [
-        {
-            "exporter_id": str(exporter_id),
-            "exporter_name": exporter_names.get(str(exporter_id), "Unknown"),
-            "country": "Unknown",
-            "industry": "Unknown",
-            "has_profile": False
-        }
-        for exporter_id in csv_exporters
-        if str(exporter_id) not in profile_ids
-    ]
-    
-    # Combine both lists
-    all_exporters = profile_exporters + csv_only_exporters
-    
-    # Sort by exporter ID
-    all_exporters.sort(key=lambda x: x["exporter_id"])
-    
-    # If no exporters found, return an empty list rather than error
-    if not all_exporters:
-        return JSONResponse({
-            "exporters": [],
-            "total_count": 0,
-            "profile_count": 0,
-            "csv_only_count": 0
-        })
-    
+        page, next_cursor = paginate(exporters, cursor, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    profile_count = sum(1 for exp in exporters if exp["has_profile"])
+    return JSONResponse({
+        "exporters": page,
+        "total_count": len(exporters),
+        "profile_count": profile_count,
+        "csv_only_count": len(exporters) - profile_count,
+        "next_cursor": next_cursor
+    }, headers={"ETag": etag})
+
+@app.get("/compliance_issues")
+async def compliance_issues(include_issues: bool = False):
+    """Compliance issue summary for all exporters in one call"""
+    return JSONResponse(bot.compliance_summary(include_issues))
+
+@app.get("/rollups")
+async def rollups(exporter_id: Optional[str] = None, names: Optional[str] = None):
+    """Status counts by exporter, product, port, carrier and month (optionally only the named rollups)"""
+    summary = bot.rollup_summary(exporter_id, names.split(",") if names else None)
+    if summary is None:
+        raise HTTPException(status_code=404, detail=f"No reference data for exporter {exporter_id}")
+    return JSONResponse(summary)
+
+@app.get("/links/dangling")
+async def dangling_links(limit: int = Query(100, ge=1, le=10000)):
+    """Links to documents, shipments or traceability records that do not exist"""
+    return JSONResponse(bot.dangling_links(limit))
+
+@app.get("/links/{record_id}")
+async def link_walk(record_id: str, max_depth: int = Query(LINK_WALK_DEFAULT_DEPTH, ge=0, le=LINK_WALK_MAX_DEPTH)):
+    """Everything connected to a document, shipment, traceability record, lot, batch or supplier"""
+    walk = await asyncio.to_thread(bot.link_walk, record_id, max_depth)
+    if walk is None:
+        raise HTTPException(status_code=404, detail=f"No linked record with ID {record_id}")
+    return JSONResponse(walk)
+
+# Export format -> response media type
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+@app.get("/export/fda")
+async def export_fda(
+    exporter_id: Optional[str] = None,
+    lot_number: Optional[str] = None,
+    product: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    format: str = Query("csv", pattern="^(csv|xlsx)$")
+):
+    """
+    Stream the FDA electronic sortable spreadsheet (one row per critical tracking
+    event with its KDEs, shipment and documents) for an exporter, lot, product or date range
+    """
+    # Selecting and ordering the matching rows touches the whole table, so keep it off the event loop
+    export = await asyncio.to_thread(bot.fda_export, exporter_id, lot_number, product, start_date, end_date)
+    if not len(export):
+        raise HTTPException(status_code=404, detail="No traceability records match the export filters")
+    if format == "xlsx" and len(export) + 1 > XLSX_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"{len(export)} rows exceed the XLSX row limit; export as CSV instead")
+
+    chunks = export.xlsx_chunks() if format == "xlsx" else export.csv_chunks()
+    return StreamingResponse(chunks, media_type=EXPORT_MEDIA_TYPES[format], headers={
+        "Content-Disposition": f'attachment; filename="{export.file_name(format)}"',
+        "X-Record-Count": str(len(export)),
+    })
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus metrics: chat latency spans, token usage and reference data reloads,
+    labelled by worker (every worker's series in multi-worker mode)
+    """
+    others = await asyncio.to_thread(shared_metrics.collect) if shared_metrics else None
+    return Response(REGISTRY.render(others), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/router/stats")
+async def router_stats():
+    """Per-route request counts, latency percentiles and estimated cost of chat queries"""
     return JSONResponse({
-        "exporters": all_exporters,
-        "total_count": len(all_exporters),
-        "profile_count": len(profile_exporters),
-        "csv_only_count": len(csv_only_exporters)
+        **bot.router.stats_snapshot(),
+        "providers": {name: breaker.snapshot() for name, breaker in bot.breakers.items()}
     })
 
 # New endpoints for PocketBase and Groq integration
 @app.get("/api/pocketbase/status")
-async def get_pocketbase_status():
-    """Get the current status of the PocketBase connection"""
-    try:
-        config = fetch_pocketbase_config()
-        return JSONResponse(config)
-    except Exception as e:
-        logger.error(f"Error getting PocketBase status: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+async def get_pocketbase_status(probe: Optional[str] = None):
+    """Get the current status of the PocketBase connection (cached; ?probe=now to re-check)"""
+    state = await health.get("pocketbase", probe_now=probe == "now")
+    if state.result is None:
+        raise HTTPException(status_code=500, detail=state.last_error["message"])
+    return JSONResponse({**state.result, "probe": state.snapshot()})
 
 @app.post("/api/pocketbase/setup-oauth")
 async def setup_pocketbase_oauth():
     """Set up OAuth for PocketBase"""
     try:
-        result = setup_oauth_via_http()
+        result = await setup_oauth_via_http()
         if result:
             return JSONResponse({"status": "success", "message": "OAuth configured successfully"})
         else:
@@ -228,45 +341,16 @@ async def setup_pocketbase_oauth():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/groq/status")
-async def get_groq_status():
-    """Check if Groq API is configured and working"""
-    global groq_client
-    
-    if not groq_client:
-        try:
-            groq_client = init_groq_client()
-        except Exception as e:
-            logger.error(f"Error initializing Groq client: {str(e)}")
-            return JSONResponse(
-                {"status": "error", "message": f"Failed to initialize Groq client: {str(e)}"},
-                status_code=500
-            )
-    
-    if not groq_client:
-        return JSONResponse(
-            {"status": "error", "message": "Groq client not initialized. Check API key."},
-            status_code=500
-        )
-    
-    try:
-        # Test the Groq API with a simple completion
-        model = get_groq_model()
-        response = groq_client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": "Hello, are you working?"}],
-            max_tokens=10
-        )
-        return JSONResponse({
-            "status": "success", 
-            "message": "Groq API is working",
-            "model": response.model
-        })
-    except Exception as e:
-        logger.error(f"Error testing Groq API: {str(e)}")
+async def get_groq_status(probe: Optional[str] = None):
+    """Check if Groq API is configured and working (cached; ?probe=now to re-check)"""
+    state = await health.get("groq", probe_now=probe == "now")
+    if not state.healthy:
         return JSONResponse(
-            {"status": "error", "message": f"Failed to test Groq API: {str(e)}"},
+            {"status": "error", "message": f"Failed to test Groq API: {state.last_error['message']}",
+             "probe": state.snapshot()},
             status_code=500
         )
+    return JSONResponse({**state.result, "probe": state.snapshot()})
 
 if __name__ == '__main__':
     import uvicorn
@@ -0,0 +1,118 @@
+import os
+import hashlib
+import logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = None
+    feather = None
+
+logger = logging.getLogger(__name__)
+
+# Columnar cache files live next to each CSV, e.g. CSV/documents.csv.arrow
+CACHE_SUFFIX = ".arrow"
+CACHE_FORMAT_VERSION = "1"
+CSV_CACHE_ENABLED = os.getenv("CSV_CACHE_ENABLED", "true").lower() == "true"
+
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def cache_available():
+    """The cache needs pyarrow; without it tables are always parsed from CSV"""
+    return CSV_CACHE_ENABLED and pa is not None
+
+
+def cache_path_for(csv_path):
+    return csv_path + CACHE_SUFFIX
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _read_cache_key(cache_path):
+    """Read only the schema metadata of a cache file"""
+    with pa.memory_map(cache_path, "r") as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    return {key.decode(): value.decode() for key, value in metadata.items()}
+
+
+def _cache_is_fresh(csv_path, cache_path, stat):
+    try:
+        key = _read_cache_key(cache_path)
+    except (OSError, pa.ArrowInvalid):
+        return False
+    if key.get("format_version") != CACHE_FORMAT_VERSION or key.get("source_size") != str(stat.st_size):
+        return False
+    if key.get("source_mtime_ns") == str(stat.st_mtime_ns):
+        return True
+    # Same size but touched (e.g. re-copied on container start): fall back to the content hash
+    return key.get("source_sha256") == file_sha256(csv_path)
+
+
+def _write_cache(df, csv_path, cache_path, stat):
+    source_sha256 = file_sha256(csv_path)
+    current = os.stat(csv_path)
+    if (current.st_size, current.st_mtime_ns) != (stat.st_size, stat.st_mtime_ns):
+        # Source replaced while parsing; the next load will rebuild
+        return
+    write_table_file(df, cache_path, {
+        "format_version": CACHE_FORMAT_VERSION,
+        "source_size": str(stat.st_size),
+        "source_mtime_ns": str(stat.st_mtime_ns),
+        "source_sha256": source_sha256,
+    })
+
+
+def write_table_file(df, path, metadata=None):
+    """Write a DataFrame as an Arrow file (atomically replacing path), with string schema metadata"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        **{key.encode(): value.encode() for key, value in (metadata or {}).items()},
+    })
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    # Uncompressed so the file can be memory-mapped straight back into columns
+    feather.write_feather(table, temp_path, compression="uncompressed")
+    os.replace(temp_path, path)
+
+
+def map_table_file(path):
+    """
+    DataFrame over a memory-mapped Arrow file. String columns stay backed by
+    the mapping, so processes mapping the same file share its pages.
+    """
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+
+def load_cached_table(csv_path, parse_csv):
+    """
+    Return the DataFrame for csv_path, from its columnar cache when that was built
+    from the same source file (size, mtime, then sha256), otherwise by calling
+    parse_csv() and rebuilding the cache.
+    """
+    if not cache_available() or not os.path.exists(csv_path):
+        return parse_csv()
+
+    cache_path = cache_path_for(csv_path)
+    stat = os.stat(csv_path)
+    if os.path.exists(cache_path) and _cache_is_fresh(csv_path, cache_path, stat):
+        try:
+            return map_table_file(cache_path)
+        except (OSError, pa.ArrowInvalid) as e:
+            logger.warning(f"Discarding unreadable cache {cache_path}: {str(e)}")
+
+    df = parse_csv()
+    if df.empty:
+        return df
+    try:
+        _write_cache(df, csv_path, cache_path, stat)
+    except (OSError, pa.ArrowException) as e:
+        logger.warning(f"Could not write columnar cache for {csv_path}: {str(e)}")
+    return df
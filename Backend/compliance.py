@@ -0,0 +1,125 @@
+import pandas as pd
+
+EXPORTER_ID_COLUMN = "Exporter ID"
+
+SEVERITY_RANK = {"High": 0, "Medium": 1}
+
+ISSUE_COLUMNS = ["exporter_id", "issue_type", "id", "status", "details", "severity"]
+
+
+def _exporter_ids(df):
+    return df[EXPORTER_ID_COLUMN].astype(str).str.strip()
+
+
+def _has_columns(df, columns):
+    return not df.empty and all(col in df.columns for col in (EXPORTER_ID_COLUMN, *columns))
+
+
+class ComplianceIssueIndex:
+    """
+    Per-exporter compliance issues, computed once per reference data version.
+
+    Pending documents, non-compliant shipments and failed traceability records
+    are selected with vectorized filters into a single issue table grouped by
+    Exporter ID, so analyze_compliance is a dictionary lookup.
+    """
+
+    def __init__(self, documents_df, shipments_df, traceability_df):
+        frames = []
+
+        if _has_columns(documents_df, ("Status", "Document ID", "Comments")):
+            pending = documents_df[documents_df["Status"] == "Pending Review"]
+            frames.append(pd.DataFrame({
+                "exporter_id": _exporter_ids(pending),
+                "issue_type": "Document",
+                "id": pending["Document ID"],
+                "status": "Pending Review",
+                "details": pending["Comments"],
+                "severity": "Medium"
+            }))
+
+        if _has_columns(shipments_df, ("Compliance Status", "Shipment ID", "Product Description", "Arrival Port")):
+            non_compliant = shipments_df[shipments_df["Compliance Status"] == "Non-Compliant"]
+            frames.append(pd.DataFrame({
+                "exporter_id": _exporter_ids(non_compliant),
+                "issue_type": "Shipment",
+                "id": non_compliant["Shipment ID"],
+                "status": "Non-Compliant",
+                "details": ("Non-compliant shipment of " + non_compliant["Product Description"].astype(str)
+                            + " to " + non_compliant["Arrival Port"].astype(str)),
+                "severity": "High"
+            }))
+
+        if _has_columns(traceability_df, ("Compliance Flag", "Record ID", "Comments")):
+            failed = traceability_df[traceability_df["Compliance Flag"] == "Fail"]
+            frames.append(pd.DataFrame({
+                "exporter_id": _exporter_ids(failed),
+                "issue_type": "Traceability Record",
+                "id": failed["Record ID"],
+                "status": "Failed",
+                "details": failed["Comments"],
+                "severity": "High"
+            }))
+
+        frames = [frame for frame in frames if not frame.empty]
+        issues = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=ISSUE_COLUMNS)
+        # Stable sort keeps the document/shipment/record order within each severity
+        issues = issues.assign(_rank=issues["severity"].map(SEVERITY_RANK).fillna(2)) \
+            .sort_values(["exporter_id", "_rank"], kind="stable") \
+            .drop(columns="_rank")
+        self.issues = issues.fillna({"details": ""}).reset_index(drop=True)
+
+        # Exporters whose issues warrant the temperature monitoring recommendation
+        self.temperature_exporters = set(
+            self.issues.loc[self.issues["details"].astype(str).str.contains("temperature"), "exporter_id"]
+        )
+
+        self.issues_by_exporter = {
+            exporter_id: group.drop(columns="exporter_id").to_dict("records")
+            for exporter_id, group in self.issues.groupby("exporter_id", sort=False)
+        }
+
+        # Exporters with any reference rows at all (issues or not), and their names
+        self.exporter_names = {}
+        reference_ids = set()
+        for df in (documents_df, shipments_df, traceability_df):
+            if df.empty or EXPORTER_ID_COLUMN not in df.columns:
+                continue
+            ids = _exporter_ids(df)
+            reference_ids.update(ids.unique())
+            if "Exporter Name" in df.columns:
+                names = df["Exporter Name"].groupby(ids).first().dropna()
+                for exporter_id, name in names.items():
+                    self.exporter_names.setdefault(exporter_id, str(name))
+        self.reference_exporter_ids = reference_ids
+
+        self.summary = self._build_summary()
+
+    def _build_summary(self):
+        """Issue counts per exporter for the bulk endpoint"""
+        ids = sorted(self.reference_exporter_ids)
+        if self.issues.empty:
+            counts = pd.DataFrame(index=ids)
+        else:
+            counts = pd.crosstab(self.issues["exporter_id"], self.issues["issue_type"])
+        counts = counts.reindex(ids, fill_value=0)
+        summary = []
+        for exporter_id in ids:
+            row = counts.loc[exporter_id] if exporter_id in counts.index else {}
+            issues = self.issues_by_exporter.get(exporter_id, [])
+            summary.append({
+                "exporter_id": exporter_id,
+                "exporter_name": self.exporter_names.get(exporter_id, "Unknown"),
+                "pending_documents": int(row.get("Document", 0)),
+                "non_compliant_shipments": int(row.get("Shipment", 0)),
+                "failed_traceability_records": int(row.get("Traceability Record", 0)),
+                "total_issues": len(issues),
+                "high_severity": sum(1 for issue in issues if issue["severity"] == "High")
+            })
+        return summary
+
+    def has_reference_data(self, exporter_id):
+        return exporter_id in self.reference_exporter_ids
+
+    def issues_for(self, exporter_id):
+        return self.issues_by_exporter.get(exporter_id, [])
@@ -0,0 +1,204 @@
+import os
+import logging
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Approximate token budget for the reference data section of the system prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 6000))
+
+# Rough characters-per-token ratio used for budgeting (no tokenizer round trip)
+CHARS_PER_TOKEN = 4
+
+EXPORTER_ID_COLUMN = "Exporter ID"
+
+
+def estimate_tokens(text):
+    """Cheap token estimate for budgeting prompt sections"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_ids(value):
+    """Split a comma-separated link column value (e.g. "TR-0001, TR-0002") into IDs"""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return []
+    return [part.strip() for part in str(value).split(",") if part.strip()]
+
+
+class ExporterContextBuilder:
+    """
+    Assembles the reference data section of the system prompt.
+
+    Rows are indexed by Exporter ID once per data load, so a query for one
+    exporter only renders that exporter's documents, shipments and traceability
+    records (plus records they link to). Without an exporter the builder falls
+    back to aggregate summaries instead of dumping every row.
+    """
+
+    def __init__(self, documents_df, shipments_df, traceability_df, token_budget=CONTEXT_TOKEN_BUDGET):
+        self.documents_df = documents_df
+        self.shipments_df = shipments_df
+        self.traceability_df = traceability_df
+        self.token_budget = token_budget
+
+        # Exporter ID -> row positions, per table
+        self.documents_by_exporter = self._index_by_exporter(documents_df)
+        self.shipments_by_exporter = self._index_by_exporter(shipments_df)
+        self.traceability_by_exporter = self._index_by_exporter(traceability_df)
+
+        # Record ID -> row position, for following link columns
+        self.shipment_positions = self._index_by_id(shipments_df, "Shipment ID")
+        self.record_positions = self._index_by_id(traceability_df, "Record ID")
+
+        self._exporter_ids = sorted(
+            set(self.documents_by_exporter)
+            | set(self.shipments_by_exporter)
+            | set(self.traceability_by_exporter)
+        )
+        self._cache = {}
+
+    @staticmethod
+    def _index_by_exporter(df):
+        if df.empty or EXPORTER_ID_COLUMN not in df.columns:
+            return {}
+        keys = df[EXPORTER_ID_COLUMN].astype(str).str.strip()
+        return {eid: positions for eid, positions in keys.groupby(keys).indices.items()}
+
+    @staticmethod
+    def _index_by_id(df, column):
+        if df.empty or column not in df.columns:
+            return {}
+        return {str(key).strip(): pos for pos, key in enumerate(df[column])}
+
+    def exporter_ids(self):
+        """All Exporter IDs present in the reference data"""
+        return self._exporter_ids
+
+    def build(self, exporter_id=None):
+        """Return the reference data section for an exporter, or summaries if none is selected"""
+        known = (exporter_id in self.documents_by_exporter
+                 or exporter_id in self.shipments_by_exporter
+                 or exporter_id in self.traceability_by_exporter)
+        if not known:
+            if exporter_id:
+                # Unknown IDs come straight from the request, so they are not cached
+                return self._build_summary(unknown_exporter_id=exporter_id)
+            exporter_id = None
+        if exporter_id not in self._cache:
+            if exporter_id is None:
+                self._cache[exporter_id] = self._build_summary()
+            else:
+                self._cache[exporter_id] = self._build_exporter(exporter_id)
+        return self._cache[exporter_id]
+
+    def _build_exporter(self, exporter_id):
+        docs = self._rows(self.documents_df, self.documents_by_exporter.get(exporter_id))
+        shipments = self._rows(self.shipments_df, self.shipments_by_exporter.get(exporter_id))
+        records = self._rows(self.traceability_df, self.traceability_by_exporter.get(exporter_id))
+
+        # Follow link columns to records filed under other exporters
+        linked_shipment_ids = set()
+        linked_record_ids = set()
+        if "Linked Shipment ID" in docs.columns:
+            for value in docs["Linked Shipment ID"]:
+                linked_shipment_ids.update(split_ids(value))
+        for df in (docs, shipments):
+            if "Linked Traceability Record IDs" in df.columns:
+                for value in df["Linked Traceability Record IDs"]:
+                    linked_record_ids.update(split_ids(value))
+
+        own_shipment_ids = set(shipments["Shipment ID"].astype(str)) if "Shipment ID" in shipments.columns else set()
+        own_record_ids = set(records["Record ID"].astype(str)) if "Record ID" in records.columns else set()
+        linked_shipments = self._rows(self.shipments_df, sorted(
+            self.shipment_positions[sid] for sid in linked_shipment_ids - own_shipment_ids
+            if sid in self.shipment_positions
+        ))
+        linked_records = self._rows(self.traceability_df, sorted(
+            self.record_positions[rid] for rid in linked_record_ids - own_record_ids
+            if rid in self.record_positions
+        ))
+
+        sections = [
+            (f"DOCUMENT RECORDS FOR {exporter_id}", docs),
+            (f"SHIPMENT RECORDS FOR {exporter_id}", shipments),
+            (f"TRACEABILITY RECORDS FOR {exporter_id}", records),
+            ("LINKED SHIPMENT RECORDS", linked_shipments),
+            ("LINKED TRACEABILITY RECORDS", linked_records),
+        ]
+        return self._render(sections, header=f"REFERENCE DATA (exporter {exporter_id}):")
+
+    def _build_summary(self, unknown_exporter_id=None):
+        summary = pd.DataFrame(index=pd.Index(self._exporter_ids, name=EXPORTER_ID_COLUMN))
+        names = pd.Series(dtype=object)
+        for df in (self.shipments_df, self.documents_df):
+            if not df.empty and "Exporter Name" in df.columns and EXPORTER_ID_COLUMN in df.columns:
+                table_names = df.groupby(df[EXPORTER_ID_COLUMN].astype(str).str.strip())["Exporter Name"].first()
+                names = table_names if names.empty else names.combine_first(table_names)
+        summary["Exporter Name"] = names.reindex(summary.index).fillna("")
+        for label, issue_label, df, column, value in (
+            ("Documents", "Pending Documents", self.documents_df, "Status", "Pending Review"),
+            ("Shipments", "Non-Compliant Shipments", self.shipments_df, "Compliance Status", "Non-Compliant"),
+            ("Traceability Records", "Failed Records", self.traceability_df, "Compliance Flag", "Fail"),
+        ):
+            summary[label] = self._count_by_exporter(df).reindex(summary.index, fill_value=0)
+            summary[issue_label] = self._count_by_exporter(df, column, value).reindex(summary.index, fill_value=0)
+
+        sections = [("EXPORTER SUMMARY", summary.reset_index())]
+        for title, df, column in (
+            ("DOCUMENT STATUS COUNTS", self.documents_df, "Status"),
+            ("SHIPMENT COMPLIANCE STATUS COUNTS", self.shipments_df, "Compliance Status"),
+            ("TRACEABILITY COMPLIANCE FLAG COUNTS", self.traceability_df, "Compliance Flag"),
+        ):
+            if not df.empty and column in df.columns:
+                counts = df[column].value_counts().rename_axis(column).reset_index(name="Count")
+                sections.append((title, counts))
+
+        header = "REFERENCE DATA SUMMARY (no exporter selected; ask for an Exporter ID to see individual records):"
+        if unknown_exporter_id:
+            header = (f"REFERENCE DATA SUMMARY (no reference records found for exporter {unknown_exporter_id}; "
+                      f"showing aggregates across all exporters):")
+        return self._render(sections, header=header)
+
+    @staticmethod
+    def _count_by_exporter(df, column=None, value=None):
+        """Row counts per Exporter ID, optionally only rows where column == value"""
+        if df.empty or EXPORTER_ID_COLUMN not in df.columns:
+            return pd.Series(dtype=int)
+        if column is not None:
+            if column not in df.columns:
+                return pd.Series(dtype=int)
+            df = df[df[column] == value]
+        return df[EXPORTER_ID_COLUMN].astype(str).str.strip().value_counts()
+
+    @staticmethod
+    def _rows(df, positions):
+        if positions is None or df.empty:
+            return df.iloc[0:0]
+        return df.iloc[positions]
+
+    def _render(self, sections, header):
+        """Render sections as CSV text, truncating rows once the token budget is used up"""
+        remaining = self.token_budget * CHARS_PER_TOKEN - len(header)
+        parts = [header]
+        for title, df in sections:
+            if df.empty:
+                continue
+            if remaining <= 0:
+                parts.append(f"{title}: {len(df)} rows omitted (context budget reached)")
+                continue
+            # Every CSV line is at least a few characters, so never render more rows than could fit
+            lines = df.head(max(1, remaining // 8)).to_csv(index=False).splitlines()
+            kept = [lines[0]]
+            used = len(title) + len(lines[0]) + 2
+            for line in lines[1:]:
+                if used + len(line) + 1 > remaining:
+                    break
+                kept.append(line)
+                used += len(line) + 1
+            omitted = len(df) - (len(kept) - 1)
+            text = f"{title}:\n" + "\n".join(kept)
+            if omitted:
+                text += f"\n... {omitted} more rows omitted to stay within the context budget"
+            parts.append(text)
+            remaining -= used
+        return "\n\n".join(parts)
@@ -0,0 +1,90 @@
+import base64
+
+EXPORTER_ID_COLUMN = "Exporter ID"
+
+
+def encode_cursor(exporter_id):
+    return base64.urlsafe_b64encode(exporter_id.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    # Strict decoding, so a mangled cursor is rejected instead of restarting from the top
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return base64.b64decode(padded.encode("ascii"), altchars=b"-_", validate=True).decode("utf-8")
+
+
+def _first_by_exporter(df, column):
+    """First non-null value of column per Exporter ID"""
+    if df.empty or EXPORTER_ID_COLUMN not in df.columns or column not in df.columns:
+        return {}
+    ids = df[EXPORTER_ID_COLUMN].astype(str).str.strip()
+    return {eid: str(value).strip() for eid, value in df[column].groupby(ids).first().dropna().items()}
+
+
+class ExporterDirectory:
+    """
+    Exporters found in the reference CSVs, built once per data version.
+
+    Names come from documents (falling back to shipments); country and product
+    type come from shipments. Chat-created profiles are merged in at request
+    time by merge_profiles, since they change independently of the CSVs.
+    """
+
+    def __init__(self, documents_df, shipments_df):
+        names = _first_by_exporter(shipments_df, "Exporter Name")
+        names.update(_first_by_exporter(documents_df, "Exporter Name"))
+        countries = _first_by_exporter(shipments_df, "Country of Origin")
+        industries = _first_by_exporter(shipments_df, "Product Type")
+
+        ids = set(names)
+        for df in (documents_df, shipments_df):
+            if not df.empty and EXPORTER_ID_COLUMN in df.columns:
+                ids.update(df[EXPORTER_ID_COLUMN].dropna().astype(str).str.strip().unique())
+
+        self.entries = {
+            eid: {
+                "exporter_id": eid,
+                "exporter_name": names.get(eid, "Unknown"),
+                "country": countries.get(eid, "Unknown"),
+                "industry": industries.get(eid, "Unknown"),
+                "has_profile": False
+            }
+            for eid in ids
+        }
+
+    def merge_profiles(self, exporter_profiles):
+        """Return all exporters sorted by ID, with profile data taking precedence"""
+        merged = dict(self.entries)
+        for exporter_id, data in exporter_profiles.items():
+            merged[exporter_id] = {
+                "exporter_id": exporter_id,
+                "exporter_name": data.get("Exporter Name", "Unknown"),
+                "country": data.get("Country of Origin", "Unknown"),
+                "industry": data.get("Industry Focus", "Unknown"),
+                "has_profile": True
+            }
+        return [merged[eid] for eid in sorted(merged)]
+
+
+def filter_exporters(exporters, country=None, industry=None, has_profile=None):
+    """Case-insensitive server-side filters for the exporter list"""
+    if country:
+        country = country.lower()
+        exporters = [e for e in exporters if e["country"].lower() == country]
+    if industry:
+        industry = industry.lower()
+        exporters = [e for e in exporters if industry in e["industry"].lower()]
+    if has_profile is not None:
+        exporters = [e for e in exporters if e["has_profile"] == has_profile]
+    return exporters
+
+
+def paginate(exporters, cursor=None, limit=None):
+    """Keyset pagination on exporter_id; returns (page, next_cursor)"""
+    if cursor:
+        after = decode_cursor(cursor)
+        exporters = [e for e in exporters if e["exporter_id"] > after]
+    if limit is None or len(exporters) <= limit:
+        return exporters, None
+    page = exporters[:limit]
+    return page, encode_cursor(page[-1]["exporter_id"])
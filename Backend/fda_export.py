@@ -0,0 +1,294 @@
+import io
+import os
+import re
+import zipfile
+from datetime import timedelta
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+# Traceability records joined and written per chunk; memory stays flat however many rows match
+FDA_EXPORT_CHUNK_ROWS = int(os.getenv("FDA_EXPORT_CHUNK_ROWS", 5000))
+
+# Excel's sheet limit, header row included
+XLSX_MAX_ROWS = 1048576
+XLSX_SHEET_NAME = "FDA Traceability"
+
+# Export column -> traceability source column, in spreadsheet order
+RECORD_COLUMNS = {
+    "Traceability Lot Code": "Lot Number",
+    "Product Description": "Food Product",
+    "Critical Tracking Event": "CTE Type",
+    "Event Date/Time": "Timestamp",
+    "Location": "Location (Name & Coords)",
+    "Key Data Elements": "KDE Details",
+    "Batch Number": "Batch Number",
+    "Supplier ID": "Supplier ID",
+    "Temperature (°C)": "Temp (°C)",
+    "Humidity (%)": "Humidity (%)",
+    "Compliance Flag": "Compliance Flag",
+    "Record ID": "Record ID",
+    "Exporter ID": "Exporter ID",
+}
+# Export column -> shipment column, taken from the first shipment linking the record
+SHIPMENT_COLUMNS = {
+    "Ship Date": "Export Date",
+    "Quantity": "Quantity",
+    "HS Code": "HS Code",
+    "Country of Origin": "Country of Origin",
+    "Destination Country": "Destination Country",
+    "Departure Port": "Departure Port",
+    "Arrival Port": "Arrival Port",
+    "Shipping Modality": "Shipping Modality",
+    "Carrier": "Carrier",
+    "Shipment Compliance Status": "Compliance Status",
+}
+EXPORT_COLUMNS = (list(RECORD_COLUMNS) + ["Exporter Name", "Shipment ID"] + list(SHIPMENT_COLUMNS)
+                  + ["Document IDs", "Document Types", "Document Status", "Comments"])
+
+# Link graph edges (source kind, relation, target kind) followed from a record to what ships it
+SHIPMENT_EDGE = ("shipment", "linked_record", "record")
+DOCUMENT_EDGE = ("document", "linked_record", "record")
+
+
+def _text(series):
+    return series.astype(str).str.strip()
+
+
+def _values(df, column, size):
+    """Stripped string values of a column (blank for missing values or a missing column)"""
+    if column not in df.columns:
+        return [""] * size
+    return df[column].fillna("").astype(str).str.strip().tolist()
+
+
+def _column_letter(index):
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+# Control characters are not allowed in XML text
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+_CELL_OPEN = '<c t="inlineStr"><is><t xml:space="preserve">'
+_CELL_CLOSE = '</t></is></c>'
+
+
+def _xlsx_row(values):
+    return f"<row>{_CELL_OPEN}{(_CELL_CLOSE + _CELL_OPEN).join(values)}{_CELL_CLOSE}</row>"
+
+
+def _xlsx_rows(frame):
+    """Sheet XML for a frame of strings, as inline string cells (escaped a column at a time)"""
+    columns = [
+        frame[column].astype(str).str.replace("&", "&amp;", regex=False)
+        .str.replace("<", "&lt;", regex=False).str.replace(">", "&gt;", regex=False).tolist()
+        for column in frame.columns
+    ]
+    return _XML_INVALID.sub("", "".join(_xlsx_row(row) for row in zip(*columns)))
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable file that collects written bytes until drained, so a zip can be streamed"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class FDASpreadsheetExport:
+    """
+    The electronic sortable spreadsheet FDA can request within 24 hours: one
+    row per critical tracking event with its key data elements, joined to the
+    shipment and documents that link the traceability record.
+
+    Matching records are selected and ordered up front (by traceability lot
+    code, then event time) as row positions only; rows are then joined and
+    encoded a chunk at a time, so output starts immediately and memory does
+    not grow with the size of the export. Bound to one reference snapshot, so
+    a reload mid-download cannot mix data versions.
+    """
+
+    def __init__(self, snapshot, exporter_id=None, lot_number=None, product=None, start_date=None, end_date=None,
+                 chunk_rows=FDA_EXPORT_CHUNK_ROWS):
+        self.snapshot = snapshot
+        self.chunk_rows = chunk_rows
+        self.filters = {"exporter_id": exporter_id, "lot_number": lot_number, "product": product,
+                        "start_date": start_date, "end_date": end_date}
+        self.positions = self._select(exporter_id, lot_number, product, start_date, end_date)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _select(self, exporter_id, lot_number, product, start_date, end_date):
+        df = self.snapshot.traceability_df
+        if df.empty:
+            return np.array([], dtype=np.int64)
+        if exporter_id:
+            # Exporter rows are already indexed by the context builder
+            positions = self.snapshot.get('context').traceability_by_exporter.get(exporter_id.strip())
+            if positions is None:
+                return np.array([], dtype=np.int64)
+        else:
+            positions = np.arange(len(df))
+
+        rows = df.iloc[positions]
+        mask = np.ones(len(rows), dtype=bool)
+        if lot_number:
+            mask &= (_text(rows["Lot Number"]) == lot_number.strip()).to_numpy()
+        if product:
+            mask &= _text(rows["Food Product"]).str.contains(product.strip(), case=False, regex=False).to_numpy()
+        if start_date or end_date:
+            # Timestamps are ISO formatted ("2025-05-01 08:00"), so they compare as strings
+            timestamps = _text(rows["Timestamp"])
+            if start_date:
+                mask &= (timestamps >= start_date.isoformat()).to_numpy()
+            if end_date:
+                mask &= (timestamps < (end_date + timedelta(days=1)).isoformat()).to_numpy()
+
+        positions = np.asarray(positions)[mask]
+        order = pd.DataFrame({
+            "lot": _text(df["Lot Number"].iloc[positions]).to_numpy(),
+            "timestamp": _text(df["Timestamp"].iloc[positions]).to_numpy(),
+        }).sort_values(["lot", "timestamp"], kind="stable").index.to_numpy()
+        return positions[order]
+
+    def file_name(self, extension):
+        scope = self.filters["exporter_id"] or self.filters["lot_number"] or self.filters["product"] or "all"
+        scope = re.sub(r"[^A-Za-z0-9_-]+", "_", scope).strip("_") or "all"
+        return f"fda_traceability_{scope}_v{self.snapshot.version}.{extension}"
+
+    def frames(self):
+        """Export rows as DataFrames of at most chunk_rows rows"""
+        snapshot = self.snapshot
+        links = snapshot.get('links')
+        record_codes = links.codes["record"]
+        shipment_ids = links.ids["shipment"]
+        directory = snapshot.get('directory').entries
+        shipments_df = snapshot.shipments_df
+        documents_df = snapshot.documents_df
+
+        for start in range(0, len(self.positions), self.chunk_rows):
+            records = snapshot.traceability_df.iloc[self.positions[start:start + self.chunk_rows]]
+            size = len(records)
+            columns = {column: _values(records, source, size) for column, source in RECORD_COLUMNS.items()}
+            columns["Exporter Name"] = [directory.get(eid, {}).get("exporter_name", "")
+                                        for eid in columns["Exporter ID"]]
+
+            shipments, documents = [], []
+            for record_id in columns["Record ID"]:
+                code = record_codes.get(record_id)
+                shipments.append(links.linking_rows(SHIPMENT_EDGE, code).tolist() if code is not None else [])
+                documents.append(links.linking_rows(DOCUMENT_EDGE, code).tolist() if code is not None else [])
+            columns["Shipment ID"] = ["; ".join(shipment_ids[position] for position in positions)
+                                      for positions in shipments]
+
+            # Shipment KDEs come from the first linked shipment
+            first = np.array([positions[0] if positions else -1 for positions in shipments], dtype=np.int64)
+            linked = first >= 0
+            shipped = shipments_df.iloc[first[linked]]
+            for column, source in SHIPMENT_COLUMNS.items():
+                values = np.full(size, "", dtype=object)
+                values[linked] = _values(shipped, source, len(shipped))
+                columns[column] = values
+
+            # Linked documents are gathered for the whole chunk, then joined back per record
+            flat = [position for doc_positions in documents for position in doc_positions]
+            linked_documents = documents_df.iloc[flat]
+            for column, source in (("Document IDs", "Document ID"), ("Document Types", "Document Type"),
+                                   ("Document Status", "Status")):
+                values = iter(_values(linked_documents, source, len(flat)))
+                columns[column] = ["; ".join(next(values) for _ in doc_positions) for doc_positions in documents]
+            columns["Comments"] = _values(records, "Comments", size)
+            yield pd.DataFrame(columns, columns=EXPORT_COLUMNS)
+
+    def csv_chunks(self):
+        """UTF-8 CSV (with a BOM so Excel detects the encoding), one encoded chunk at a time"""
+        yield ("\ufeff" + pd.DataFrame(columns=EXPORT_COLUMNS).to_csv(index=False)).encode("utf-8")
+        for frame in self.frames():
+            yield frame.to_csv(index=False, header=False).encode("utf-8")
+
+    def xlsx_chunks(self):
+        """
+        XLSX workbook written as a streamed zip: rows go out as inline strings
+        while they are generated, with an autofilter over the header so the
+        sheet is sortable. Raises ValueError if the export exceeds Excel's row limit.
+        """
+        if len(self) + 1 > XLSX_MAX_ROWS:
+            raise ValueError(f"{len(self)} rows exceed the XLSX limit of {XLSX_MAX_ROWS - 1}; export as CSV instead")
+        last_column, last_row = _column_letter(len(EXPORT_COLUMNS) - 1), len(self) + 1
+        last_cell = f"{last_column}{last_row}"
+        sink = _ChunkSink()
+        with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, content in _xlsx_static_parts(last_column, last_row).items():
+                archive.writestr(name, content)
+            yield sink.drain()
+            with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+                sheet.write(('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                             '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                             f'<dimension ref="A1:{last_cell}"/><sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" '
+                             'activePane="bottomLeft" state="frozen"/></sheetView></sheetViews>'
+                             f'<sheetData>{_xlsx_row(escape(column) for column in EXPORT_COLUMNS)}').encode("utf-8"))
+                for frame in self.frames():
+                    sheet.write(_xlsx_rows(frame).encode("utf-8"))
+                    yield sink.drain()
+                sheet.write(f'</sheetData><autoFilter ref="A1:{last_cell}"/></worksheet>'.encode("utf-8"))
+        yield sink.drain()
+
+
+def _xlsx_static_parts(last_column, last_row):
+    """Package parts of a one-sheet workbook, everything but the sheet data"""
+    main = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    relationships = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    package_relationships = "http://schemas.openxmlformats.org/package/2006/relationships"
+    filter_range = f"'{XLSX_SHEET_NAME}'!$A$1:${last_column}${last_row}"
+    return {
+        "[Content_Types].xml": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '</Types>'
+        ),
+        "_rels/.rels": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<Relationships xmlns="{package_relationships}">'
+            f'<Relationship Id="rId1" Type="{relationships}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'
+        ),
+        "xl/workbook.xml": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<workbook xmlns="{main}" xmlns:r="{relationships}">'
+            f'<sheets><sheet name="{XLSX_SHEET_NAME}" sheetId="1" r:id="rId1"/></sheets>'
+            '<definedNames><definedName name="_xlnm._FilterDatabase" localSheetId="0" hidden="1">'
+            f'{escape(filter_range)}</definedName></definedNames>'
+            '</workbook>'
+        ),
+        "xl/_rels/workbook.xml.rels": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<Relationships xmlns="{package_relationships}">'
+            f'<Relationship Id="rId1" Type="{relationships}/worksheet" Target="worksheets/sheet1.xml"/>'
+            '</Relationships>'
+        ),
+    }
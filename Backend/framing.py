@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import time
+import asyncio
+
+# Text deltas are merged into one content frame until the window elapses or the buffer fills
+STREAM_COALESCE_MS = float(os.getenv("STREAM_COALESCE_MS", 20))
+STREAM_COALESCE_BYTES = int(os.getenv("STREAM_COALESCE_BYTES", 512))
+# Echo streamed answers to stdout (one write per coalesced frame, unflushed)
+STREAM_ECHO_STDOUT = os.getenv("STREAM_ECHO_STDOUT", "false").lower() == "true"
+
+
+def encode_ndjson(event):
+    """One NDJSON line (bytes) for a stream event"""
+    return (json.dumps(event) + "\n").encode("utf-8")
+
+
+def sse_message(event):
+    """sse-starlette message for a stream event; the event name is the frame type"""
+    return {"event": event.get("type", "message"), "data": json.dumps(event)}
+
+
+async def coalesce_events(events, window_ms=STREAM_COALESCE_MS, max_bytes=STREAM_COALESCE_BYTES,
+                          echo=STREAM_ECHO_STDOUT):
+    """
+    Merge consecutive content events into larger ones.
+
+    Buffered text is flushed when it reaches max_bytes, when window_ms has passed
+    since its first delta (even if the model is between tokens), or before any
+    other event so metadata keeps its position in the stream.
+    """
+    window = window_ms / 1000
+    iterator = events.__aiter__()
+    buffer = []
+    buffered_bytes = 0
+    deadline = None
+    pending = None
+
+    def flush():
+        nonlocal buffer, buffered_bytes, deadline
+        text = "".join(buffer)
+        buffer, buffered_bytes, deadline = [], 0, None
+        if echo:
+            sys.stdout.write(text)
+        return {"type": "content", "text": text}
+
+    try:
+        while True:
+            if pending is None and deadline is None:
+                # Nothing buffered: await the next event directly, without a Task per delta
+                try:
+                    event = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+            else:
+                # A partial frame is waiting on the flush timer: race the next event against it
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+                if deadline is not None:
+                    done, _ = await asyncio.wait({pending}, timeout=max(deadline - time.monotonic(), 0))
+                    if not done:
+                        yield flush()
+                        continue
+                try:
+                    event = await pending
+                except StopAsyncIteration:
+                    pending = None
+                    break
+                pending = None
+
+            if event.keys() == {"type", "text"} and event["type"] == "content":
+                text = event.get("text", "")
+                buffer.append(text)
+                buffered_bytes += len(text.encode("utf-8"))
+                if deadline is None:
+                    deadline = time.monotonic() + window
+                if buffered_bytes >= max_bytes:
+                    yield flush()
+                continue
+
+            if buffer:
+                yield flush()
+            yield event
+
+        if buffer:
+            yield flush()
+    finally:
+        # Client went away mid-stream: stop the producer too
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, Exception):
+                pass
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
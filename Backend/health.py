@@ -0,0 +1,137 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Seconds between background checks of each dependency
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", 30))
+# A check running longer than this counts as failed
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", 10))
+# Checks kept per dependency for the latency history
+HEALTH_HISTORY_SIZE = int(os.getenv("HEALTH_HISTORY_SIZE", 50))
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+class DependencyProbe:
+    """
+    Latest result and latency history of one dependency check.
+
+    check returns the status payload served to clients. It is either a
+    coroutine function or a blocking callable, which runs in a worker thread
+    so the event loop never waits on it.
+    An exception (or a timeout) marks the dependency unhealthy, as does a
+    payload rejected by healthy_if.
+    """
+
+    def __init__(self, name, check, healthy_if=None, timeout=HEALTH_PROBE_TIMEOUT,
+                 history_size=HEALTH_HISTORY_SIZE):
+        self.name = name
+        self.check = check
+        self.healthy_if = healthy_if
+        self.timeout = timeout
+        self.result = None
+        self.healthy = None
+        self.checked_at = None
+        self.last_success = None
+        self.last_error = None
+        self.history = deque(maxlen=history_size)
+        self._running = None
+
+    async def run(self):
+        """Run the check once; concurrent callers share the check in flight"""
+        if self._running is None:
+            self._running = asyncio.ensure_future(self._run())
+        running = self._running
+        try:
+            return await asyncio.shield(running)
+        finally:
+            if running.done() and self._running is running:
+                self._running = None
+
+    async def _run(self):
+        started = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(self.check):
+                pending = self.check()
+            else:
+                pending = asyncio.to_thread(self.check)
+            result = await asyncio.wait_for(pending, self.timeout)
+            healthy = self.healthy_if(result) if self.healthy_if else True
+            if healthy:
+                self.last_success = _now_iso()
+                if self.healthy is False:
+                    logger.info(f"{self.name} is healthy again")
+            else:
+                self._record_error(f"unhealthy response: {result}")
+            self.healthy = healthy
+            self.result = result
+        except Exception as e:
+            self._record_error(str(e) or f"check timed out after {self.timeout}s")
+            self.healthy = False
+            self.result = None
+        latency = time.perf_counter() - started
+        self.checked_at = _now_iso()
+        self.history.append({"at": self.checked_at, "latency_ms": round(latency * 1000, 1), "ok": self.healthy})
+        return self
+
+    def _record_error(self, message):
+        # Log state changes only, not every failed round
+        if self.healthy is not False:
+            logger.warning(f"Health check for {self.name} failed: {message}")
+        self.last_error = {"at": _now_iso(), "message": message}
+
+    def snapshot(self):
+        """Probe metadata served alongside the cached status"""
+        latencies = sorted(entry["latency_ms"] for entry in self.history)
+        return {
+            "healthy": self.healthy,
+            "checked_at": self.checked_at,
+            "last_success": self.last_success,
+            "last_error": self.last_error,
+            "latency_ms": self.history[-1]["latency_ms"] if self.history else None,
+            "latency_p50_ms": latencies[len(latencies) // 2] if latencies else None,
+            "latency_max_ms": latencies[-1] if latencies else None,
+            "history": list(self.history)
+        }
+
+
+class HealthProber:
+    """Checks every registered dependency on an interval in a background task"""
+
+    def __init__(self, interval=HEALTH_PROBE_INTERVAL):
+        self.interval = interval
+        self.probes = {}
+        self._task = None
+
+    def register(self, name, check, **kwargs):
+        self.probes[name] = DependencyProbe(name, check, **kwargs)
+        return self.probes[name]
+
+    def start(self):
+        """Start probing (call from the running event loop); the first round runs immediately"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.gather(*(probe.run() for probe in self.probes.values()))
+            await asyncio.sleep(self.interval)
+
+    async def get(self, name, probe_now=False):
+        """The probe for name, checked first if asked to or if it has never run"""
+        probe = self.probes[name]
+        if probe_now or probe.checked_at is None:
+            await probe.run()
+        return probe
@@ -0,0 +1,276 @@
+import os
+import logging
+from collections import Counter, deque
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on nodes returned by one walk, so a heavily linked record cannot flood a tool result
+LINK_WALK_MAX_NODES = int(os.getenv("LINK_WALK_MAX_NODES", 200))
+# Default and maximum number of hops walked from the starting record
+LINK_WALK_DEFAULT_DEPTH = 3
+LINK_WALK_MAX_DEPTH = 6
+
+# Node kind -> (table, ID column)
+NODE_TABLES = {
+    "document": ("documents", "Document ID"),
+    "shipment": ("shipments", "Shipment ID"),
+    "record": ("traceability", "Record ID"),
+}
+
+# Edges parsed from link columns: (relation, table, ID column, link column, source kind, target kind).
+# Targets of document, shipment and record kind must exist in their table; lots, batches and
+# suppliers only exist as values of the traceability columns.
+LINK_SPECS = (
+    ("linked_shipment", "documents", "Document ID", "Linked Shipment ID", "document", "shipment"),
+    ("linked_record", "documents", "Document ID", "Linked Traceability Record IDs", "document", "record"),
+    ("linked_record", "shipments", "Shipment ID", "Linked Traceability Record IDs", "shipment", "record"),
+    ("lot", "traceability", "Record ID", "Lot Number", "record", "lot"),
+    ("batch", "traceability", "Record ID", "Batch Number", "record", "batch"),
+    ("supplier", "traceability", "Record ID", "Supplier ID", "record", "supplier"),
+)
+
+# Kinds shared by many records; walks pass through them only when they are the starting node
+HUB_KINDS = ("lot", "batch", "supplier")
+
+# Columns shown for each node kind in walk results
+NODE_DETAIL_COLUMNS = {
+    "document": ("Exporter ID", "Document Type", "Date Issued", "Status"),
+    "shipment": ("Exporter ID", "Product Description", "Export Date", "Arrival Port", "Compliance Status"),
+    "record": ("Exporter ID", "Food Product", "CTE Type", "Timestamp", "Compliance Flag"),
+}
+
+
+def _link_pairs(df, id_column, link_column):
+    """(source row positions, target IDs) of a comma-separated link column, one pair per linked ID"""
+    sources, targets = [], []
+    if df.empty or id_column not in df.columns or link_column not in df.columns:
+        return sources, targets
+    for position, value in enumerate(df[link_column].tolist()):
+        if value is None or (isinstance(value, float) and pd.isna(value)):
+            continue
+        for target in str(value).split(","):
+            target = target.strip()
+            if target and target != "nan":
+                sources.append(position)
+                targets.append(target)
+    return sources, targets
+
+
+def _csr(keys, values, size):
+    """(offsets, values) with the values of key k at values[offsets[k]:offsets[k + 1]]"""
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=size), out=offsets[1:])
+    return offsets, values[np.argsort(keys, kind="stable")]
+
+
+class _Relation:
+    """Edges of one link column as CSR arrays over node codes, indexed in both directions"""
+
+    def __init__(self, source_codes, target_codes, source_count, target_count):
+        self.source_codes = source_codes
+        self.target_codes = target_codes
+        self.forward = _csr(source_codes, target_codes, source_count)
+        self.reverse = _csr(target_codes, source_codes, target_count)
+
+    @staticmethod
+    def _slice(index, code):
+        offsets, values = index
+        if code >= len(offsets) - 1:
+            return values[:0]
+        return values[offsets[code]:offsets[code + 1]]
+
+    def targets(self, source_code):
+        return self._slice(self.forward, source_code)
+
+    def sources(self, target_code):
+        return self._slice(self.reverse, target_code)
+
+
+class LinkGraph:
+    """
+    Links between documents, shipments, traceability records and the lots,
+    batches and suppliers they name, built once per reference data version.
+
+    Every ID gets an integer code per node kind (a table row's code is its
+    row position) and the comma-separated link columns become CSR adjacency
+    arrays over those codes in both directions, so neighbours of any ID are a
+    dictionary lookup plus an array slice and the graph stays a few integers
+    per link. Walking "everything connected to S-1002" is a breadth-first
+    search over them. Links to documents, shipments or records that do not
+    exist are kept as dangling references and reported instead of being
+    silently dropped.
+    """
+
+    def __init__(self, documents_df, shipments_df, traceability_df):
+        tables = {"documents": documents_df, "shipments": shipments_df, "traceability": traceability_df}
+        self.tables = tables
+
+        # Kind -> {ID: code} and code -> ID; table rows come first, so codes below
+        # table_sizes[kind] are row positions and codes above are missing rows
+        self.codes = {}
+        self.ids = {}
+        self.table_sizes = {}
+        for kind, (table, column) in NODE_TABLES.items():
+            df = tables[table]
+            ids = [str(key).strip() for key in df[column].tolist()] if not df.empty and column in df.columns else []
+            self.ids[kind] = ids
+            self.codes[kind] = {node_id: code for code, node_id in enumerate(ids)}
+            self.table_sizes[kind] = len(ids)
+        for kind in HUB_KINDS:
+            self.ids[kind] = []
+            self.codes[kind] = {}
+
+        # Target codes are assigned first so reverse indexes can be sized to every known target
+        parsed = []
+        for relation, table, id_column, link_column, source_kind, target_kind in LINK_SPECS:
+            sources, targets = _link_pairs(tables[table], id_column, link_column)
+            if not sources:
+                continue
+            codes, ids = self.codes[target_kind], self.ids[target_kind]
+            target_codes = np.empty(len(targets), dtype=np.int32)
+            for i, target in enumerate(targets):
+                code = codes.get(target)
+                if code is None:
+                    code = codes[target] = len(ids)
+                    ids.append(target)
+                target_codes[i] = code
+            parsed.append((relation, table, link_column, source_kind, target_kind,
+                           np.array(sources, dtype=np.int32), target_codes))
+
+        # (source kind, relation, target kind) -> [(_Relation, "table.column")]
+        self.edges = {}
+        for relation, table, link_column, source_kind, target_kind, source_codes, target_codes in parsed:
+            self.edges.setdefault((source_kind, relation, target_kind), []).append((
+                _Relation(source_codes, target_codes, self.table_sizes[source_kind], len(self.ids[target_kind])),
+                f"{table}.{link_column}",
+            ))
+
+        dangling = self.dangling_report(limit=1)
+        if dangling["total"]:
+            example = dangling["links"][0]
+            logger.warning(f"Reference data has {dangling['total']} dangling link(s), "
+                           f"e.g. {example['source_id']} -> {example['missing_id']}")
+
+    def _relations(self):
+        for (source_kind, name, target_kind), relations in self.edges.items():
+            for relation, column in relations:
+                yield source_kind, name, target_kind, relation, column
+
+    def resolve(self, node_id):
+        """Kinds an ID is known as (a table row, a lot/batch/supplier value or a dangling target)"""
+        node_id = str(node_id).strip()
+        return [kind for kind, codes in self.codes.items() if node_id in codes]
+
+    def neighbors(self, kind, node_id):
+        """[(relation, direction, neighbour kind, neighbour ID)] of one node"""
+        code = self.codes[kind].get(node_id)
+        if code is None:
+            return []
+        result = []
+        for source_kind, name, target_kind, relation, _ in self._relations():
+            if source_kind == kind and code < self.table_sizes[kind]:
+                ids = self.ids[target_kind]
+                result.extend((name, "out", target_kind, ids[other]) for other in relation.targets(code).tolist())
+            if target_kind == kind:
+                ids = self.ids[source_kind]
+                result.extend((name, "in", source_kind, ids[other]) for other in relation.sources(code).tolist())
+        return result
+
+    def linking_rows(self, edge, target_code):
+        """Row positions of the sources linking to a node through an edge, e.g. shipments listing a record"""
+        rows = [relation.sources(target_code) for relation, _ in self.edges.get(edge, ())]
+        if len(rows) == 1:
+            return rows[0]
+        return np.concatenate(rows) if rows else np.array([], dtype=np.int32)
+
+    def details(self, kind, node_id):
+        """Display columns of a node's row, or None for lots, batches, suppliers and missing rows"""
+        if kind not in NODE_TABLES:
+            return None
+        position = self.codes[kind].get(node_id)
+        if position is None or position >= self.table_sizes[kind]:
+            return None
+        df = self.tables[NODE_TABLES[kind][0]]
+        columns = [col for col in NODE_DETAIL_COLUMNS[kind] if col in df.columns]
+        return {col: str(value) for col, value in df.iloc[position][columns].items()}
+
+    def walk(self, node_id, max_depth=LINK_WALK_DEFAULT_DEPTH, max_nodes=LINK_WALK_MAX_NODES):
+        """
+        Everything connected to an ID within max_depth hops: nodes with their
+        depth and details, the edges between them and any dangling references
+        met on the way. Returns None if the ID is not in the graph.
+        """
+        node_id = str(node_id).strip()
+        roots = [(kind, node_id) for kind in self.resolve(node_id)]
+        if not roots:
+            return None
+        max_depth = max(0, min(int(max_depth), LINK_WALK_MAX_DEPTH))
+
+        depths = {root: 0 for root in roots}
+        queue = deque(roots)
+        edges = []
+        truncated = False
+        while queue:
+            node = queue.popleft()
+            kind, current = node
+            depth = depths[node]
+            # Lots, batches and suppliers connect otherwise unrelated records; only expand them at the root
+            if depth >= max_depth or (kind in HUB_KINDS and depth > 0):
+                continue
+            for relation, direction, other_kind, other_id in self.neighbors(kind, current):
+                other = (other_kind, other_id)
+                if other not in depths:
+                    if len(depths) >= max_nodes:
+                        truncated = True
+                        continue
+                    depths[other] = depth + 1
+                    queue.append(other)
+                source, target = (node, other) if direction == "out" else (other, node)
+                edges.append({"from": source[1], "to": target[1], "relation": relation})
+
+        nodes = []
+        dangling = []
+        for (kind, current), depth in depths.items():
+            entry = {"id": current, "kind": kind, "depth": depth}
+            if kind in NODE_TABLES:
+                entry["details"] = self.details(kind, current)
+                if entry["details"] is None:
+                    entry["missing"] = True
+                    dangling.append(current)
+            nodes.append(entry)
+
+        unique_edges = list({(e["from"], e["to"], e["relation"]): e for e in edges}.values())
+        return {
+            "id": node_id,
+            "max_depth": max_depth,
+            "nodes": nodes,
+            "edges": unique_edges,
+            "dangling": dangling,
+            "truncated": truncated,
+        }
+
+    def dangling_report(self, limit=100):
+        """Counts and examples of links to documents, shipments or records that do not exist"""
+        total = 0
+        by_column = Counter()
+        links = []
+        for source_kind, _, target_kind, relation, column in self._relations():
+            if target_kind not in NODE_TABLES:
+                continue
+            missing = np.flatnonzero(relation.target_codes >= self.table_sizes[target_kind])
+            if not len(missing):
+                continue
+            total += len(missing)
+            by_column[column] += len(missing)
+            for i in missing[:max(limit - len(links), 0)].tolist():
+                links.append({
+                    "source_kind": source_kind,
+                    "source_id": self.ids[source_kind][relation.source_codes[i]],
+                    "column": column,
+                    "target_kind": target_kind,
+                    "missing_id": self.ids[target_kind][relation.target_codes[i]],
+                })
+        return {"total": total, "by_column": dict(by_column), "links": links}
@@ -0,0 +1,315 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Per-exporter series kept before further exporters are counted as "other"
+METRICS_MAX_EXPORTERS = int(os.getenv("METRICS_MAX_EXPORTERS", 200))
+# Seconds between writes of a worker's metrics for the other workers to serve (multi-worker mode)
+METRICS_SHARE_SECONDS = float(os.getenv("METRICS_SHARE_SECONDS", 5))
+
+# Histogram buckets for request phases (seconds) and per-request token counts
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 200000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.label_names)
+
+    def series(self):
+        """[(label values, value)] of every series, as JSON-friendly lists"""
+        with self._lock:
+            return [(list(key), json.loads(json.dumps(value))) for key, value in self._series.items()]
+
+    def render(self, workers):
+        """Exposition lines for [(worker, series)], each series labelled with its worker"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        names = self.label_names + ("worker",)
+        for worker, series in workers:
+            for key, value in sorted(series, key=lambda item: tuple(map(str, item[0]))):
+                lines.extend(self._render_series(names, tuple(key) + (worker,), value))
+        return lines
+
+    def _render_series(self, names, key, value):
+        return [f"{self.name}{_format_labels(names, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Gauge read from a callback at scrape time, so the hot path never updates it"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, read):
+        super().__init__(name, documentation)
+        self.read = read
+
+    def series(self):
+        return [([], self.read())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def _render_series(self, names, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(names, key, le)} {cumulative}")
+        labels = _format_labels(names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Metrics rendered together in the Prometheus text exposition format. Every
+    series carries a worker label (the process id by default), so series of
+    several worker processes never collide.
+    """
+
+    def __init__(self, worker=None):
+        self.metrics = []
+        self.worker = worker
+
+    def worker_id(self):
+        # Read per call: uvicorn workers are started after this module may have been imported
+        return self.worker or str(os.getpid())
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name, documentation, read):
+        return self.register(Gauge(name, documentation, read))
+
+    def snapshot(self):
+        """{metric name: [(label values, value)]} of this worker, for other workers to render"""
+        return {metric.name: metric.series() for metric in self.metrics}
+
+    def render(self, others=None):
+        """This worker's metrics plus other workers' snapshots ({worker: snapshot}) in one exposition"""
+        others = sorted((others or {}).items())
+        lines = []
+        for metric in self.metrics:
+            workers = [(self.worker_id(), metric.series())]
+            workers += [(worker, snapshot.get(metric.name, [])) for worker, snapshot in others]
+            lines.extend(metric.render(workers))
+        return "\n".join(lines) + "\n"
+
+
+class SharedMetrics:
+    """
+    Worker metrics exchanged through a directory shared by the worker
+    processes, so a scrape answered by any worker covers all of them. Each
+    worker rewrites its own snapshot file every interval seconds; files that
+    stop being rewritten (the worker exited) are dropped.
+    """
+
+    def __init__(self, directory, registry, interval=METRICS_SHARE_SECONDS):
+        self.directory = directory
+        self.registry = registry
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+        self._task = None
+
+    def _path(self, worker):
+        return os.path.join(self.directory, f"{worker}.json")
+
+    def publish(self):
+        path = self._path(self.registry.worker_id())
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(temp_path, path)
+
+    def collect(self):
+        """{worker: snapshot} of the other live workers"""
+        others = {}
+        now = time.time()
+        for file_name in os.listdir(self.directory):
+            worker = file_name[:-len(".json")]
+            if not file_name.endswith(".json") or worker == self.registry.worker_id():
+                continue
+            path = os.path.join(self.directory, file_name)
+            try:
+                if now - os.path.getmtime(path) > 3 * self.interval:
+                    os.unlink(path)
+                    continue
+                with open(path) as f:
+                    others[worker] = json.load(f)
+            except (OSError, ValueError):
+                # Removed or replaced mid-read; the next scrape sees it again
+                continue
+        return others
+
+    def start(self):
+        """Start publishing this worker's snapshot (call from the running event loop)"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._publisher())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        try:
+            os.unlink(self._path(self.registry.worker_id()))
+        except OSError:
+            pass
+
+    async def _publisher(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.publish)
+            except Exception as e:
+                logger.error(f"Sharing worker metrics failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """Observe the duration of a block, labelled with its outcome (ok, error or cancelled)"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = "cancelled"
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - started, outcome=outcome, **labels)
+
+
+class ExporterLabels:
+    """Caps the number of distinct exporter label values to keep series cardinality bounded"""
+
+    def __init__(self, limit=METRICS_MAX_EXPORTERS):
+        self.limit = limit
+        self.seen = set()
+
+    def __call__(self, exporter_id):
+        if not exporter_id:
+            return "none"
+        if exporter_id in self.seen:
+            return exporter_id
+        if len(self.seen) < self.limit:
+            self.seen.add(exporter_id)
+            return exporter_id
+        return "other"
+
+
+REGISTRY = MetricsRegistry()
+exporter_label = ExporterLabels()
+
+CHAT_REQUESTS = REGISTRY.counter(
+    "fdabot_chat_requests_total", "Chat queries by answering route and outcome", ("route", "outcome"))
+CHAT_QUEUE_SECONDS = REGISTRY.histogram(
+    "fdabot_chat_queue_seconds", "Time from receiving /chat to starting the answer stream")
+CHAT_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "fdabot_chat_first_token_seconds", "Time from starting a query to its first content", ("route",))
+CHAT_DURATION_SECONDS = REGISTRY.histogram(
+    "fdabot_chat_duration_seconds", "Total duration of chat queries", ("route", "outcome"))
+MODEL_STREAM_SECONDS = REGISTRY.histogram(
+    "fdabot_model_stream_seconds", "Duration of each model stream (one per agent step)",
+    ("provider", "model", "outcome"))
+TOOL_SECONDS = REGISTRY.histogram(
+    "fdabot_tool_seconds", "Duration of each tool execution", ("tool", "outcome"))
+TOKENS = REGISTRY.counter(
+    "fdabot_tokens_total", "Model tokens by route and type (input, output, cache_read, cache_creation)",
+    ("route", "type"))
+EXPORTER_TOKENS = REGISTRY.counter(
+    "fdabot_exporter_tokens_total", "Model tokens by exporter and type", ("exporter", "type"))
+REQUEST_TOKENS = REGISTRY.histogram(
+    "fdabot_request_tokens", "Model tokens per chat query, by type", ("type",), buckets=TOKEN_BUCKETS)
+REFERENCE_RELOADS = REGISTRY.counter(
+    "fdabot_reference_reloads_total", "Reference table (re)loads", ("table",))
+REFERENCE_RELOAD_SECONDS = REGISTRY.histogram(
+    "fdabot_reference_reload_seconds", "Duration of reference data loads, including derived structures",
+    ("outcome",))
+
+# Usage field -> token type label
+TOKEN_TYPES = {
+    "input_tokens": "input",
+    "output_tokens": "output",
+    "cache_read_input_tokens": "cache_read",
+    "cache_creation_input_tokens": "cache_creation",
+}
+
+
+def record_usage(route, exporter_id, usage):
+    """Count one query's token usage per route, per exporter and in the per-request histogram"""
+    exporter = exporter_label(exporter_id)
+    for field, token_type in TOKEN_TYPES.items():
+        count = usage.get(field, 0)
+        if not count:
+            continue
+        TOKENS.inc(count, route=route, type=token_type)
+        EXPORTER_TOKENS.inc(count, exporter=exporter, type=token_type)
+        REQUEST_TOKENS.observe(count, type=token_type)
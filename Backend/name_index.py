@@ -0,0 +1,151 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+EXPORTER_ID_COLUMN = "Exporter ID"
+
+# Field weights: a name hit counts more than a country or product hit
+NAME_WEIGHT = 1.0
+ATTRIBUTE_WEIGHT = 0.6
+
+# Minimum trigram similarity for two tokens to count as a match
+MIN_TOKEN_SIMILARITY = 0.3
+
+STOPWORDS = {
+    "the", "a", "an", "of", "and", "from", "for", "in", "my", "our", "that", "which",
+    "company", "companies", "co", "inc", "ltd", "llc", "sa", "srl", "gmbh", "exporter", "exporters"
+}
+
+EXPORTER_ID_PATTERN = re.compile(r"^ex\d+$")
+
+
+def normalize_tokens(text):
+    """Lowercase, strip accents and split into alphanumeric tokens"""
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii").lower()
+    return [token for token in re.split(r"[^a-z0-9]+", text) if token]
+
+
+def trigrams(token):
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ExporterNameIndex:
+    """
+    Fuzzy lookup of exporters by name, country or product.
+
+    Each exporter is indexed under the normalized tokens of its name (and, at a
+    lower weight, its country and products). Query tokens are matched to index
+    tokens through a trigram inverted index, so "the Italian carrot company"
+    resolves to an Exporter ID without scanning any rows.
+    """
+
+    def __init__(self):
+        # token -> {exporter_id: weight}
+        self.postings = defaultdict(dict)
+        # trigram -> tokens containing it
+        self.trigram_tokens = defaultdict(set)
+        self.token_trigrams = {}
+        self.names = {}
+
+    @classmethod
+    def from_reference_data(cls, documents_df, shipments_df, traceability_df):
+        index = cls()
+        fields = (
+            (documents_df, "Exporter Name", NAME_WEIGHT),
+            (shipments_df, "Exporter Name", NAME_WEIGHT),
+            (shipments_df, "Country of Origin", ATTRIBUTE_WEIGHT),
+            (shipments_df, "Product Type", ATTRIBUTE_WEIGHT),
+            (shipments_df, "Product Description", ATTRIBUTE_WEIGHT),
+            (traceability_df, "Food Product", ATTRIBUTE_WEIGHT),
+        )
+        for df, column, weight in fields:
+            if df.empty or EXPORTER_ID_COLUMN not in df.columns or column not in df.columns:
+                continue
+            # Index distinct (exporter, value) pairs only
+            pairs = df[[EXPORTER_ID_COLUMN, column]].dropna().astype(str).drop_duplicates()
+            for exporter_id, value in pairs.itertuples(index=False):
+                exporter_id = exporter_id.strip()
+                index.add_text(exporter_id, value, weight)
+                if weight == NAME_WEIGHT:
+                    index.names.setdefault(exporter_id, value)
+        return index
+
+    def add_text(self, exporter_id, text, weight):
+        for token in normalize_tokens(text):
+            if token in STOPWORDS:
+                continue
+            postings = self.postings[token]
+            postings[exporter_id] = max(weight, postings.get(exporter_id, 0))
+            if token not in self.token_trigrams:
+                grams = trigrams(token)
+                self.token_trigrams[token] = grams
+                for gram in grams:
+                    self.trigram_tokens[gram].add(token)
+
+    def add_profile(self, profile):
+        """Index a profile created through collect_exporter_info"""
+        exporter_id = profile["Exporter ID"]
+        self.names[exporter_id] = profile.get("Exporter Name", exporter_id)
+        self.add_text(exporter_id, profile.get("Exporter Name", ""), NAME_WEIGHT)
+        self.add_text(exporter_id, profile.get("Country of Origin", ""), ATTRIBUTE_WEIGHT)
+        self.add_text(exporter_id, profile.get("Industry Focus", ""), ATTRIBUTE_WEIGHT)
+
+    def _similar_tokens(self, token):
+        """Index tokens similar to token, with their trigram Jaccard similarity"""
+        if token in self.postings:
+            yield token, 1.0
+        grams = trigrams(token)
+        shared = defaultdict(int)
+        for gram in grams:
+            for candidate in self.trigram_tokens.get(gram, ()):
+                shared[candidate] += 1
+        for candidate, count in shared.items():
+            if candidate == token:
+                continue
+            similarity = count / (len(grams) + len(self.token_trigrams[candidate]) - count)
+            if similarity >= MIN_TOKEN_SIMILARITY:
+                yield candidate, similarity
+
+    def scores(self, query):
+        """exporter_id -> (score, matched tokens) for a free-text query"""
+        tokens = [t for t in normalize_tokens(query) if t not in STOPWORDS]
+        results = {}
+        for token in tokens:
+            if EXPORTER_ID_PATTERN.match(token):
+                for exporter_id in self.names:
+                    if exporter_id.lower() == token:
+                        results[exporter_id] = (float(len(tokens)), [exporter_id])
+                continue
+            best = {}
+            for candidate, similarity in self._similar_tokens(token):
+                for exporter_id, weight in self.postings[candidate].items():
+                    score = similarity * weight
+                    if score > best.get(exporter_id, (0, None))[0]:
+                        best[exporter_id] = (score, candidate)
+            for exporter_id, (score, candidate) in best.items():
+                total, matched = results.get(exporter_id, (0.0, []))
+                results[exporter_id] = (total + score, matched + [candidate])
+        # Normalize by query length so scores are comparable across queries
+        return {eid: (total / max(len(tokens), 1), matched) for eid, (total, matched) in results.items()}
+
+
+def search_exporters(indexes, query, limit=5):
+    """Ranked candidates across several name indexes (e.g. reference data and profiles)"""
+    combined = {}
+    names = {}
+    for index in indexes:
+        for exporter_id, (score, matched) in index.scores(query).items():
+            if score > combined.get(exporter_id, (0, None))[0]:
+                combined[exporter_id] = (score, matched)
+        names.update(index.names)
+    ranked = sorted(combined.items(), key=lambda item: (-item[1][0], item[0]))[:limit]
+    return [
+        {
+            "exporter_id": exporter_id,
+            "exporter_name": names.get(exporter_id, "Unknown"),
+            "score": round(score, 3),
+            "matched": matched
+        }
+        for exporter_id, (score, matched) in ranked
+    ]
@@ -0,0 +1,126 @@
+import os
+import time
+import asyncio
+import logging
+
+from context import ExporterContextBuilder, split_ids
+from compliance import ComplianceIssueIndex
+from snapshot import ReferenceSnapshot
+from pb_sync import COLLECTIONS, from_records
+
+logger = logging.getLogger(__name__)
+
+# Seconds an exporter's records fetched from PocketBase are reused
+REFERENCE_BACKEND_CACHE_TTL = float(os.getenv("REFERENCE_BACKEND_CACHE_TTL", 60))
+# Exporters whose records are kept at once
+REFERENCE_BACKEND_CACHE_SIZE = int(os.getenv("REFERENCE_BACKEND_CACHE_SIZE", 256))
+# Records per list request, and IDs per OR filter when following link columns
+PB_QUERY_PAGE_SIZE = 500
+PB_QUERY_IDS_PER_FILTER = 50
+
+
+def _quote(value):
+    """PocketBase filter string literal"""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class PocketBaseReferenceBackend:
+    """
+    Fetches one exporter's reference records from PocketBase.
+
+    Each query is an indexed exporter_id filter on the three collections (run
+    concurrently), followed by ID filters for shipments and traceability records
+    the exporter's rows link to under other exporters. The rows are wrapped in a
+    ReferenceSnapshot whose context builder and compliance index only cover that
+    exporter, so prompts and compliance analysis never need the full tables.
+    """
+
+    def __init__(self, pocketbase, ttl=REFERENCE_BACKEND_CACHE_TTL, max_entries=REFERENCE_BACKEND_CACHE_SIZE):
+        self.pocketbase = pocketbase
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (exporter_id, parent version) -> (fetched_at, snapshot)
+        self._cache = {}
+
+    async def _list(self, collection, filter_text):
+        """Every record of a collection matching a filter, following pages"""
+        items = []
+        page = 1
+        while True:
+            data = await self.pocketbase.json("GET", f"/api/collections/{collection}/records", params={
+                "filter": filter_text, "perPage": PB_QUERY_PAGE_SIZE, "page": page, "skipTotal": 1
+            })
+            batch = data.get("items", [])
+            items.extend(batch)
+            if len(batch) < PB_QUERY_PAGE_SIZE:
+                return items
+            page += 1
+
+    async def _by_exporter(self, table, exporter_id):
+        return await self._list(COLLECTIONS[table][0], f"exporter_id={_quote(exporter_id)}")
+
+    async def _by_ids(self, table, field, ids):
+        """Records whose business ID is in ids, in chunks that keep filter URLs short"""
+        ids = sorted(ids)
+        chunks = [ids[i:i + PB_QUERY_IDS_PER_FILTER] for i in range(0, len(ids), PB_QUERY_IDS_PER_FILTER)]
+        results = await asyncio.gather(*(
+            self._list(COLLECTIONS[table][0], " || ".join(f"{field}={_quote(value)}" for value in chunk))
+            for chunk in chunks
+        ))
+        return [item for items in results for item in items]
+
+    async def fetch_exporter(self, exporter_id):
+        """{table: DataFrame} with an exporter's own rows plus the rows they link to"""
+        docs, shipments, records = await asyncio.gather(
+            self._by_exporter("documents", exporter_id),
+            self._by_exporter("shipments", exporter_id),
+            self._by_exporter("traceability", exporter_id),
+        )
+
+        linked_shipment_ids = {sid for item in docs for sid in split_ids(item.get("shipment_id"))}
+        linked_record_ids = {rid for item in docs + shipments for rid in split_ids(item.get("linked_record_ids"))}
+        linked_shipment_ids -= {item.get("shipment_id") for item in shipments}
+        linked_record_ids -= {item.get("record_id") for item in records}
+        linked_shipments, linked_records = await asyncio.gather(
+            self._by_ids("shipments", "shipment_id", linked_shipment_ids),
+            self._by_ids("traceability", "record_id", linked_record_ids),
+        )
+
+        return {
+            "documents": from_records("documents", docs),
+            "shipments": from_records("shipments", shipments + linked_shipments),
+            "traceability": from_records("traceability", records + linked_records),
+        }
+
+    async def exporter_snapshot(self, exporter_id, parent):
+        """
+        Snapshot of one exporter's records at the parent snapshot's version.
+        Falls back to the parent (in-memory) snapshot if PocketBase has no rows
+        for the exporter or cannot be reached.
+        """
+        key = (exporter_id, parent.version)
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+
+        try:
+            tables = await self.fetch_exporter(exporter_id)
+        except Exception as e:
+            logger.warning(f"PocketBase query for exporter {exporter_id} failed, using in-memory data: {str(e)}")
+            return parent
+        if all(df.empty for df in tables.values()):
+            return parent
+
+        derived = dict(parent.derived)
+        derived["context"] = ExporterContextBuilder(tables["documents"], tables["shipments"], tables["traceability"])
+        derived["compliance"] = ComplianceIssueIndex(tables["documents"], tables["shipments"], tables["traceability"])
+        snapshot = ReferenceSnapshot(parent.version, tables, parent.table_versions, derived)
+
+        if len(self._cache) >= self.max_entries:
+            self._cache.pop(min(self._cache, key=lambda k: self._cache[k][0]))
+        self._cache[key] = (time.monotonic(), snapshot)
+        return snapshot
+
+    def invalidate(self):
+        """Drop every cached exporter, e.g. after a sync changed the collections"""
+        self._cache.clear()
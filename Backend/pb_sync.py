@@ -0,0 +1,244 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+
+import pandas as pd
+
+from sessions import pocketbase_record_id
+
+logger = logging.getLogger(__name__)
+
+# Records per /api/batch call (PocketBase's default limit is 50 requests per batch)
+PB_SYNC_BATCH_SIZE = int(os.getenv("PB_SYNC_BATCH_SIZE", 50))
+# Batches in flight at once
+PB_SYNC_CONCURRENCY = int(os.getenv("PB_SYNC_CONCURRENCY", 4))
+# Mirror uploaded CSVs into PocketBase in the background
+PB_SYNC_ON_UPLOAD = os.getenv("PB_SYNC_ON_UPLOAD", "false").lower() == "true"
+# Page size when listing record ids for pruning
+PB_LIST_PAGE_SIZE = 500
+
+# Reference table -> (collection, CSV ID column, [(CSV column, PocketBase field, kind)])
+COLLECTIONS = {
+    "documents": ("documents", "Document ID", [
+        ("Document ID", "document_id", "text"),
+        ("Exporter ID", "exporter_id", "text"),
+        ("Exporter Name", "exporter_name", "text"),
+        ("Document Type", "document_type", "text"),
+        ("Format", "format", "text"),
+        ("Date Issued", "date_issued", "date"),
+        ("Validity Period", "validity_period", "text"),
+        ("Departure Port", "departure_port", "text"),
+        ("Linked Shipment ID", "shipment_id", "text"),
+        ("Linked Traceability Record IDs", "linked_record_ids", "text"),
+        ("Status", "status", "text"),
+        ("Comments", "comments", "text"),
+    ]),
+    "shipments": ("shipments", "Shipment ID", [
+        ("Shipment ID", "shipment_id", "text"),
+        ("Exporter ID", "exporter_id", "text"),
+        ("Exporter Name", "exporter_name", "text"),
+        ("Country of Origin", "country_of_origin", "text"),
+        ("Destination Country", "destination_country", "text"),
+        ("Product Type", "product_type", "text"),
+        ("Product Description", "product_description", "text"),
+        ("HS Code", "hs_code", "text"),
+        ("Quantity", "quantity", "text"),
+        ("Export Date", "export_date", "date"),
+        ("Departure Port", "departure_port", "text"),
+        ("Arrival Port", "arrival_port", "text"),
+        ("Shipping Modality", "shipping_modality", "text"),
+        ("Carrier", "carrier", "text"),
+        ("Compliance Status", "compliance_status", "text"),
+        ("Linked Traceability Record IDs", "linked_record_ids", "text"),
+    ]),
+    "traceability": ("traceability_records", "Record ID", [
+        ("Record ID", "record_id", "text"),
+        ("Exporter ID", "exporter_id", "text"),
+        ("Food Product", "food_product", "text"),
+        ("CTE Type", "cte_type", "text"),
+        ("KDE Details", "kde_details", "text"),
+        ("Timestamp", "timestamp", "datetime"),
+        ("Compliance Flag", "compliance_flag", "text"),
+        ("Temp (°C)", "temperature", "number"),
+        ("Humidity (%)", "humidity", "number"),
+        ("Location (Name & Coords)", "location_info", "text"),
+        ("Lot Number", "lot_number", "text"),
+        ("Batch Number", "batch_number", "text"),
+        ("Supplier ID", "supplier_id", "text"),
+        ("Comments", "comments", "text"),
+    ]),
+}
+
+
+def record_id_for(collection, business_id):
+    """Deterministic PocketBase id, so re-running a sync updates instead of duplicating"""
+    return pocketbase_record_id(f"{collection}:{str(business_id).strip()}")
+
+
+def to_records(table, df):
+    """PocketBase record bodies for a reference DataFrame (vectorized per column)"""
+    collection, id_column, fields = COLLECTIONS[table]
+    df = df[df[id_column].notna()] if id_column in df.columns else df.iloc[0:0]
+    columns = {"id": [record_id_for(collection, value) for value in df[id_column]] if len(df) else []}
+    for csv_column, field, kind in fields:
+        if csv_column not in df.columns:
+            continue
+        values = df[csv_column]
+        if kind in ("date", "datetime"):
+            parsed = pd.to_datetime(values, errors="coerce")
+            values = parsed.dt.strftime("%Y-%m-%d %H:%M:%S.000Z").fillna("")
+        elif kind == "number":
+            values = pd.to_numeric(values, errors="coerce").astype(object)
+            values = values.where(values.notna(), None)
+        else:
+            values = values.astype(object).where(values.notna(), "").astype(str).str.strip()
+        columns[field] = list(values)
+    return pd.DataFrame(columns).to_dict("records")
+
+
+def from_records(table, items):
+    """Reference DataFrame (CSV column names and formats) from PocketBase records"""
+    _, _, fields = COLLECTIONS[table]
+    rows = {csv_column: [] for csv_column, _, _ in fields}
+    for item in items:
+        for csv_column, field, kind in fields:
+            value = item.get(field)
+            if value in ("", None):
+                value = None
+            elif kind == "date":
+                value = value[:10]
+            elif kind == "datetime":
+                value = value[:16]
+            rows[csv_column].append(value)
+    df = pd.DataFrame(rows)
+    for csv_column, _, kind in fields:
+        if kind == "number":
+            df[csv_column] = pd.to_numeric(df[csv_column], errors="coerce")
+    return df
+
+
+class PocketBaseSync:
+    """
+    Bulk, idempotent upsert of reference tables into their PocketBase collections.
+
+    Rows are sent in batches through /api/batch as PUT (upsert) requests keyed by
+    a deterministic id derived from the Document/Shipment/Record ID. If batch
+    requests are disabled, or a batch is rejected because of one bad row, that
+    batch falls back to per-record upserts so the rest still lands.
+    """
+
+    def __init__(self, pocketbase, batch_size=PB_SYNC_BATCH_SIZE, concurrency=PB_SYNC_CONCURRENCY):
+        self.pocketbase = pocketbase
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.batch_api = True
+
+    async def _upsert_one(self, collection, record):
+        path = f"/api/collections/{collection}/records"
+        response = await self.pocketbase.request("PATCH", f"{path}/{record['id']}", json=record)
+        if response.status_code == 404:
+            response = await self.pocketbase.request("POST", path, json=record)
+        if not response.is_success:
+            logger.warning(f"Upsert of {collection}/{record['id']} failed: {response.status_code} {response.text[:200]}")
+        return response.is_success
+
+    async def _send_batch(self, collection, batch):
+        """Upsert one batch; returns the number of records that failed"""
+        if self.batch_api:
+            response = await self.pocketbase.request("POST", "/api/batch", json={"requests": [
+                {"method": "PUT", "url": f"/api/collections/{collection}/records", "body": record}
+                for record in batch
+            ]})
+            if response.is_success:
+                return 0
+            if response.status_code in (403, 404):
+                logger.info("PocketBase batch API unavailable; falling back to per-record upserts")
+                self.batch_api = False
+        results = await asyncio.gather(*(self._upsert_one(collection, record) for record in batch))
+        return results.count(False)
+
+    async def _existing_ids(self, collection):
+        ids = set()
+        page = 1
+        while True:
+            data = await self.pocketbase.json("GET", f"/api/collections/{collection}/records", params={
+                "fields": "id", "perPage": PB_LIST_PAGE_SIZE, "page": page, "skipTotal": 1
+            })
+            items = data.get("items", [])
+            ids.update(item["id"] for item in items)
+            if len(items) < PB_LIST_PAGE_SIZE:
+                return ids
+            page += 1
+
+    async def sync_table(self, table, df, prune=False):
+        """Upsert every row of a reference table (and optionally delete rows no longer in it)"""
+        collection = COLLECTIONS[table][0]
+        started = time.perf_counter()
+        records = to_records(table, df)
+        batches = [records[i:i + self.batch_size] for i in range(0, len(records), self.batch_size)]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send(batch):
+            async with semaphore:
+                return await self._send_batch(collection, batch)
+
+        failed = sum(await asyncio.gather(*(send(batch) for batch in batches)))
+
+        deleted = 0
+        if prune:
+            stale = await self._existing_ids(collection) - {record["id"] for record in records}
+
+            async def delete(record_id):
+                async with semaphore:
+                    response = await self.pocketbase.request(
+                        "DELETE", f"/api/collections/{collection}/records/{record_id}"
+                    )
+                    return response.is_success
+
+            deleted = sum(await asyncio.gather(*(delete(record_id) for record_id in stale)))
+
+        seconds = time.perf_counter() - started
+        report = {
+            "collection": collection,
+            "rows": len(records),
+            "upserted": len(records) - failed,
+            "failed": failed,
+            "deleted": deleted,
+            "batches": len(batches),
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(len(records) / seconds, 1) if seconds else None
+        }
+        logger.info(f"Synced {table} to PocketBase: {report}")
+        return report
+
+    async def sync_tables(self, tables, prune=False):
+        """Sync several reference tables ({table: DataFrame}); returns a report per table"""
+        return {table: await self.sync_table(table, df, prune) for table, df in tables.items()}
+
+
+async def _main(argv):
+    from utils import bot, get_pocketbase_client
+
+    prune = "--no-prune" not in argv
+    tables = [arg for arg in argv if not arg.startswith("--")] or list(COLLECTIONS)
+    pocketbase = get_pocketbase_client()
+    if pocketbase is None:
+        sys.exit("POCKETBASE_URL is not set")
+    snapshot = bot.reference_data.current
+    try:
+        reports = await PocketBaseSync(pocketbase).sync_tables(
+            {table: snapshot.tables[table] for table in tables}, prune=prune
+        )
+    finally:
+        await pocketbase.close()
+    for table, report in reports.items():
+        print(f"{table}: {report['upserted']}/{report['rows']} rows in {report['seconds']}s "
+              f"({report['rows_per_second']} rows/s), {report['failed']} failed, {report['deleted']} deleted")
+
+
+if __name__ == "__main__":
+    # Usage: python pb_sync.py [documents] [shipments] [traceability] [--no-prune]
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(sys.argv[1:]))
@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import base64
+import asyncio
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+POCKETBASE_TIMEOUT = float(os.getenv("POCKETBASE_TIMEOUT", 10))
+POCKETBASE_MAX_CONNECTIONS = int(os.getenv("POCKETBASE_MAX_CONNECTIONS", 50))
+POCKETBASE_MAX_KEEPALIVE = int(os.getenv("POCKETBASE_MAX_KEEPALIVE", 20))
+# Re-authenticate this many seconds before the admin token expires
+POCKETBASE_TOKEN_REFRESH_MARGIN = float(os.getenv("POCKETBASE_TOKEN_REFRESH_MARGIN", 300))
+# Assumed token lifetime when the token carries no readable expiry
+POCKETBASE_DEFAULT_TOKEN_TTL = 3600
+
+SUPERUSER_AUTH_PATH = "/api/collections/_superusers/auth-with-password"
+
+
+def token_expiry(token):
+    """Expiry (epoch seconds) from a PocketBase JWT's payload, or None if unreadable"""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class PocketBaseError(Exception):
+    def __init__(self, response):
+        self.status_code = response.status_code
+        super().__init__(f"PocketBase returned {response.status_code} for "
+                         f"{response.request.method} {response.request.url.path}: {response.text[:200]}")
+
+
+class PocketBaseClient:
+    """
+    Shared async PocketBase HTTP client.
+
+    One keep-alive connection pool serves every caller. The superuser token is
+    fetched once, reused until shortly before it expires and refreshed under a
+    lock, so concurrent requests never trigger parallel logins; a 401 forces one
+    re-authentication and retry.
+    """
+
+    def __init__(self, base_url, admin_email=None, admin_password=None, timeout=POCKETBASE_TIMEOUT,
+                 max_connections=POCKETBASE_MAX_CONNECTIONS, max_keepalive=POCKETBASE_MAX_KEEPALIVE):
+        self.base_url = base_url.rstrip("/")
+        self.admin_email = admin_email
+        self.admin_password = admin_password
+        self.http = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            headers={"Accept": "application/json"}
+        )
+        self._token = None
+        self._token_expires = 0.0
+        self._auth_lock = asyncio.Lock()
+
+    async def admin_token(self, force=False):
+        """Cached superuser token, re-authenticating when missing, near expiry or forced"""
+        if not force and self._token and time.time() < self._token_expires - POCKETBASE_TOKEN_REFRESH_MARGIN:
+            return self._token
+        stale = self._token
+        async with self._auth_lock:
+            # Another caller may have refreshed while this one waited
+            if self._token and self._token != stale:
+                return self._token
+            response = await self.http.post(
+                SUPERUSER_AUTH_PATH, json={"identity": self.admin_email, "password": self.admin_password}
+            )
+            if not response.is_success:
+                raise PocketBaseError(response)
+            self._token = response.json().get("token")
+            if not self._token:
+                raise RuntimeError("PocketBase auth response did not include a token")
+            self._token_expires = token_expiry(self._token) or time.time() + POCKETBASE_DEFAULT_TOKEN_TTL
+            return self._token
+
+    async def request(self, method, path, auth=True, **kwargs):
+        """Send a request (as superuser unless auth=False) and return the response"""
+        if not auth:
+            return await self.http.request(method, path, **kwargs)
+        token = await self.admin_token()
+        response = await self.http.request(method, path, headers={"Authorization": token}, **kwargs)
+        if response.status_code == 401:
+            token = await self.admin_token(force=True)
+            response = await self.http.request(method, path, headers={"Authorization": token}, **kwargs)
+        return response
+
+    async def json(self, method, path, **kwargs):
+        """Send a request and return its JSON body, raising PocketBaseError on failure"""
+        response = await self.request(method, path, **kwargs)
+        if not response.is_success:
+            raise PocketBaseError(response)
+        return response.json()
+
+    async def health(self):
+        return await self.request("GET", "/api/health", auth=False)
+
+    async def close(self):
+        await self.http.aclose()
@@ -0,0 +1,258 @@
+import os
+import time
+import random
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Start the next provider if the current one has produced no token after this long
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "true").lower() == "true"
+HEDGE_AFTER_SECONDS = float(os.getenv("HEDGE_AFTER_SECONDS", 2.0))
+# Retries per provider for failures before the first token (full-jitter exponential backoff)
+PROVIDER_MAX_RETRIES = int(os.getenv("PROVIDER_MAX_RETRIES", 2))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 0.25))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 4.0))
+# Consecutive failures that open a provider's circuit, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", 30))
+
+
+class CircuitOpenError(Exception):
+    """Raised when a provider is skipped because its circuit is open"""
+
+
+def backoff_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """Full-jitter exponential backoff for the given retry attempt (0-based)"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_first_token(event):
+    """Whether an event shows the model has started answering (text or a tool call)"""
+    return event.get("type") == "content" or event.get("message_type") == "tool_use"
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker.
+
+    After failure_threshold consecutive failures the circuit opens and the
+    provider is skipped; after reset_seconds one trial request is let through
+    (half-open), and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def release_trial(self):
+        """Give up a half-open trial without an outcome (it was cancelled), so the next request can try"""
+        self.trial_in_flight = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        return {"state": self.state, "consecutive_failures": self.failures}
+
+
+class ProviderCandidate:
+    """
+    One way of answering a query: start(turn) returns its event stream and
+    collects answer text, usage and cacheability into turn.
+    """
+
+    def __init__(self, name, route, breaker, start, retryable=lambda error: False):
+        self.name = name
+        self.route = route
+        self.breaker = breaker
+        self.start = start
+        self.retryable = retryable
+
+
+def new_turn():
+    # "won" is set once hedged_events picks this attempt; side effects like tools wait for it
+    return {"answer_parts": [], "usage": {}, "cacheable": True, "won": asyncio.Event()}
+
+
+async def wait_until_won(turn):
+    """Block until the hedged attempt owning turn has won (immediately outside hedging)"""
+    won = turn.get("won")
+    if won is not None:
+        await won.wait()
+
+
+async def _run_candidate(index, candidate, queue, retries):
+    """Stream one candidate into the shared queue, retrying failures before its first token"""
+    attempt = 0
+    while True:
+        if not candidate.breaker.allow():
+            await queue.put((index, "failed", CircuitOpenError(f"{candidate.name} circuit is open")))
+            return
+        # Set only when allow() just granted this attempt the half-open trial
+        trial = candidate.breaker.trial_in_flight
+        turn = new_turn()
+        await queue.put((index, "attempt", turn))
+        started = False
+        try:
+            async for event in candidate.start(turn):
+                if not started and is_first_token(event):
+                    started = True
+                    candidate.breaker.record_success()
+                await queue.put((index, "event", event))
+            if not started:
+                candidate.breaker.record_success()
+            await queue.put((index, "done", None))
+            return
+        except asyncio.CancelledError:
+            # A cancelled trial (lost the hedge, client left) says nothing about the provider
+            if trial and not started:
+                candidate.breaker.release_trial()
+            raise
+        except Exception as e:
+            candidate.breaker.record_failure()
+            if not started and attempt < retries and candidate.retryable(e):
+                delay = backoff_delay(attempt)
+                logger.warning(f"{candidate.name} failed ({str(e)}); retry {attempt + 1} in {delay:.2f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            await queue.put((index, "failed", e))
+            return
+
+
+async def hedged_events(candidates, turn, hedge_after=HEDGE_AFTER_SECONDS, hedging=HEDGING_ENABLED,
+                        retries=PROVIDER_MAX_RETRIES):
+    """
+    Stream the answer of the first candidate to produce a token.
+
+    The first candidate starts immediately. If it has not produced a first token
+    within hedge_after seconds the next one is started alongside it, and a
+    candidate that fails before its first token hands over to the next one at
+    once. Events are buffered until a candidate wins; the others are then
+    cancelled, so losers never reach the client. A candidate's turn["won"] is
+    set when it wins, and candidates wait for it (wait_until_won) before side
+    effects such as tool calls, so losers never run tools.
+    The winner's answer, usage and cacheability are merged into turn, and
+    turn["route"] names its route. Raises the last error if every candidate
+    fails, or the winner's error if it fails mid-stream.
+    """
+    queue = asyncio.Queue()
+    tasks = {}
+    turns = {}
+    buffers = {}
+    winner = None
+    next_index = 0
+    last_error = None
+
+    def launch():
+        nonlocal next_index
+        index = next_index
+        next_index += 1
+        buffers[index] = []
+        tasks[index] = asyncio.ensure_future(_run_candidate(index, candidates[index], queue, retries))
+        return time.monotonic() + hedge_after
+
+    def commit(index):
+        nonlocal winner
+        winner = index
+        turns[index]["won"].set()
+        for other, task in tasks.items():
+            if other != index:
+                task.cancel()
+        if index:
+            logger.info(f"Answered by fallback {candidates[index].name}")
+
+    hedge_deadline = launch()
+    try:
+        while True:
+            timeout = None
+            if winner is None and hedging and next_index < len(candidates):
+                timeout = max(hedge_deadline - time.monotonic(), 0)
+            try:
+                index, kind, payload = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                logger.info(f"No first token from {candidates[next_index - 1].name} "
+                            f"after {hedge_after}s; hedging with {candidates[next_index].name}")
+                hedge_deadline = launch()
+                continue
+
+            if winner is not None and index != winner:
+                continue
+
+            if kind == "attempt":
+                # A retry starts over: drop anything buffered from the failed attempt
+                turns[index] = payload
+                buffers[index] = []
+            elif kind == "event":
+                if winner is not None:
+                    yield payload
+                    continue
+                buffers[index].append(payload)
+                if is_first_token(payload):
+                    commit(index)
+                    for event in buffers[index]:
+                        yield event
+            elif kind == "done":
+                if winner is None:
+                    commit(index)
+                    for event in buffers[index]:
+                        yield event
+                return
+            elif kind == "failed":
+                if winner == index:
+                    raise payload
+                last_error = payload
+                logger.warning(f"{candidates[index].name} failed: {str(payload)}")
+                del tasks[index]
+                if not tasks:
+                    if next_index >= len(candidates):
+                        raise last_error
+                    hedge_deadline = launch()
+    finally:
+        for task in tasks.values():
+            task.cancel()
+        for task in tasks.values():
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        if winner is not None:
+            won = turns[winner]
+            turn["answer_parts"].extend(won["answer_parts"])
+            for field, value in won["usage"].items():
+                turn["usage"][field] = turn["usage"].get(field, 0) + value
+            turn["cacheable"] = turn["cacheable"] and won["cacheable"]
+            turn["route"] = candidates[winner].route
+            turn["provider"] = candidates[winner].name
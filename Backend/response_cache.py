@@ -0,0 +1,155 @@
+import os
+import re
+import json
+import time
+import logging
+from collections import OrderedDict
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 3600))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+EXPORTER_ID_COLUMN = "Exporter ID"
+
+
+def normalize_query(query):
+    """Case-, whitespace- and trailing-punctuation-insensitive form of a question"""
+    return re.sub(r"\s+", " ", str(query)).strip().lower().rstrip("?!. ")
+
+
+def merge_content_frames(frames):
+    """Collapse runs of text deltas into single content events"""
+    merged = []
+    for frame in frames:
+        if (merged and frame.keys() == {"type", "text"} and frame["type"] == "content"
+                and merged[-1].keys() == {"type", "text"} and merged[-1]["type"] == "content"):
+            merged[-1] = {"type": "content", "text": merged[-1]["text"] + frame["text"]}
+        else:
+            merged.append(frame)
+    return merged
+
+
+class ExporterFingerprints:
+    """
+    Content hashes of each exporter's reference rows, built once per data version.
+
+    A cached answer is only valid while the fingerprint of the data it was built
+    from is unchanged, and comparing two versions' fingerprints tells an upload
+    which exporters it affected. Answers without exporter-scoped data depend on
+    the overall fingerprint.
+    """
+
+    def __init__(self, documents_df, shipments_df, traceability_df):
+        by_exporter = {}
+        overall = []
+        for name, df in (("documents", documents_df), ("shipments", shipments_df),
+                         ("traceability", traceability_df)):
+            if df.empty:
+                overall.append(0)
+                continue
+            row_hashes = pd.util.hash_pandas_object(df.astype(str), index=False)
+            overall.append(int(row_hashes.sum()))
+            if EXPORTER_ID_COLUMN not in df.columns:
+                continue
+            ids = df[EXPORTER_ID_COLUMN].astype(str).str.strip()
+            for exporter_id, value in row_hashes.groupby(ids.values).sum().items():
+                by_exporter.setdefault(exporter_id, {})[name] = int(value)
+        self.by_exporter = {eid: hash(tuple(sorted(parts.items()))) for eid, parts in by_exporter.items()}
+        self.overall = hash(tuple(overall))
+
+    def for_exporter(self, exporter_id):
+        """(scoped, fingerprint) for the data an answer about exporter_id is built from"""
+        if exporter_id in self.by_exporter:
+            return True, self.by_exporter[exporter_id]
+        return False, self.overall
+
+    def changed_exporters(self, other):
+        """Exporters whose rows differ between this and another version"""
+        ids = set(self.by_exporter) | set(other.by_exporter)
+        return {eid for eid in ids if self.by_exporter.get(eid) != other.by_exporter.get(eid)}
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of streamed /chat responses with a memory cap.
+
+    Entries are keyed by normalized query and exporter and store the stream
+    events of the original response, so a hit replays them (including metadata
+    frames) without a model round trip.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL,
+                 max_bytes=RESPONSE_CACHE_MAX_BYTES, enabled=RESPONSE_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._entries = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query, exporter_id, fingerprint):
+        """Return (frames, answer text) for a still-valid entry, or None"""
+        if not self.enabled:
+            return None
+        key = (normalize_query(query), exporter_id or "")
+        entry = self._entries.get(key)
+        if entry is None or entry["fingerprint"] != fingerprint or time.monotonic() > entry["expires"]:
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry["frames"], entry["answer"]
+
+    def put(self, query, exporter_id, fingerprint, frames, answer):
+        if not self.enabled:
+            return
+        key = (normalize_query(query), exporter_id or "")
+        frames = merge_content_frames(frames)
+        size = len(json.dumps(frames)) + len(answer)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = {
+            "fingerprint": fingerprint,
+            "frames": frames,
+            "answer": answer,
+            "size": size,
+            "expires": time.monotonic() + self.ttl
+        }
+        self.size_bytes += size
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_exporters(self, exporter_ids, include_unscoped=True):
+        """Drop entries about the given exporters, and (by default) answers built from overall data"""
+        stale = [
+            key for key, entry in self._entries.items()
+            if key[1] in exporter_ids or (include_unscoped and not entry["fingerprint"][0])
+        ]
+        for key in stale:
+            self._remove(key)
+        if stale:
+            logger.info(f"Invalidated {len(stale)} cached responses")
+        return len(stale)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.size_bytes -= entry["size"]
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,182 @@
+import os
+import re
+import pandas as pd
+
+EXPORTER_ID_COLUMN = "Exporter ID"
+
+# Groups shown per rollup table in the prompt (largest first); the JSON endpoint returns all
+ROLLUP_PROMPT_MAX_ROWS = int(os.getenv("ROLLUP_PROMPT_MAX_ROWS", 10))
+# Add rollups to the prompt for questions about overall status
+ROLLUPS_FOR_AGGREGATE_QUESTIONS = os.getenv("ROLLUPS_FOR_AGGREGATE_QUESTIONS", "true").lower() == "true"
+
+# Table -> (status column, status counted as passing for the rate column or None,
+#           {dimension: source column}); "month" dimensions are bucketed from a date column
+ROLLUP_SPECS = {
+    "shipments": ("Compliance Status", "Compliant", {
+        "exporter": EXPORTER_ID_COLUMN,
+        "product": "Product Description",
+        "departure_port": "Departure Port",
+        "arrival_port": "Arrival Port",
+        "carrier": "Carrier",
+        "month": "Export Date",
+    }),
+    "documents": ("Status", "Approved", {
+        "exporter": EXPORTER_ID_COLUMN,
+        "document_type": "Document Type",
+        "departure_port": "Departure Port",
+        "month": "Date Issued",
+    }),
+    "traceability": ("Compliance Flag", "Pass", {
+        "exporter": EXPORTER_ID_COLUMN,
+        "cte_type": "CTE Type",
+        "product": "Food Product",
+        "month": "Timestamp",
+    }),
+}
+
+# Questions about overall status, counts, rates or trends rather than specific records.
+# Only whole phrases count: bare words like "most", "total" or "rate" also appear in
+# questions about one record ("my most recent shipment", "the total quantity").
+AGGREGATE_QUESTION_PATTERN = re.compile(
+    r"\b(overall|in general|how (are|is) (we|our|it|they|things) doing|how many|in total|"
+    r"(total|overall) (number|count)|count of|number of (\w+ )?(shipments|documents|records)|"
+    r"summar(y|ise|ize)|statistics|stats|breakdown|trends?|"
+    r"(compliance|approval|pass|failure|rejection|error) rates?|percentage of|proportion of|"
+    r"per (month|port|carrier|product)|by (month|port|carrier|product|status)|"
+    r"(which|what) (\w+ ){1,2}(has|have|had) the (most|fewest|least|highest|lowest))\b",
+    re.IGNORECASE
+)
+
+
+def is_aggregate_question(query):
+    """Whether a query asks about aggregate status (answered with rollups in the prompt)"""
+    return bool(query) and AGGREGATE_QUESTION_PATTERN.search(query) is not None
+
+
+def _dimension_values(df, dimension, column):
+    if dimension == "month":
+        return pd.to_datetime(df[column], errors="coerce").dt.strftime("%Y-%m").fillna("unknown")
+    return df[column].astype(str).str.strip().replace({"": "unknown", "nan": "unknown"})
+
+
+class ReferenceRollups:
+    """
+    Status counts of each reference table grouped by exporter, product, port,
+    carrier and month, computed once per reference data version.
+
+    Each rollup is kept per exporter (Exporter ID x dimension value x status),
+    so an exporter's view is an index lookup and the all-exporter view is a sum
+    computed up front. Rendered, a rollup is a few dozen lines however many rows
+    the tables hold, which is what aggregate questions need instead of raw rows.
+    """
+
+    def __init__(self, documents_df, shipments_df, traceability_df, max_prompt_rows=ROLLUP_PROMPT_MAX_ROWS):
+        self.max_prompt_rows = max_prompt_rows
+        tables = {"documents": documents_df, "shipments": shipments_df, "traceability": traceability_df}
+        # Rollup name (e.g. "shipments_by_carrier") -> counts indexed by (Exporter ID, value)
+        self.by_exporter = {}
+        # Rollup name -> counts across all exporters, indexed by value
+        self.overall = {}
+        # Table -> status counts per exporter, for the per-table totals line
+        self.totals = {}
+        self.passing = {}
+        self.exporter_ids = set()
+
+        for table, (status_column, passing, dimensions) in ROLLUP_SPECS.items():
+            df = tables[table]
+            if df.empty or EXPORTER_ID_COLUMN not in df.columns or status_column not in df.columns:
+                continue
+            ids = df[EXPORTER_ID_COLUMN].astype(str).str.strip()
+            statuses = df[status_column].fillna("unknown").astype(str).str.strip()
+            self.exporter_ids.update(ids.unique())
+            self.passing[table] = passing
+            self.totals[table] = pd.crosstab(ids, statuses).rename_axis(index=EXPORTER_ID_COLUMN, columns=None)
+
+            for dimension, column in dimensions.items():
+                if column not in df.columns:
+                    continue
+                name = f"{table}_by_{dimension}"
+                if dimension == "exporter":
+                    self.overall[name] = self.totals[table]
+                    continue
+                values = _dimension_values(df, dimension, column).rename(dimension)
+                counts = pd.crosstab([ids.rename(EXPORTER_ID_COLUMN), values], statuses).rename_axis(columns=None)
+                self.by_exporter[name] = counts.sort_index()
+                self.overall[name] = counts.groupby(level=dimension).sum()
+
+        self._views = {}
+        self._rendered = {}
+
+    def names(self):
+        return sorted(set(self.overall) | set(self.by_exporter))
+
+    def _with_totals(self, table, counts, by_month=False):
+        counts = counts.copy()
+        counts["Total"] = counts.sum(axis=1)
+        passing = self.passing.get(table)
+        if passing is not None:
+            passed = counts[passing] if passing in counts.columns else 0
+            counts[f"{passing} Rate"] = (passed / counts["Total"] * 100).round(1)
+        if by_month:
+            # Most recent months first
+            return counts.sort_index(ascending=False)
+        return counts.sort_values("Total", ascending=False, kind="stable")
+
+    def view(self, exporter_id=None):
+        """
+        {rollup name: DataFrame} for one exporter, or across all exporters if
+        exporter_id is None. Unknown exporters get an empty dict.
+        """
+        if exporter_id is not None and exporter_id not in self.exporter_ids:
+            return {}
+        if exporter_id not in self._views:
+            views = {}
+            for name in self.names():
+                table = name.split("_by_")[0]
+                if exporter_id is None:
+                    counts = self.overall[name]
+                elif name in self.by_exporter:
+                    counts = self.by_exporter[name]
+                    if exporter_id not in counts.index.get_level_values(0):
+                        continue
+                    counts = counts.xs(exporter_id, level=0)
+                else:
+                    # The by-exporter rollup of a single exporter is its totals row
+                    continue
+                counts = counts.loc[:, (counts != 0).any(axis=0)]
+                views[name] = self._with_totals(table, counts, by_month=name.endswith("_by_month"))
+            for table, totals in self.totals.items():
+                if exporter_id is None:
+                    row = totals.sum()
+                elif exporter_id in totals.index:
+                    row = totals.loc[exporter_id]
+                else:
+                    continue
+                row = row[row != 0].to_frame().T.set_axis(["all"]).rename_axis("scope")
+                views[f"{table}_totals"] = self._with_totals(table, row)
+            self._views[exporter_id] = views
+        return self._views[exporter_id]
+
+    def to_json(self, exporter_id=None, names=None):
+        """JSON-friendly rollups: {rollup name: [{dimension value and counts}]}"""
+        result = {}
+        for name, df in self.view(exporter_id).items():
+            if names and name not in names:
+                continue
+            result[name] = df.reset_index().to_dict("records")
+        return result
+
+    def render(self, exporter_id=None):
+        """Compact CSV rollup tables for the system prompt"""
+        if exporter_id not in self._rendered:
+            scope = f"exporter {exporter_id}" if exporter_id else "all exporters"
+            parts = [f"REFERENCE DATA ROLLUPS ({scope}; counts by status, largest groups or latest months first; "
+                     f"rates are percentages of the group total):"]
+            for name, df in self.view(exporter_id).items():
+                shown = df.head(self.max_prompt_rows)
+                text = f"{name.upper()}:\n" + shown.to_csv().strip()
+                if len(df) > len(shown):
+                    text += f"\n... {len(df) - len(shown)} smaller groups omitted"
+                parts.append(text)
+            self._rendered[exporter_id] = "\n\n".join(parts)
+        return self._rendered[exporter_id]
@@ -0,0 +1,171 @@
+import os
+import re
+import time
+from collections import deque
+
+ROUTE_CLAUDE = "claude"
+ROUTE_GROQ = "groq"
+
+# Route general rule questions to Groq; everything else stays on Claude
+MODEL_ROUTER_ENABLED = os.getenv("MODEL_ROUTER_ENABLED", "true").lower() == "true"
+# Longer questions are rarely simple lookups of the rule
+ROUTER_MAX_GENERAL_CHARS = int(os.getenv("ROUTER_MAX_GENERAL_CHARS", 400))
+# Recent requests kept per route for latency percentiles
+ROUTER_STATS_WINDOW = int(os.getenv("ROUTER_STATS_WINDOW", 1000))
+
+# USD per million tokens, for the cost estimate in the route stats
+ROUTE_PRICES = {
+    ROUTE_CLAUDE: (float(os.getenv("CLAUDE_INPUT_PRICE_PER_MTOK", 3.0)),
+                   float(os.getenv("CLAUDE_OUTPUT_PRICE_PER_MTOK", 15.0))),
+    ROUTE_GROQ: (float(os.getenv("GROQ_INPUT_PRICE_PER_MTOK", 0.05)),
+                 float(os.getenv("GROQ_OUTPUT_PRICE_PER_MTOK", 0.08))),
+}
+
+EXPORTER_ID_PATTERN = re.compile(r"\bEX\d+\b", re.IGNORECASE)
+
+# Phrases that need exporter data or a tool (profile creation, compliance analysis, lookup)
+TOOL_PATTERNS = [
+    r"\b(my|our|we|i am|i'm|we're)\b",
+    # Lowercase only, so "US" the country does not count as a pronoun
+    r"(?-i:\b[Uu]s\b)",
+    r"\bprofile\b", r"\bregister\b", r"\bsign(ing)? up\b", r"\bshipments?\b", r"\bdocuments?\b",
+    r"\banaly[sz]e\b", r"\bstatus\b", r"\bnon-?compliant\b", r"\bpending\b", r"\bfail(ed|ing)?\b",
+]
+# Phrases typical of general questions about the Food Traceability Rule
+GENERAL_PATTERNS = [
+    r"\bftl\b", r"\bfood traceability\b", r"\btraceability (rule|list)\b", r"\brule\b", r"\bfsma\b",
+    r"\bsection 204\b", r"\bkdes?\b", r"\bctes?\b", r"\bkey data elements?\b",
+    r"\bcritical tracking events?\b", r"\btraceability lot code\b", r"\bdeadline\b", r"\bcomply by\b",
+    r"\bexempt(ion|ions)?\b", r"\brequire(d|ment|ments)?\b", r"\bwhat (is|are)\b", r"\bexplain\b",
+]
+
+
+def _compile(patterns, env_name):
+    """Built-in patterns plus comma-separated extras from the environment"""
+    extra = [p.strip() for p in os.getenv(env_name, "").split(",") if p.strip()]
+    return re.compile("|".join(patterns + extra), re.IGNORECASE)
+
+
+class RouteStats:
+    """Request counts, latency and token cost of one route"""
+
+    def __init__(self, route, window=ROUTER_STATS_WINDOW):
+        self.route = route
+        self.requests = 0
+        self.errors = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+        self.first_token_seconds = deque(maxlen=window)
+        self.total_seconds = deque(maxlen=window)
+
+    def record(self, first_token, total, usage, error=False):
+        self.requests += 1
+        self.errors += int(error)
+        if first_token is not None:
+            self.first_token_seconds.append(first_token)
+        self.total_seconds.append(total)
+        input_price, output_price = ROUTE_PRICES.get(self.route, (0.0, 0.0))
+        # Prompt cache reads bill at 10% of input, cache writes at 125%
+        input_tokens = usage.get("input_tokens", 0)
+        cache_read = usage.get("cache_read_input_tokens", 0)
+        cache_write = usage.get("cache_creation_input_tokens", 0)
+        output_tokens = usage.get("output_tokens", 0)
+        self.input_tokens += input_tokens + cache_read + cache_write
+        self.output_tokens += output_tokens
+        self.cost_usd += (
+            (input_tokens + 0.1 * cache_read + 1.25 * cache_write) * input_price
+            + output_tokens * output_price
+        ) / 1_000_000
+
+    @staticmethod
+    def _percentile(values, fraction):
+        if not values:
+            return None
+        ordered = sorted(values)
+        return round(ordered[min(int(len(ordered) * fraction), len(ordered) - 1)], 4)
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "first_token_p50": self._percentile(self.first_token_seconds, 0.5),
+            "first_token_p95": self._percentile(self.first_token_seconds, 0.95),
+            "total_p50": self._percentile(self.total_seconds, 0.5),
+            "total_p95": self._percentile(self.total_seconds, 0.95),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "cost_per_request_usd": round(self.cost_usd / self.requests, 6) if self.requests else None
+        }
+
+
+class ModelRouter:
+    """
+    Picks the model for a chat query.
+
+    Classification is a pair of keyword checks, so it adds no latency: questions
+    about the rule itself, with no exporter context and nothing that would need
+    a tool, go to Groq; anything else goes to Claude.
+    """
+
+    def __init__(self, groq_available, enabled=MODEL_ROUTER_ENABLED, max_general_chars=ROUTER_MAX_GENERAL_CHARS):
+        self.groq_available = groq_available
+        self.enabled = enabled
+        self.max_general_chars = max_general_chars
+        self.tool_pattern = _compile(TOOL_PATTERNS, "ROUTER_TOOL_PATTERNS")
+        self.general_pattern = _compile(GENERAL_PATTERNS, "ROUTER_GENERAL_PATTERNS")
+        self.stats = {route: RouteStats(route) for route in (ROUTE_CLAUDE, ROUTE_GROQ)}
+
+    def classify(self, query):
+        """(route, reason) for a query, ignoring whether Groq is available"""
+        if len(query) > self.max_general_chars:
+            return ROUTE_CLAUDE, "long_query"
+        if EXPORTER_ID_PATTERN.search(query):
+            return ROUTE_CLAUDE, "exporter_id"
+        if self.tool_pattern.search(query):
+            return ROUTE_CLAUDE, "tool_intent"
+        if self.general_pattern.search(query):
+            return ROUTE_GROQ, "general_rule_question"
+        return ROUTE_CLAUDE, "unclassified"
+
+    def route(self, query, exporter_id=None):
+        """(route, reason) for a query from a user with the given exporter context"""
+        if not self.enabled:
+            return ROUTE_CLAUDE, "router_disabled"
+        if exporter_id:
+            return ROUTE_CLAUDE, "exporter_context"
+        route, reason = self.classify(query)
+        if route == ROUTE_GROQ and not self.groq_available():
+            return ROUTE_CLAUDE, "groq_unavailable"
+        return route, reason
+
+    async def track(self, route, events, turn):
+        """
+        Pass events through, recording first-token and total latency and usage
+        under the route that answered (turn["route"], set on failover) or route.
+        """
+        started = time.perf_counter()
+        first_token = None
+        error = False
+        try:
+            async for event in events:
+                if first_token is None and event.get("type") == "content":
+                    first_token = time.perf_counter() - started
+                if event.get("type") == "metadata" and event.get("message_type") == "error":
+                    error = True
+                yield event
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.stats[turn.get("route", route)].record(
+                first_token, time.perf_counter() - started, turn["usage"], error
+            )
+
+    def stats_snapshot(self):
+        return {
+            "enabled": self.enabled,
+            "groq_available": self.groq_available(),
+            "routes": {route: stats.snapshot() for route, stats in self.stats.items()}
+        }
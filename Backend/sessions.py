@@ -0,0 +1,368 @@
+import os
+import re
+import uuid
+import hashlib
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from context import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Sessions kept in memory; least recently used ones are evicted (their history is in PocketBase)
+SESSION_MAX_ACTIVE = int(os.getenv("SESSION_MAX_ACTIVE", 1000))
+# Input-token budget for conversation history sent with each request
+SESSION_HISTORY_TOKEN_BUDGET = int(os.getenv("SESSION_HISTORY_TOKEN_BUDGET", 4000))
+# Most recent turns that are always sent verbatim
+SESSION_KEEP_RECENT_TURNS = int(os.getenv("SESSION_KEEP_RECENT_TURNS", 2))
+# Write-behind flush interval and batch size for PocketBase persistence
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", 2.0))
+SESSION_FLUSH_BATCH = int(os.getenv("SESSION_FLUSH_BATCH", 100))
+# Oldest queued writes are dropped beyond this while PocketBase is unreachable
+SESSION_MAX_PENDING = int(os.getenv("SESSION_MAX_PENDING", 10000))
+# Messages fetched per PocketBase page when a session is reloaded
+SESSION_LOAD_PAGE_SIZE = int(os.getenv("SESSION_LOAD_PAGE_SIZE", 200))
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_\-]{1,100}$")
+
+
+def pocketbase_record_id(key):
+    """Deterministic 15-character PocketBase record id for an external key"""
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:15]
+
+
+def _now_iso():
+    now = datetime.now(timezone.utc)
+    return now.strftime("%Y-%m-%d %H:%M:%S.") + f"{now.microsecond // 1000:03d}Z"
+
+
+class ChatSession:
+    """One conversation: recent turns verbatim plus a running summary of older ones"""
+
+    def __init__(self, session_id, exporter_id=None):
+        self.session_id = session_id
+        self.exporter_id = exporter_id
+        self.turns = []  # [(user text, assistant text)]
+        self.summary = ""
+        # Turns folded into the summary so far; they are not reloaded verbatim
+        self.summarized_turns = 0
+        self.started_at = _now_iso()
+        self.last_active = self.started_at
+        self.compacting = False
+
+    def history_tokens(self):
+        return estimate_tokens(self.summary) + sum(
+            estimate_tokens(user) + estimate_tokens(assistant) for user, assistant in self.turns
+        )
+
+
+class SessionStore:
+    """
+    Server-side chat sessions.
+
+    The hot tier is an LRU-bounded dict of ChatSession objects. Every turn is
+    queued for write-behind persistence to the chat_sessions / chat_messages
+    PocketBase collections, and sessions that fell out of the hot tier are
+    reloaded from there. Histories over the token budget are compacted in the
+    background by summarizing their oldest turns.
+
+    With shared=True (several workers behind one load balancer) a session's
+    requests may land on different workers: turns and closes are written
+    through instead of waiting for the next flush, and a session in the hot
+    tier is reloaded when its stored last_active shows another worker has
+    recorded a turn or closed it since.
+    """
+
+    def __init__(self, persistence=None, summarizer=None, max_active=SESSION_MAX_ACTIVE,
+                 token_budget=SESSION_HISTORY_TOKEN_BUDGET, shared=False):
+        self.persistence = persistence
+        self.summarizer = summarizer
+        self.max_active = max_active
+        self.token_budget = token_budget
+        self.shared = shared
+        self._sessions = OrderedDict()
+        self._pending = []
+        # Sessions cleared whose close has not reached PocketBase yet; never reloaded
+        self._closing = set()
+        self._writer_task = None
+        # One flush at a time, so a retried batch is never overtaken by a later one
+        self._flush_lock = asyncio.Lock()
+
+    @staticmethod
+    def valid_session_id(session_id):
+        return bool(session_id) and bool(SESSION_ID_PATTERN.match(session_id))
+
+    async def get(self, session_id, exporter_id=None):
+        """Return the session, loading it from persistence or creating it if needed"""
+        session = self._sessions.get(session_id)
+        if session is not None and self.shared and self.persistence and await self._changed_elsewhere(session):
+            self._sessions.pop(session_id, None)
+            session = None
+        if session is None:
+            session = ChatSession(session_id, exporter_id)
+            if self.persistence and session_id not in self._closing:
+                try:
+                    stored = await self.persistence.load(session_id)
+                except Exception as e:
+                    stored = None
+                    logger.warning(f"Could not load history for session {session_id}: {str(e)}")
+                if stored:
+                    session.turns = stored["turns"]
+                    session.summary = stored["summary"]
+                    session.summarized_turns = stored["summarized_turns"]
+                    session.started_at = stored["started_at"] or session.started_at
+                    session.last_active = stored["last_active"] or session.last_active
+                    session.exporter_id = session.exporter_id or stored["exporter_id"]
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_active:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        if exporter_id:
+            session.exporter_id = exporter_id
+        return session
+
+    async def _changed_elsewhere(self, session):
+        """Whether another worker recorded a turn for or closed a session after this worker's last turn"""
+        try:
+            last_active = await self.persistence.last_active(session.session_id)
+        except Exception as e:
+            logger.warning(f"Could not check session {session.session_id}: {str(e)}")
+            return False
+        # Both sides use _now_iso, so the timestamps compare as strings
+        return last_active is not None and last_active > session.last_active
+
+    def clear(self, session_id):
+        """Drop a session's history (New Chat)"""
+        self._sessions.pop(session_id, None)
+        if self.persistence and self.valid_session_id(session_id):
+            # Closed even when not in memory (evicted, or held by another worker), so a reused ID
+            # starts without the old history
+            self._closing.add(session_id)
+            self._pending.append(("close", session_id, _now_iso()))
+            self._write_through()
+
+    def history_messages(self, session):
+        """
+        Conversation history as API messages, trimmed to the token budget.
+        Oldest turns are dropped here only if background compaction has not caught up.
+        """
+        turns = list(session.turns)
+        budget = self.token_budget - estimate_tokens(session.summary)
+        while turns and sum(estimate_tokens(u) + estimate_tokens(a) for u, a in turns) > budget:
+            turns.pop(0)
+        messages = []
+        for user, assistant in turns:
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
+        return messages
+
+    def record_turn(self, session, user_text, assistant_text):
+        """Append a completed turn, queue it for persistence and compact if over budget"""
+        if not assistant_text:
+            return
+        session.turns.append((user_text, assistant_text))
+        session.last_active = _now_iso()
+        if self.persistence:
+            # The turn id makes message writes idempotent when a batch is retried
+            self._pending.append(("turn", session.session_id, (uuid.uuid4().hex, session.exporter_id,
+                                                               session.started_at, session.last_active,
+                                                               user_text, assistant_text)))
+            if len(self._pending) > SESSION_MAX_PENDING:
+                logger.warning("Session write-behind queue full; dropping oldest writes")
+                del self._pending[:len(self._pending) - SESSION_MAX_PENDING]
+            self._write_through()
+        if session.history_tokens() > self.token_budget and not session.compacting:
+            session.compacting = True
+            asyncio.get_running_loop().create_task(self._compact(session))
+
+    async def _compact(self, session):
+        """Fold the oldest turns into the session summary"""
+        try:
+            keep = SESSION_KEEP_RECENT_TURNS
+            old_turns = session.turns[:-keep] if len(session.turns) > keep else []
+            if not old_turns:
+                return
+            if self.summarizer:
+                try:
+                    session.summary = await self.summarizer(session.summary, old_turns)
+                except Exception as e:
+                    logger.warning(f"Summarizing session {session.session_id} failed: {str(e)}")
+                    return
+            else:
+                session.summary = "\n".join(
+                    [session.summary] + [f"User asked: {u[:200]}" for u, _ in old_turns]
+                ).strip()
+            # Turns may have been added while summarizing; drop only those summarized
+            session.turns = session.turns[len(old_turns):]
+            session.summarized_turns += len(old_turns)
+            if self.persistence:
+                self._pending.append(("summary", session.session_id, (session.summary, session.summarized_turns)))
+        finally:
+            session.compacting = False
+
+    def start(self):
+        """Start the write-behind flusher (call from the running event loop)"""
+        if self.persistence and self._writer_task is None:
+            self._writer_task = asyncio.get_running_loop().create_task(self._writer())
+
+    async def stop(self):
+        if self._writer_task:
+            self._writer_task.cancel()
+            self._writer_task = None
+        await self.flush()
+
+    def _write_through(self):
+        """In shared mode, flush now: the session's next request may go to another worker"""
+        if self.shared:
+            asyncio.get_running_loop().create_task(self._flush_logged())
+
+    async def _writer(self):
+        while True:
+            await asyncio.sleep(SESSION_FLUSH_INTERVAL)
+            await self._flush_logged()
+
+    async def _flush_logged(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Session write-behind flush failed: {str(e)}")
+
+    async def flush(self):
+        """Persist queued session updates in batches"""
+        async with self._flush_lock:
+            while self._pending and self.persistence:
+                batch = self._pending[:SESSION_FLUSH_BATCH]
+                del self._pending[:SESSION_FLUSH_BATCH]
+                try:
+                    await self.persistence.write(batch)
+                except Exception:
+                    # Keep the batch for the next attempt
+                    self._pending[:0] = batch
+                    raise
+                self._closing.difference_update(session_id for kind, session_id, _ in batch if kind == "close")
+
+
+class PocketBaseSessionPersistence:
+    """
+    Stores sessions and messages in the chat_sessions / chat_messages collections.
+
+    A session record carries the rolling summary and how many turns it covers.
+    Closing a session resets both; a reused session ID starts over with a new
+    started_at, and only messages from then on belong to it.
+    """
+
+    def __init__(self, pocketbase, page_size=SESSION_LOAD_PAGE_SIZE):
+        self.pocketbase = pocketbase
+        self.page_size = page_size
+
+    async def write(self, batch):
+        pb = self.pocketbase
+        for kind, session_id, payload in batch:
+            record_id = pocketbase_record_id(session_id)
+            path = f"/api/collections/chat_sessions/records/{record_id}"
+            if kind == "close":
+                # Stamped when the session was cleared, so it orders against turns recorded since
+                response = await pb.request("PATCH", path, json={
+                    "status": "closed", "last_active": payload or _now_iso(), "summary": "", "summarized_turns": 0
+                })
+                if not response.is_success and response.status_code != 404:
+                    response.raise_for_status()
+                continue
+            if kind == "summary":
+                summary, summarized_turns = payload
+                response = await pb.request("PATCH", path, json={
+                    "summary": summary, "summarized_turns": summarized_turns
+                })
+                # 404: the session's turns were never stored, so there is nothing to summarize
+                if not response.is_success and response.status_code != 404:
+                    response.raise_for_status()
+                continue
+            turn_id, exporter_id, started_at, last_active, user_text, assistant_text = payload
+            session_record = {"exporter_id": exporter_id or "", "started_at": started_at,
+                              "last_active": last_active, "status": "active"}
+            response = await pb.request("PATCH", path, json=session_record)
+            if response.status_code == 404:
+                response = await pb.request("POST", "/api/collections/chat_sessions/records", json={
+                    "id": record_id, "session_id": session_id, **session_record
+                })
+            if not response.is_success:
+                response.raise_for_status()
+            for role, content in (("user", user_text), ("assistant", assistant_text)):
+                message_id = f"{turn_id}-{role}"
+                response = await pb.request("POST", "/api/collections/chat_messages/records", json={
+                    "id": pocketbase_record_id(message_id),
+                    "session_id": session_id,
+                    "message_id": message_id,
+                    "role": role,
+                    "content": content,
+                    # Time the turn was recorded, not flushed, so turns sort in conversation order
+                    "timestamp": last_active
+                })
+                # 400 on retry means the message was already stored
+                if not response.is_success and response.status_code != 400:
+                    response.raise_for_status()
+
+    async def last_active(self, session_id):
+        """When a turn was last recorded for (or the close of) a session, or None if it was never stored"""
+        record_id = pocketbase_record_id(session_id)
+        response = await self.pocketbase.request("GET", f"/api/collections/chat_sessions/records/{record_id}")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json().get("last_active") or None
+
+    async def load(self, session_id):
+        """
+        Stored state of an active session: {"turns", "summary", "summarized_turns",
+        "started_at", "last_active", "exporter_id"}, or None for an unknown or closed session.
+        Only turns not yet folded into the summary are returned, newest pages first.
+        """
+        pb = self.pocketbase
+        record_id = pocketbase_record_id(session_id)
+        response = await pb.request("GET", f"/api/collections/chat_sessions/records/{record_id}")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        record = response.json()
+        if record.get("status") == "closed":
+            return None
+        started_at = record.get("started_at") or ""
+        summarized_turns = int(record.get("summarized_turns") or 0)
+
+        message_filter = f'session_id="{session_id}"'
+        if started_at:
+            message_filter += f' && timestamp>="{started_at}"'
+        # Messages come newest first and are grouped by turn (message_id is "<turn id>-<role>")
+        turns = OrderedDict()
+        wanted = None
+        page = 1
+        while wanted is None or len(turns) < wanted:
+            response = await pb.request("GET", "/api/collections/chat_messages/records", params={
+                "filter": message_filter, "sort": "-timestamp", "page": page, "perPage": self.page_size
+            })
+            response.raise_for_status()
+            body = response.json()
+            if wanted is None:
+                # Every stored turn is one user and one assistant message
+                wanted = max(int(body.get("totalItems", 0)) // 2 - summarized_turns, 0)
+            items = body.get("items", [])
+            for item in items:
+                turn_id, _, role = item.get("message_id", "").rpartition("-")
+                turns.setdefault(turn_id, {})[role] = item.get("content", "")
+            if len(items) < self.page_size:
+                break
+            page += 1
+
+        complete = [(turn["user"], turn["assistant"]) for turn in turns.values()
+                    if "user" in turn and "assistant" in turn]
+        return {
+            "turns": complete[:wanted][::-1],
+            "summary": record.get("summary") or "",
+            "summarized_turns": summarized_turns,
+            "started_at": started_at,
+            "last_active": record.get("last_active") or "",
+            "exporter_id": record.get("exporter_id") or None,
+        }
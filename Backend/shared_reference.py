@@ -0,0 +1,177 @@
+import os
+import json
+import fcntl
+import logging
+from contextlib import contextmanager
+
+from columnar_cache import write_table_file, map_table_file
+
+logger = logging.getLogger(__name__)
+
+# Directory shared by all worker processes; empty keeps reference data private to each process
+SHARED_REFERENCE_DIR = os.getenv("SHARED_REFERENCE_DIR", "")
+# How often workers check for a reference data version published by another worker
+SHARED_REFERENCE_POLL_SECONDS = float(os.getenv("SHARED_REFERENCE_POLL_SECONDS", 2))
+
+POINTER_FILE = "CURRENT.json"
+PROFILES_FILE = "profiles.json"
+LOCK_FILE = ".lock"
+# Profiles have their own lock, so a profile update never waits behind a publish
+PROFILES_LOCK_FILE = "profiles.lock"
+
+
+def _source_stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _write_json(path, value):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(value, f)
+    os.replace(temp_path, path)
+
+
+class SharedReferenceStore:
+    """
+    Reference data published once and memory-mapped read-only by every worker.
+
+    Each table version is an uncompressed Arrow file; CURRENT.json points at
+    the files making up the current version and is replaced atomically, so a
+    worker sees either the old set of tables or the complete new one. Workers
+    map the files instead of parsing the CSVs, so their DataFrames share the
+    same page cache pages. Publishing is serialized across processes with a
+    file lock; reading the pointer never takes it.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.pointer_path = os.path.join(directory, POINTER_FILE)
+
+    @contextmanager
+    def lock(self, name=LOCK_FILE):
+        """Exclusive cross-process lock (by lock file name) for read-modify-write of the shared files"""
+        with open(os.path.join(self.directory, name), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read_pointer(self):
+        """The published version: {"version", "tables": {name: {"file", "version", "source"}}}, or None"""
+        try:
+            with open(self.pointer_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _publish(self, pointer, tables, sources):
+        """Write the given tables as the next version and swap the pointer (lock held)"""
+        version = (pointer["version"] if pointer else 0) + 1
+        entries = dict(pointer["tables"]) if pointer else {}
+        for name, df in tables.items():
+            file_name = f"{name}.v{version}.arrow"
+            write_table_file(df, os.path.join(self.directory, file_name), {"table": name, "version": str(version)})
+            entries[name] = {"file": file_name, "version": version, "source": _source_stat(sources[name][0])}
+        published = {"version": version, "tables": entries}
+        _write_json(self.pointer_path, published)
+        self._prune(pointer, published)
+        logger.info(f"Published shared reference data version {version} (tables: {sorted(tables)})")
+        return published
+
+    def _prune(self, previous, current):
+        """
+        Delete table files referenced by neither the current nor the previous
+        version. Workers still mapping a deleted file keep their pages until
+        they swap to the new version.
+        """
+        keep = {entry["file"] for pointer in (previous, current) if pointer for entry in pointer["tables"].values()}
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(".arrow") and file_name not in keep:
+                try:
+                    os.unlink(os.path.join(self.directory, file_name))
+                except OSError:
+                    pass
+
+    def publish(self, tables, sources):
+        """Publish new versions of the given tables (name -> DataFrame); returns the new pointer"""
+        with self.lock():
+            return self._publish(self.read_pointer(), tables, sources)
+
+    def ensure_published(self, sources, loader):
+        """
+        Return the current pointer, first publishing any table that is missing
+        or whose source CSV changed since it was published. The first worker to
+        start parses the CSVs; the others find them already published.
+        """
+        with self.lock():
+            pointer = self.read_pointer()
+            entries = pointer["tables"] if pointer else {}
+            stale = [
+                name for name, (path, _) in sources.items()
+                if name not in entries
+                or entries[name].get("source") != _source_stat(path)
+                or not os.path.exists(os.path.join(self.directory, entries[name]["file"]))
+            ]
+            if not stale:
+                return pointer
+            tables = {name: loader(*sources[name]) for name in stale}
+            return self._publish(pointer, tables, sources)
+
+    def map_tables(self, pointer, names):
+        """Memory-map the named tables of a published version"""
+        return {name: map_table_file(os.path.join(self.directory, pointer["tables"][name]["file"]))
+                for name in names}
+
+
+class SharedProfiles:
+    """
+    Chat-created exporter profiles kept in a JSON file next to the shared
+    reference data, so a profile created through one worker is seen by all.
+    Readers re-read the file only when it was replaced since their last read.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.path = os.path.join(store.directory, PROFILES_FILE)
+        self._seen = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def changed(self):
+        """Whether another process wrote the profiles since they were last read"""
+        return self._stat() != self._seen
+
+    def read(self):
+        stat = self._stat()
+        profiles = {}
+        if stat is not None:
+            try:
+                with open(self.path) as f:
+                    profiles = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read shared exporter profiles: {str(e)}")
+        self._seen = stat
+        return profiles
+
+    @contextmanager
+    def update(self):
+        """
+        Locked read-modify-write: yields the latest profiles dict and writes it
+        back when the block exits without an error.
+        """
+        with self.store.lock(PROFILES_LOCK_FILE):
+            profiles = self.read()
+            yield profiles
+            _write_json(self.path, profiles)
+            self._seen = self._stat()
@@ -1,18 +1,41 @@
 import os
+import io
+import csv
+import tempfile
 import pandas as pd
 import json
 import time  # For synchronous sleep
 import asyncio
-import threading
-import requests
 import logging
 import anthropic
+import groq
 from anthropic.types import ContentBlock, ToolUseBlock, TextBlock
 from dotenv import load_dotenv
 from fastapi import HTTPException
 from fastapi.responses import JSONResponse
-from pocketbase import PocketBase
-from groq import Groq
+from groq import Groq, AsyncGroq
+from context import ExporterContextBuilder
+from snapshot import ReferenceDataStore
+from columnar_cache import load_cached_table
+from compliance import ComplianceIssueIndex
+from rollups import ReferenceRollups, is_aggregate_question, ROLLUPS_FOR_AGGREGATE_QUESTIONS
+from link_graph import LinkGraph, LINK_WALK_DEFAULT_DEPTH
+from fda_export import FDASpreadsheetExport
+from shared_reference import SharedReferenceStore, SharedProfiles, SHARED_REFERENCE_DIR, SHARED_REFERENCE_POLL_SECONDS
+from directory import ExporterDirectory
+from name_index import ExporterNameIndex, search_exporters
+from sessions import SessionStore, PocketBaseSessionPersistence
+from pocketbase_client import PocketBaseClient
+from pb_sync import PocketBaseSync, PB_SYNC_ON_UPLOAD
+from pb_backend import PocketBaseReferenceBackend
+from response_cache import ResponseCache, ExporterFingerprints
+from framing import coalesce_events, encode_ndjson
+from router import ModelRouter, ROUTE_CLAUDE, ROUTE_GROQ
+from resilience import CircuitBreaker, ProviderCandidate, hedged_events, wait_until_won
+from metrics import (
+    timed, record_usage, CHAT_REQUESTS, CHAT_QUEUE_SECONDS, CHAT_FIRST_TOKEN_SECONDS, CHAT_DURATION_SECONDS,
+    MODEL_STREAM_SECONDS, TOOL_SECONDS, REFERENCE_RELOADS, REFERENCE_RELOAD_SECONDS
+)
 
 # Configure logging
 logging.basicConfig(
@@ -30,59 +53,103 @@ DOCUMENTS_CSV = os.path.join(CSV_DIR, os.getenv("DOCUMENTS_CSV", "documents.csv"
 SHIPMENTS_CSV = os.path.join(CSV_DIR, os.getenv("SHIPMENTS_CSV", "shipments.csv"))
 TRACEABILITY_CSV = os.path.join(CSV_DIR, os.getenv("TRACEABILITY_CSV", "traceability_records.csv"))
 
+# Identifier-like columns that must not be parsed as numbers (e.g. HS Code "0707.10")
+TEXT_COLUMN_DTYPES = {"HS Code": str, "Batch Number": str, "Supplier ID": str}
+
+# Uploads are streamed to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+# Give up looking for the header line after this many bytes
+MAX_HEADER_BYTES = 64 * 1024
+
+class CSVValidationError(ValueError):
+    """Raised when an uploaded CSV is missing its header or required columns"""
+
+def parse_csv_header(header_line):
+    """
+    Parse a CSV header line into clean column names, unwrapping exports that
+    quote the whole record as a single field ("Document ID,""Exporter ID"",...").
+    """
+    column_names = next(csv.reader([header_line]), [])
+    if len(column_names) == 1 and ',' in column_names[0]:
+        column_names = next(csv.reader([column_names[0]]), [])
+    return [col.strip('"').strip() for col in column_names]
+
 # Set the API key and model from environment variables
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 MODEL = os.getenv("CLAUDE_MODEL", "claude-3-5-sonnet-20241022")
 
+# Connection pool for the shared async Anthropic HTTP client
+ANTHROPIC_MAX_CONNECTIONS = int(os.getenv("ANTHROPIC_MAX_CONNECTIONS", 100))
+ANTHROPIC_MAX_KEEPALIVE = int(os.getenv("ANTHROPIC_MAX_KEEPALIVE", 20))
+ANTHROPIC_TIMEOUT = float(os.getenv("ANTHROPIC_TIMEOUT", 600))
+
+# Model and output size used to summarize old conversation turns
+SESSION_SUMMARY_MODEL = os.getenv("SESSION_SUMMARY_MODEL") or MODEL
+SESSION_SUMMARY_MAX_TOKENS = int(os.getenv("SESSION_SUMMARY_MAX_TOKENS", 500))
+SESSION_PERSISTENCE = os.getenv("SESSION_PERSISTENCE", "true").lower() == "true"
+
+# Prompt cache breakpoint marker for the static prompt blocks
+CACHE_CONTROL = {"type": "ephemeral"}
+
+# Appended to the system prompt of chats routed to Groq
+GROQ_ROUTE_NOTE = ("Answer general questions about the FDA Food Traceability Rule concisely. "
+                   "If the user needs help with their own company, shipments or documents, ask them "
+                   "to share their company name or Exporter ID.")
+
+# Second Claude model to hedge/fail over to, and whether Groq is the last-resort fallback
+CLAUDE_FALLBACK_MODEL = os.getenv("CLAUDE_FALLBACK_MODEL", "")
+GROQ_FALLBACK_ENABLED = os.getenv("GROQ_FALLBACK_ENABLED", "true").lower() == "true"
+
+# Status codes worth retrying: rate limits, overload and transient server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# Model steps per query (tool calls plus the final answer)
+AGENT_MAX_STEPS = int(os.getenv("AGENT_MAX_STEPS", 5))
+
+# Where exporter-scoped reference data is read from: "memory" (the loaded CSVs)
+# or "pocketbase" (indexed queries against the synced collections)
+REFERENCE_BACKEND = os.getenv("REFERENCE_BACKEND", "memory").lower()
+
 # PocketBase and Groq utility functions
-def init_pocketbase():
-    """Initialize PocketBase connection with admin authentication"""
-    pb_url = os.getenv('POCKETBASE_URL')
-    admin_email = os.getenv('POCKETBASE_ADMIN_EMAIL')
-    admin_password = os.getenv('POCKETBASE_ADMIN_PASSWORD')
-    
-    pb = PocketBase(pb_url)
+_pocketbase_client = None
+
+def get_pocketbase_client():
+    """Return the process-wide pooled PocketBase client, or None if POCKETBASE_URL is not set"""
+    global _pocketbase_client
+    if _pocketbase_client is None and os.getenv('POCKETBASE_URL'):
+        _pocketbase_client = PocketBaseClient(
+            os.getenv('POCKETBASE_URL'),
+            os.getenv('POCKETBASE_ADMIN_EMAIL'),
+            os.getenv('POCKETBASE_ADMIN_PASSWORD')
+        )
+    return _pocketbase_client
+
+async def init_pocketbase():
+    """Return the shared PocketBase client with its admin token fetched ahead of first use"""
+    pb = get_pocketbase_client()
+    if pb is None:
+        logger.error("POCKETBASE_URL environment variable not set")
+        return None
     try:
-        pb.admins.auth_with_password(admin_email, admin_password)
-        logger.info("Successfully authenticated with PocketBase using SDK")
+        await pb.admin_token()
+        logger.info("Successfully authenticated with PocketBase")
     except Exception as e:
-        logger.error(f"Failed to authenticate with PocketBase using SDK: {str(e)}")
+        logger.error(f"Failed to authenticate with PocketBase: {str(e)}")
     return pb
 
-def setup_oauth_via_http():
-    """Set up OAuth providers for the users collection using raw HTTP requests"""
-    pb_url = "https://pb-fda-channel.operatorai.com"
-    admin_email = os.getenv('POCKETBASE_ADMIN_EMAIL')
-    admin_password = os.getenv('POCKETBASE_ADMIN_PASSWORD')
+async def setup_oauth_via_http():
+    """Set up OAuth providers for the users collection through the PocketBase API"""
+    pb = get_pocketbase_client()
     client_id = os.getenv('GOOGLE_CLIENT_ID')
     client_secret = os.getenv('GOOGLE_CLIENT_SECRET')
-    
+    if pb is None:
+        return False
+
     try:
-        # Authenticate as admin
-        auth_response = requests.post(
-            f"{pb_url}/api/collections/_superusers/auth-with-password",
-            headers={"Content-Type": "application/json", "Accept": "*/*"},
-            json={"identity": admin_email, "password": admin_password}
-        )
-        
-        if not auth_response.ok:
-            logger.error(f"Admin auth failed: {auth_response.status_code}")
-            return False
-        
-        token = auth_response.json().get('token', '')
-        if not token:
-            return False
-        
-        # Set up headers for subsequent requests
-        headers = {
-            "Authorization": token,
-            "Content-Type": "application/json",
-            "Accept": "*/*"
-        }
-        
         # Find users collection
-        collections_response = requests.get(f"{pb_url}/api/collections", headers=headers)
-        if not collections_response.ok:
+        collections_response = await pb.request("GET", "/api/collections")
+        if not collections_response.is_success:
+            logger.error(f"Listing collections failed: {collections_response.status_code}")
             return False
         
         # Find users auth collection
@@ -98,12 +165,9 @@ def setup_oauth_via_http():
         collection_id = auth_collection.get('id')
         
         # Get collection details
-        collection_response = requests.get(
-            f"{pb_url}/api/collections/{collection_id}",
-            headers=headers
-        )
+        collection_response = await pb.request("GET", f"/api/collections/{collection_id}")
         
-        if not collection_response.ok:
+        if not collection_response.is_success:
             return False
         
         collection_data = collection_response.json()
@@ -123,19 +187,15 @@ def setup_oauth_via_http():
         }
         
         # Update collection
-        update_response = requests.patch(
-            f"{pb_url}/api/collections/{collection_id}",
-            headers=headers,
-            json=collection_data
-        )
+        update_response = await pb.request("PATCH", f"/api/collections/{collection_id}", json=collection_data)
         
-        return update_response.ok
+        return update_response.is_success
         
     except Exception as e:
         logger.error(f"Error setting up OAuth: {str(e)}")
         return False
 
-def fetch_pocketbase_config():
+async def fetch_pocketbase_config():
     """Return the current PocketBase configuration."""
     try:
         config = {
@@ -145,8 +205,11 @@ def fetch_pocketbase_config():
         
         # Optionally check if the server is reachable
         try:
-            response = requests.get(f"{config['url']}/api/health", timeout=3)
-            if response.ok:
+            pb = get_pocketbase_client()
+            if pb is None:
+                raise RuntimeError("POCKETBASE_URL is not set")
+            response = await pb.health()
+            if response.is_success:
                 config["health"] = "ok"
             else:
                 config["health"] = "error"
@@ -178,20 +241,99 @@ def get_groq_model():
     """Get the configured Groq model from environment variables"""
     return os.getenv('GROQ_MODEL', 'llama3-8b-8192')
 
+def is_retryable_error(error):
+    """Transient provider failure (timeout, connection error, overload) that may succeed on retry"""
+    if isinstance(error, (anthropic.APIConnectionError, groq.APIConnectionError)):
+        return True
+    return getattr(error, "status_code", None) in RETRYABLE_STATUS_CODES
+
+_groq_async_client = None
+
+def get_groq_async_client():
+    """Return the process-wide async Groq client used for routed chats, or None without an API key"""
+    global _groq_async_client
+    if _groq_async_client is None and os.getenv('GROQ_API_KEY'):
+        # Retries are handled by the hedging layer
+        _groq_async_client = AsyncGroq(api_key=os.getenv('GROQ_API_KEY'), max_retries=0)
+    return _groq_async_client
+
+_anthropic_client = None
+
+def get_anthropic_client():
+    """
+    Return the process-wide async Anthropic client.
+
+    All chats stream through one connection-pooled HTTP client inside the
+    event loop, and it survives bot reloads on CSV upload.
+    """
+    global _anthropic_client
+    if _anthropic_client is None:
+        # Build the limits with the SDK's own Limits class so this works whichever
+        # httpx flavour the installed SDK version is built on
+        limits = type(anthropic.DEFAULT_CONNECTION_LIMITS)(
+            max_connections=ANTHROPIC_MAX_CONNECTIONS,
+            max_keepalive_connections=ANTHROPIC_MAX_KEEPALIVE
+        )
+        _anthropic_client = anthropic.AsyncAnthropic(
+            api_key=ANTHROPIC_API_KEY,
+            timeout=ANTHROPIC_TIMEOUT,
+            # Retries are handled by the hedging layer, with jitter and failover
+            max_retries=0,
+            http_client=anthropic.DefaultAsyncHttpxClient(limits=limits)
+        )
+    return _anthropic_client
+
 class FDAComplianceBot:
     def __init__(self):
-        # Initialize Anthropic client
-        self.client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+        # Shared async Anthropic client
+        self.client = get_anthropic_client()
         self.model = MODEL
 
         # Initialize exporter profiles dictionary
         self.exporter_profiles = {}
+        # Bumped whenever a profile changes, to invalidate views derived from profiles
+        self.profiles_version = 0
+        self._directory_cache = None
+        # Name index over chat-created profiles; reference data has its own per version
+        self.profile_name_index = ExporterNameIndex()
+
+        # With several worker processes, reference data is published once to a
+        # shared directory and memory-mapped by every worker, and profiles are
+        # kept next to it so all workers see the same ones
+        self.shared_reference = SharedReferenceStore(SHARED_REFERENCE_DIR) if SHARED_REFERENCE_DIR else None
+        self.shared_profiles = SharedProfiles(self.shared_reference) if self.shared_reference else None
+        self._shared_watch_task = None
+        self.sync_profiles()
+
+        # Multi-turn chat sessions, persisted write-behind to PocketBase when configured.
+        # With several workers they are written through and re-checked on each request;
+        # without PocketBase they live in one worker, which then needs sticky routing
+        persistence = None
+        if SESSION_PERSISTENCE and os.getenv('POCKETBASE_URL') and os.getenv('POCKETBASE_ADMIN_EMAIL'):
+            persistence = PocketBaseSessionPersistence(get_pocketbase_client())
+        elif self.shared_reference is not None:
+            logger.warning("Several workers without session persistence: route each session to one worker")
+        self.sessions = SessionStore(persistence=persistence, summarizer=self._summarize_history,
+                                     shared=self.shared_reference is not None)
+
+        # Sends general rule questions to Groq, everything needing data or tools to Claude
+        self.router = ModelRouter(groq_available=lambda: get_groq_async_client() is not None)
+        # Circuit breaker per provider (and Claude model), shared by all chats
+        self.breakers = {}
+
+        # First-turn answers, reused while the data they were built from is unchanged
+        self.response_cache = ResponseCache()
+
+        # Exporter-scoped records from PocketBase instead of the in-memory tables
+        self.reference_backend = None
+        if REFERENCE_BACKEND == "pocketbase" and get_pocketbase_client() is not None:
+            self.reference_backend = PocketBaseReferenceBackend(get_pocketbase_client())
 
         # Define required columns for each file type
         self.required_columns = {
-            'documents': ['ExporterId', 'DocumentId', 'Status', 'Comments'],
-            'shipments': ['ExporterId', 'ShipmentId', 'ComplianceStatus', 'ProductDescription', 'ArrivalPort'],
-            'traceability': ['ExporterId', 'RecordId', 'ComplianceFlag', 'Comments']
+            'documents': ['Exporter ID', 'Document ID', 'Status', 'Comments'],
+            'shipments': ['Exporter ID', 'Shipment ID', 'Compliance Status', 'Product Description', 'Arrival Port'],
+            'traceability': ['Exporter ID', 'Record ID', 'Compliance Flag', 'Comments']
         }
 
         print("Loading reference data...")
@@ -199,22 +341,75 @@ class FDAComplianceBot:
         # Create CSV directory if it doesn't exist
         os.makedirs(CSV_DIR, exist_ok=True)
         
-        # Load CSVs with proper column parsing
-        self.documents_df = self._load_csv_with_validation(
-            DOCUMENTS_CSV, 
-            self.required_columns['documents']
+        # Versioned reference data: each table is parsed with proper column
+        # parsing, and reloads publish a new snapshot with an atomic swap
+        self.reference_data = ReferenceDataStore(
+            {
+                'documents': (DOCUMENTS_CSV, self.required_columns['documents']),
+                'shipments': (SHIPMENTS_CSV, self.required_columns['shipments']),
+                'traceability': (TRACEABILITY_CSV, self.required_columns['traceability'])
+            },
+            self._load_csv_with_validation
         )
-        
-        self.shipments_df = self._load_csv_with_validation(
-            SHIPMENTS_CSV, 
-            self.required_columns['shipments']
+
+        # Index the reference data by exporter so each query only carries its own rows
+        self.reference_data.register(
+            'context', ('documents', 'shipments', 'traceability'),
+            lambda tables: ExporterContextBuilder(
+                tables['documents'], tables['shipments'], tables['traceability']
+            )
         )
-        
-        self.traceability_df = self._load_csv_with_validation(
-            TRACEABILITY_CSV, 
-            self.required_columns['traceability']
+        # Compliance issues per exporter, so analyze_compliance is a lookup
+        self.reference_data.register(
+            'compliance', ('documents', 'shipments', 'traceability'),
+            lambda tables: ComplianceIssueIndex(
+                tables['documents'], tables['shipments'], tables['traceability']
+            )
         )
-        
+        # Exporters listed in the reference CSVs, for /list_exporters
+        self.reference_data.register(
+            'directory', ('documents', 'shipments'),
+            lambda tables: ExporterDirectory(tables['documents'], tables['shipments'])
+        )
+        # Fuzzy exporter lookup by name, country or product
+        self.reference_data.register(
+            'names', ('documents', 'shipments', 'traceability'),
+            lambda tables: ExporterNameIndex.from_reference_data(
+                tables['documents'], tables['shipments'], tables['traceability']
+            )
+        )
+        # Status counts by exporter, product, port, carrier and month, for aggregate questions
+        self.reference_data.register(
+            'rollups', ('documents', 'shipments', 'traceability'),
+            lambda tables: ReferenceRollups(
+                tables['documents'], tables['shipments'], tables['traceability']
+            )
+        )
+        # Document -> shipment -> traceability record -> lot/batch/supplier links, with dangling references
+        self.reference_data.register(
+            'links', ('documents', 'shipments', 'traceability'),
+            lambda tables: LinkGraph(
+                tables['documents'], tables['shipments'], tables['traceability']
+            )
+        )
+        # Per-exporter content hashes, to validate and invalidate cached responses
+        self.reference_data.register(
+            'fingerprints', ('documents', 'shipments', 'traceability'),
+            lambda tables: ExporterFingerprints(
+                tables['documents'], tables['shipments'], tables['traceability']
+            )
+        )
+        with timed(REFERENCE_RELOAD_SECONDS):
+            if self.shared_reference is None:
+                self.reference_data.load()
+            else:
+                # The first worker to start parses and publishes; the rest map what it published
+                self._apply_shared_reference(self.shared_reference.ensure_published(
+                    self.reference_data.sources, self._load_csv_with_validation
+                ))
+        for table in self.reference_data.sources:
+            REFERENCE_RELOADS.inc(table=table)
+
         print("Reference data loaded successfully")
         print(f"Documents DataFrame columns: {list(self.documents_df.columns)}")
         print(f"Shipments DataFrame columns: {list(self.shipments_df.columns)}")
@@ -280,55 +475,212 @@ class FDAComplianceBot:
                     },
                     "required": ["exporter_id"]
                 }
+            },
+            {
+                "name": "find_exporter",
+                "description": "Find exporters by name or description (company name, country, product) and return ranked Exporter ID candidates",
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "query": {
+                            "type": "string",
+                            "description": "Free-text description of the exporter (e.g. \"the Italian carrot company\")"
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "description": "Maximum number of candidates to return (default 5)"
+                        }
+                    },
+                    "required": ["query"]
+                }
+            },
+            {
+                "name": "trace_links",
+                "description": "Walk the links between documents, shipments, traceability records and their lots, batches and suppliers, returning everything connected to an ID (e.g. S-1002, DOC-1001, TR-0003 or a lot number) and any links to records that do not exist",
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "record_id": {
+                            "type": "string",
+                            "description": "Document ID, Shipment ID, traceability Record ID, Lot Number, Batch Number or Supplier ID to start from"
+                        },
+                        "max_depth": {
+                            "type": "integer",
+                            "description": f"Number of link hops to follow (default {LINK_WALK_DEFAULT_DEPTH})"
+                        }
+                    },
+                    "required": ["record_id"]
+                }
             }
         ]
 
+        # Tool name -> async handler returning (tool_result payload, frames to emit)
+        self.tool_handlers = {
+            "collect_exporter_info": self._tool_collect_exporter_info,
+            "analyze_compliance": self._tool_analyze_compliance,
+            "find_exporter": self._tool_find_exporter,
+            "trace_links": self._tool_trace_links
+        }
+
+        # Tools sit at the front of the cached prefix; a breakpoint on the last
+        # definition lets every request reuse them
+        self.cached_tools = self.tools[:-1] + [dict(self.tools[-1], cache_control=CACHE_CONTROL)]
+
     def _load_csv_with_validation(self, file_path, required_columns):
         """
-        Load CSV file with proper parsing of quoted column names and validation.
+        Load a reference table, from its columnar cache when the CSV is unchanged,
+        and validate its columns.
         """
         try:
-            # First read the header line to properly parse column names
-            with open(file_path, 'r') as f:
-                header_line = f.readline().strip()
-                
-            # Split the header properly considering quotes
-            import csv
-            header_reader = csv.reader([header_line])
-            column_names = next(header_reader)
-            
-            # Clean up column names (remove quotes and whitespace)
-            column_names = [col.strip('"').strip() for col in column_names]
-            
-            # Read the CSV with the cleaned column names
-            df = pd.read_csv(file_path, names=column_names, skiprows=1)
-            
-            # Check for required columns
-            missing_columns = [col for col in required_columns if col not in column_names]
-            if missing_columns:
-                print(f"\nWarning: Missing required columns in {os.path.basename(file_path)}: {missing_columns}")
-                print(f"Available columns: {column_names}")
-            
-            return df
-        
+            df = load_cached_table(file_path, lambda: self._parse_csv(file_path))
         except Exception as e:
             print(f"Error loading {file_path}: {str(e)}")
             return pd.DataFrame()
 
-    def create_system_prompt(self):
-        """Create a system prompt for Claude"""
-        documents_text = ""
-        shipments_text = ""
-        traceability_text = ""
+        # Check for required columns
+        column_names = list(df.columns)
+        missing_columns = [col for col in required_columns if col not in column_names]
+        if missing_columns:
+            print(f"\nWarning: Missing required columns in {os.path.basename(file_path)}: {missing_columns}")
+            print(f"Available columns: {column_names}")
+
+        return df
+
+    def _parse_csv(self, file_path):
+        """
+        Parse a CSV file with proper handling of quoted column names.
+        """
+        with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+            header_line = f.readline()
+            f.seek(0)
+            text = f.read() if len(next(csv.reader([header_line]), [])) == 1 and ',' in header_line else None
 
-        if not self.documents_df.empty:
-            documents_text = "DOCUMENT RECORDS:\n" + self.documents_df.to_string(index=False)
-        if not self.shipments_df.empty:
-            shipments_text = "SHIPMENT RECORDS:\n" + self.shipments_df.to_string(index=False)
-        if not self.traceability_df.empty:
-            traceability_text = "TRACEABILITY RECORDS:\n" + self.traceability_df.to_string(index=False)
+        if text is not None:
+            # Some exports wrap every record in a single quoted field
+            # ("DOC-1001,""EX001"",..."), so unwrap once before parsing
+            wrapped = pd.read_csv(io.StringIO(text), header=None, dtype=str, keep_default_na=False)
+            df = pd.read_csv(io.StringIO("\n".join(wrapped[0])), dtype=TEXT_COLUMN_DTYPES)
+        else:
+            df = pd.read_csv(file_path, encoding='utf-8-sig', dtype=TEXT_COLUMN_DTYPES)
+
+        # Clean up column names (remove quotes and whitespace)
+        df.columns = [str(col).strip('"').strip() for col in df.columns]
+        return df
+
+    @property
+    def documents_df(self):
+        return self.reference_data.current.documents_df
+
+    @property
+    def shipments_df(self):
+        return self.reference_data.current.shipments_df
+
+    @property
+    def traceability_df(self):
+        return self.reference_data.current.traceability_df
+
+    @property
+    def context_builder(self):
+        return self.reference_data.current.get('context')
+
+    def reload_reference_data(self, tables):
+        """Re-parse the given tables and publish a new reference data snapshot"""
+        with timed(REFERENCE_RELOAD_SECONDS):
+            if self.shared_reference is None:
+                snapshot = self.reference_data.reload(tables)
+            else:
+                # Publish for every worker, then map the published files like they do
+                parsed = {table: self._load_csv_with_validation(*self.reference_data.sources[table])
+                          for table in tables}
+                snapshot = self._apply_shared_reference(
+                    self.shared_reference.publish(parsed, self.reference_data.sources)
+                )
+        for table in tables:
+            REFERENCE_RELOADS.inc(table=table)
+        return snapshot
+
+    def _apply_shared_reference(self, pointer):
+        """Map the tables of a shared version that changed since the current snapshot and publish it here"""
+        current = self.reference_data.current
+        changed = [
+            name for name, entry in pointer["tables"].items()
+            if name in self.reference_data.sources
+            and (current is None or entry["version"] > current.table_versions.get(name, 0))
+        ]
+        return self.reference_data.reload(
+            changed, loaded=self.shared_reference.map_tables(pointer, changed), version=pointer["version"]
+        )
+
+    def sync_shared_reference(self):
+        """Pick up a reference data version published by another worker; returns the new snapshot or None"""
+        pointer = self.shared_reference.read_pointer()
+        previous = self.reference_data.current
+        if pointer is None or pointer["version"] <= previous.version:
+            return None
+        with timed(REFERENCE_RELOAD_SECONDS):
+            snapshot = self._apply_shared_reference(pointer)
+        for table, version in snapshot.table_versions.items():
+            if version > previous.table_versions.get(table, 0):
+                REFERENCE_RELOADS.inc(table=table)
+        self.invalidate_responses(previous, snapshot)
+        if self.reference_backend is not None:
+            self.reference_backend.invalidate()
+        logger.info(f"Picked up shared reference data version {snapshot.version}")
+        return snapshot
+
+    def start_shared_reference_watch(self):
+        """Poll for versions published by other workers (call from the running event loop)"""
+        if self.shared_reference is not None and self._shared_watch_task is None:
+            self._shared_watch_task = asyncio.get_running_loop().create_task(self._watch_shared_reference())
+
+    async def stop_shared_reference_watch(self):
+        if self._shared_watch_task:
+            self._shared_watch_task.cancel()
+            self._shared_watch_task = None
 
-        self.system_prompt = f"""You are an intelligent FDA Food Traceability Compliance Assistant for exporters shipping food to the United States.
+    async def _watch_shared_reference(self):
+        while True:
+            await asyncio.sleep(SHARED_REFERENCE_POLL_SECONDS)
+            try:
+                await asyncio.to_thread(self.sync_shared_reference)
+            except Exception as e:
+                logger.error(f"Picking up shared reference data failed: {str(e)}")
+
+    def sync_profiles(self):
+        """Re-read profiles if another worker changed them (multi-worker mode; a stat when unchanged)"""
+        if self.shared_profiles is not None and self.shared_profiles.changed():
+            self._set_profiles(self.shared_profiles.read())
+
+    def _set_profiles(self, profiles):
+        self.exporter_profiles = profiles
+        self.profiles_version += 1
+        self.profile_name_index = ExporterNameIndex()
+        for profile in profiles.values():
+            self.profile_name_index.add_profile(profile)
+
+    def _cache_fingerprint(self, exporter_id, snapshot):
+        """
+        Version of everything a cached answer for exporter_id depends on: the
+        exporter's reference rows (or all rows for summary answers) and profiles.
+        """
+        scoped, data_fingerprint = snapshot.get('fingerprints').for_exporter(exporter_id)
+        if exporter_id in self.exporter_profiles:
+            profile_fingerprint = json.dumps(self.exporter_profiles[exporter_id], sort_keys=True, default=str)
+        else:
+            profile_fingerprint = self.profiles_version
+        return scoped, data_fingerprint, profile_fingerprint
+
+    def invalidate_responses(self, previous, snapshot):
+        """Drop cached responses whose data changed between two snapshots"""
+        before, after = previous.get('fingerprints'), snapshot.get('fingerprints')
+        changed = after.changed_exporters(before)
+        if changed or before.overall != after.overall:
+            return self.response_cache.invalidate_exporters(changed)
+        return 0
+
+    def create_system_prompt(self):
+        """Create a system prompt for Claude"""
+        self.system_prompt_preamble = """You are an intelligent FDA Food Traceability Compliance Assistant for exporters shipping food to the United States.
 
 Your purpose is to help exporters understand and comply with the FDA Food Traceability Final Rule. You should provide clear, accurate information about the rule's requirements, applicability, and implementation.
 
@@ -356,30 +708,98 @@ Common foods on the Food Traceability List (FTL):
 - Fresh, frozen, or smoked molluscan shellfish
 - Ready-to-eat deli salads
 - Soft/semi-soft cheeses
-- Fresh soft cheeses
-
-{documents_text}
-
-{shipments_text}
-
-{traceability_text}
+- Fresh soft cheeses"""
 
+        self.system_prompt_instructions = """
 When responding to exporters:
 1. If you don't have enough information about the exporter, use the collect_exporter_info function to gather necessary details.
 2. Provide specific recommendations tailored to their product type, operation size, and technical capabilities.
 3. Use clear, simple language to explain requirements.
 4. Always cite the specific part of the FDA rule that applies to their situation.
 5. If asked to analyze compliance, use the analyze_compliance function.
+6. If an exporter is referred to by name or description instead of an Exporter ID, use the find_exporter function to resolve it.
 
 Never make up information about FDA requirements - if you're unsure, acknowledge the limitation and suggest the exporter consult the official FDA resources.
 """
 
+        # Static FDA rules and instructions, identical for every request
+        self.system_prompt_rules = f"{self.system_prompt_preamble}\n{self.system_prompt_instructions}"
+
+    @property
+    def system_prompt(self):
+        """Default prompt (aggregate summaries only) for callers without an exporter"""
+        return self.build_system_prompt()
+
+    def build_system_prompt(self, exporter_id=None, snapshot=None):
+        """Assemble the system prompt with reference data scoped to one exporter"""
+        snapshot = snapshot or self.reference_data.current
+        reference_data = snapshot.get('context').build(exporter_id)
+        return f"{self.system_prompt_rules}\n\n{reference_data}"
+
+    def build_system_blocks(self, exporter_id=None, snapshot=None, aggregate=False):
+        """
+        System prompt as cacheable blocks: the static rules first, then the
+        reference data for this data version and exporter. Each block ends in a
+        cache breakpoint so follow-up streams and repeated queries hit the cache.
+        Aggregate questions get the exporter's rollups after its rows, or the
+        overall rollups instead of the all-exporter summary.
+        """
+        snapshot = snapshot or self.reference_data.current
+        rollups = snapshot.get('rollups') if aggregate else None
+        if rollups is not None and exporter_id in rollups.exporter_ids:
+            reference_data = snapshot.get('context').build(exporter_id) + "\n\n" + rollups.render(exporter_id)
+        elif rollups is not None:
+            reference_data = rollups.render(None)
+        else:
+            reference_data = snapshot.get('context').build(exporter_id)
+        return [
+            {"type": "text", "text": self.system_prompt_rules, "cache_control": CACHE_CONTROL},
+            {"type": "text", "text": reference_data, "cache_control": CACHE_CONTROL},
+        ]
+
+    @staticmethod
+    def _add_usage(totals, message):
+        """Accumulate token usage (including prompt cache counters) from a finished stream"""
+        usage = getattr(message, "usage", None)
+        if usage is None:
+            return
+        for field in ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"):
+            totals[field] = totals.get(field, 0) + (getattr(usage, field, None) or 0)
+
     def collect_exporter_info(self, exporter_id=None, exporter_name=None, country_of_origin=None,
                               industry_focus=None, operation_size=None, tech_level=None,
                               export_frequency=None, shipping_modalities=None):
         """Store exporter information provided by function calling"""
+        fields = dict(exporter_id=exporter_id, exporter_name=exporter_name, country_of_origin=country_of_origin,
+                      industry_focus=industry_focus, operation_size=operation_size, tech_level=tech_level,
+                      export_frequency=export_frequency, shipping_modalities=shipping_modalities)
+        if self.shared_profiles is not None:
+            profiles, exporter_profile = self._update_shared_profiles(fields)
+            self._set_profiles(profiles)
+            return exporter_profile
+        exporter_profile = self._add_profile(self.exporter_profiles, **fields)
+        if exporter_profile.get("status") != "incomplete":
+            self.profiles_version += 1
+            self.profile_name_index.add_profile(exporter_profile)
+        return exporter_profile
+
+    def _update_shared_profiles(self, fields):
+        """
+        Add a profile to the shared file under its cross-worker lock, so two
+        workers never hand out the same ID. Blocks on the lock and file I/O, so
+        async callers run it in a thread. Returns (all profiles, the new profile).
+        """
+        with self.shared_profiles.update() as profiles:
+            exporter_profile = self._add_profile(profiles, **fields)
+        return profiles, exporter_profile
+
+    @staticmethod
+    def _add_profile(profiles, exporter_id=None, exporter_name=None, country_of_origin=None,
+                     industry_focus=None, operation_size=None, tech_level=None,
+                     export_frequency=None, shipping_modalities=None):
+        """Add a profile to profiles (assigning the next Exporter ID if none is given) and return it"""
         if not exporter_id:
-            existing_ids = self.exporter_profiles.keys()
+            existing_ids = profiles.keys()
             if existing_ids:
                 last_id_num = max([int(eid.replace("EX", "")) for eid in existing_ids])
                 exporter_id = f"EX{last_id_num + 1:03d}"
@@ -394,7 +814,7 @@ Never make up information about FDA requirements - if you're unsure, acknowledge
                 "message": "Insufficient information to create profile"
             }
 
-        self.exporter_profiles[exporter_id] = {
+        profiles[exporter_id] = {
             "Exporter ID": exporter_id,
             "Exporter Name": exporter_name or "Unknown",
             "Country of Origin": country_of_origin or "Unknown",
@@ -404,7 +824,7 @@ Never make up information about FDA requirements - if you're unsure, acknowledge
             "Export Frequency": export_frequency or "Not specified",
             "Shipping Modalities": shipping_modalities or "Not specified"
         }
-        return self.exporter_profiles[exporter_id]
+        return profiles[exporter_id]
 
     def get_active_exporter_id(self, exporter_id=None):
         """Get active exporter ID or check if provided ID exists"""
@@ -414,277 +834,438 @@ Never make up information about FDA requirements - if you're unsure, acknowledge
             return list(self.exporter_profiles.keys())[0]
         return None
 
+    def find_exporters(self, query, limit=5, snapshot=None):
+        """Ranked exporter candidates for a name or description"""
+        snapshot = snapshot or self.reference_data.current
+        self.sync_profiles()
+        return search_exporters([snapshot.get('names'), self.profile_name_index], query, limit)
+
     def find_exporter_by_name(self, name):
         """Find an exporter by partial name match"""
         if not name:
             return None
-        name_lower = name.lower()
-        for exporter_id, profile in self.exporter_profiles.items():
-            if name_lower in profile.get("Exporter Name", "").lower():
-                return exporter_id
-        # Also search in reference data if available
-        if not self.documents_df.empty:
-            for _, row in self.documents_df.iterrows():
-                if name_lower in str(row.get("Exporter Name", "")).lower():
-                    return row.get("Exporter ID")
-        if not self.shipments_df.empty:
-            for _, row in self.shipments_df.iterrows():
-                if name_lower in str(row.get("Exporter Name", "")).lower():
-                    return row.get("Exporter ID")
-        return None
+        candidates = self.find_exporters(name, limit=1)
+        return candidates[0]["exporter_id"] if candidates else None
 
-    def _process_query_sync(self, query, exporter_id=None):
+    async def _summarize_history(self, previous_summary, turns):
+        """Summarize old conversation turns (folding in the previous summary) for compaction"""
+        transcript = "\n\n".join(f"User: {user}\nAssistant: {assistant}" for user, assistant in turns)
+        response = await self.client.messages.create(
+            model=SESSION_SUMMARY_MODEL,
+            max_tokens=SESSION_SUMMARY_MAX_TOKENS,
+            system="Summarize this conversation between an exporter and an FDA compliance assistant. "
+                   "Keep exporter IDs, products, shipment/record IDs, open questions and any advice given. "
+                   "Be concise.",
+            messages=[{
+                "role": "user",
+                "content": f"Earlier summary:\n{previous_summary or '(none)'}\n\nConversation:\n{transcript}"
+            }]
+        )
+        return "".join(block.text for block in response.content if block.type == "text")
+
+    async def _process_query_stream(self, query, exporter_id=None, session_id=None, trace=None):
         """
-        Synchronous generator implementing the tool calling flow with structured message types.
+        Async generator implementing the tool calling flow with structured message types.
+        Yields raw event dicts (one content event per text delta); see stream_events.
+        The exporter and route of the query are recorded into trace for metrics.
         """
+        trace = {} if trace is None else trace
+        # Pin the reference data version for the whole chat
+        snapshot = self.reference_data.current
+
+        session = None
+        if self.sessions.valid_session_id(session_id):
+            session = await self.sessions.get(session_id, exporter_id)
+            exporter_id = exporter_id or session.exporter_id
+
         active_exporter_id = self.get_active_exporter_id(exporter_id)
-        messages = [{"role": "user", "content": query}]
+        context_exporter_id = active_exporter_id or exporter_id
+        trace["exporter_id"] = context_exporter_id
+        history = self.sessions.history_messages(session) if session else []
+        messages = history + [{"role": "user", "content": query}]
 
-        # Start with info message type
-        yield json.dumps({"type": "metadata", "message_type": "info"}) + "\n"
+        # Only first turns are cached: later answers depend on the conversation
+        cache_key = None
+        if not history:
+            cache_key = (query, context_exporter_id, self._cache_fingerprint(context_exporter_id, snapshot))
+            cached = self.response_cache.get(*cache_key)
+            if cached is not None:
+                frames, answer_text = cached
+                for frame in frames:
+                    yield frame
+                trace["route"] = "cache"
+                yield {"type": "usage", "response_cache_hit": True}
+                if session:
+                    self.sessions.record_turn(session, query, answer_text)
+                return
+
+        # Built after the cache check, since a scoped snapshot may need a PocketBase query;
+        # scoped snapshots keep the pinned snapshot's rollups
+        aggregate = ROLLUPS_FOR_AGGREGATE_QUESTIONS and is_aggregate_question(query)
+        prompt_snapshot = await self.exporter_snapshot(context_exporter_id, snapshot)
+        system_prompt = self.build_system_blocks(context_exporter_id, prompt_snapshot, aggregate)
+        if session and session.summary:
+            # After the cached blocks, so compaction does not invalidate them
+            system_prompt = system_prompt + [{
+                "type": "text",
+                "text": f"Summary of the earlier conversation with this user:\n{session.summary}"
+            }]
 
+        turn = {"answer_parts": [], "usage": {}, "cacheable": cache_key is not None}
+        route, reason = self.router.route(query, context_exporter_id)
+        logger.debug(f"Routing query to {route} ({reason})")
+        candidates = self._provider_candidates(route, system_prompt, messages, snapshot, context_exporter_id)
+
+        frames = []
         try:
-            with self.client.messages.stream(
-                model=self.model,
+            async for frame in self.router.track(route, hedged_events(candidates, turn), turn):
+                frames.append(frame)
+                yield frame
+        except Exception as e:
+            turn["cacheable"] = False
+            print(f"Error in _process_query_stream: {e}", flush=True)
+            yield {"type": "metadata", "message_type": "error"}
+            yield {"type": "content", "text": f"Error processing request: {str(e)}"}
+        route = turn.get("route", route)
+        trace["route"] = route
+        usage = turn["usage"]
+        answer_text = "".join(turn["answer_parts"])
+
+        if turn["cacheable"] and answer_text:
+            self.response_cache.put(*cache_key, frames, answer_text)
+
+        if session:
+            self.sessions.record_turn(session, query, answer_text)
+
+        if usage:
+            # Per-request token usage, including prompt cache reads/writes
+            logger.info(f"Token usage for query (exporter {exporter_id}, route {route}): {usage}")
+            yield {"type": "usage", "route": route, **usage}
+
+    def _provider_candidates(self, route, system_prompt, messages, snapshot, exporter_id=None):
+        """
+        Providers to try for a query, in order: the routed one first, then the
+        fallback Claude model (if configured) and the other provider.
+        """
+        def claude(model):
+            return ProviderCandidate(
+                f"anthropic:{model}", ROUTE_CLAUDE, self._breaker(f"anthropic:{model}"),
+                lambda turn: self._run_model_turns(system_prompt, messages, snapshot, turn, model, exporter_id),
+                is_retryable_error
+            )
+
+        groq = None
+        if get_groq_async_client() is not None:
+            groq = ProviderCandidate(
+                "groq", ROUTE_GROQ, self._breaker("groq"),
+                lambda turn: self._run_groq_turn(messages, turn),
+                is_retryable_error
+            )
+
+        if route == ROUTE_GROQ:
+            return [groq, claude(self.model)]
+        candidates = [claude(self.model)]
+        if CLAUDE_FALLBACK_MODEL and CLAUDE_FALLBACK_MODEL != self.model:
+            candidates.append(claude(CLAUDE_FALLBACK_MODEL))
+        if groq and GROQ_FALLBACK_ENABLED:
+            candidates.append(groq)
+        return candidates
+
+    def _breaker(self, name):
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(name)
+        return self.breakers[name]
+
+    async def _run_groq_turn(self, messages, turn):
+        """
+        Stream a general rule question from the Groq model. No reference data or
+        tools are sent; the router only sends questions that need neither.
+        """
+        yield {"type": "metadata", "message_type": "info"}
+        model = get_groq_model()
+        with timed(MODEL_STREAM_SECONDS, provider="groq", model=model):
+            stream = await get_groq_async_client().chat.completions.create(
+                model=model,
+                messages=[{"role": "system", "content": f"{self.system_prompt_preamble}\n\n{GROQ_ROUTE_NOTE}"}]
+                + messages,
                 max_tokens=2000,
-                system=self.system_prompt,
-                messages=messages,
-                tools=self.tools
-            ) as stream:
-                found_tool_use = False
-                tool_block = None
-                full_text = ""
-                current_message_type = "info"
-
-                for chunk in stream:
-                    if chunk.type == "content_block_delta" and hasattr(chunk, "delta"):
-                        if chunk.delta.type == "text_delta" and hasattr(chunk.delta, "text"):
-                            text = chunk.delta.text
-                            print(text, end="", flush=True)
-                            full_text += text
-                            yield json.dumps({"type": "content", "text": text}) + "\n"
-
-                    elif chunk.type == "content_block_start":
-                        if hasattr(chunk, "content_block") and chunk.content_block.type == "tool_use":
-                            found_tool_use = True
-                            tool_block = chunk.content_block
-                            
-                            # Signal tool use is starting
-                            yield json.dumps({
-                                "type": "metadata", 
-                                "message_type": "tool_use",
-                                "tool": tool_block.name
-                            }) + "\n"
-
-                if found_tool_use and tool_block:
-                    tool_name = tool_block.name
-                    tool_id = tool_block.id
-                    tool_input = tool_block.input
-
-                    if tool_name == "collect_exporter_info":
-                        # Create new section for tool usage
-                        yield json.dumps({
-                            "type": "metadata",
-                            "message_type": "tool_use",
-                            "tool": "collect_exporter_info"
-                        }) + "\n"
-                        yield json.dumps({
-                            "type": "content",
-                            "text": f"Collecting information about exporter...\n"
-                        }) + "\n"
-
-                        exporter_profile = self.collect_exporter_info(
-                            exporter_id=tool_input.get("exporter_id"),
-                            exporter_name=tool_input.get("exporter_name"),
-                            country_of_origin=tool_input.get("country_of_origin"),
-                            industry_focus=tool_input.get("industry_focus"),
-                            operation_size=tool_input.get("operation_size"),
-                            tech_level=tool_input.get("tech_level"),
-                            export_frequency=tool_input.get("export_frequency"),
-                            shipping_modalities=tool_input.get("shipping_modalities")
-                        )
-
-                        # Signal profile creation result
-                        if exporter_profile.get("status") == "incomplete":
-                            yield json.dumps({
-                                "type": "metadata",
-                                "message_type": "warning"
-                            }) + "\n"
-                        else:
-                            yield json.dumps({
-                                "type": "metadata",
-                                "message_type": "profile_created",
-                                "exporter_id": exporter_profile["Exporter ID"],
-                                "exporter_name": exporter_profile.get("Exporter Name", "Unknown")
-                            }) + "\n"
-
-                        # Continue with follow-up stream
-                        with self.client.messages.stream(
-                            model=self.model,
-                            max_tokens=2000,
-                            system=self.system_prompt,
-                            messages=messages + [
-                                {
-                                    "role": "assistant",
-                                    "content": [{
-                                        "type": "tool_use",
-                                        "id": tool_id,
-                                        "name": tool_name,
-                                        "input": tool_input
-                                    }]
-                                },
-                                {
-                                    "role": "user",
-                                    "content": [{
-                                        "type": "tool_result",
-                                        "tool_use_id": tool_id,
-                                        "content": json.dumps(exporter_profile)
-                                    }]
-                                }
-                            ]
-                        ) as follow_up_stream:
-                            # Reset message type for follow-up
-                            yield json.dumps({"type": "metadata", "message_type": "info"}) + "\n"
-                            
-                            for chunk in follow_up_stream:
-                                if chunk.type == "content_block_delta" and hasattr(chunk, "delta"):
-                                    if chunk.delta.type == "text_delta" and hasattr(chunk.delta, "text"):
-                                        text = chunk.delta.text
-                                        print(text, end="", flush=True)
-                                        yield json.dumps({"type": "content", "text": text}) + "\n"
-
-                    elif tool_name == "analyze_compliance":
-                        # Signal compliance analysis is starting
-                        yield json.dumps({
-                            "type": "metadata",
-                            "message_type": "compliance_analysis",
-                            "exporter_id": tool_input.get("exporter_id")
-                        }) + "\n"
-
-                        analysis = self.analyze_compliance(tool_input.get("exporter_id"))
-                        
-                        # Continue with compliance analysis stream
-                        with self.client.messages.stream(
-                            model=self.model,
-                            max_tokens=2000,
-                            system=self.system_prompt,
-                            messages=messages + [
-                                {
-                                    "role": "assistant",
-                                    "content": [{
-                                        "type": "tool_use",
-                                        "id": tool_id,
-                                        "name": tool_name,
-                                        "input": tool_input
-                                    }]
-                                },
-                                {
-                                    "role": "user",
-                                    "content": [{
-                                        "type": "tool_result",
-                                        "tool_use_id": tool_id,
-                                        "content": json.dumps({"analysis": analysis})
-                                    }]
+                stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    text = chunk.choices[0].delta.content
+                    turn["answer_parts"].append(text)
+                    yield {"type": "content", "text": text}
+                # Token usage arrives on the last chunk
+                usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+                if usage:
+                    turn["usage"]["input_tokens"] = turn["usage"].get("input_tokens", 0) + usage.prompt_tokens
+                    turn["usage"]["output_tokens"] = turn["usage"].get("output_tokens", 0) + usage.completion_tokens
+
+    async def _run_model_turns(self, system_prompt, messages, snapshot, turn, model=None, exporter_id=None):
+        """
+        Stream the model's answer as event dicts, running tool calls between
+        model steps, and collect answer text, token usage and cacheability into turn.
+        Provider errors propagate to the caller, which retries or fails over.
+
+        Every tool_use block of a step is executed (independent tools concurrently)
+        and all results go back in a single follow-up. The loop ends when the model
+        stops asking for tools; the last allowed step is forced to answer in text.
+        """
+        # Start with info message type
+        yield {"type": "metadata", "message_type": "info"}
+
+        messages = list(messages)
+        for step in range(AGENT_MAX_STEPS):
+            request = {
+                "model": model or self.model,
+                "max_tokens": 2000,
+                "system": system_prompt,
+                "messages": messages,
+                "tools": self.cached_tools
+            }
+            if step == AGENT_MAX_STEPS - 1:
+                request["tool_choice"] = {"type": "none"}
+
+            with timed(MODEL_STREAM_SECONDS, provider="anthropic", model=request["model"]):
+                async with self.client.messages.stream(**request) as stream:
+                    async for chunk in stream:
+                        if chunk.type == "content_block_delta" and hasattr(chunk, "delta"):
+                            if chunk.delta.type == "text_delta" and hasattr(chunk.delta, "text"):
+                                text = chunk.delta.text
+                                turn["answer_parts"].append(text)
+                                yield {"type": "content", "text": text}
+
+                        elif chunk.type == "content_block_start":
+                            if hasattr(chunk, "content_block") and chunk.content_block.type == "tool_use":
+                                # Signal tool use is starting
+                                yield {
+                                    "type": "metadata",
+                                    "message_type": "tool_use",
+                                    "tool": chunk.content_block.name
                                 }
-                            ]
-                        ) as follow_up_stream:
-                            # Set message type for compliance results
-                            yield json.dumps({"type": "metadata", "message_type": "compliance"}) + "\n"
-                            
-                            for chunk in follow_up_stream:
-                                if chunk.type == "content_block_delta" and hasattr(chunk, "delta"):
-                                    if chunk.delta.type == "text_delta" and hasattr(chunk.delta, "text"):
-                                        text = chunk.delta.text
-                                        print(text, end="", flush=True)
-                                        yield json.dumps({"type": "content", "text": text}) + "\n"
 
+                    # Start events carry empty tool inputs; the final message has them complete
+                    final_message = await stream.get_final_message()
+            self._add_usage(turn["usage"], final_message)
+
+            tool_blocks = [block for block in final_message.content if block.type == "tool_use"]
+            if final_message.stop_reason != "tool_use" or not tool_blocks:
+                break
+
+            # A hedged candidate runs tools only once it has won, never as a losing duplicate
+            await wait_until_won(turn)
+            for block in tool_blocks:
+                for frame in self._tool_start_frames(block, turn, exporter_id):
+                    yield frame
+
+            results = await asyncio.gather(
+                *(self._execute_tool(block, snapshot) for block in tool_blocks)
+            )
+
+            tool_results = []
+            for block, (content, frames, is_error) in zip(tool_blocks, results):
+                for frame in frames:
+                    yield frame
+                tool_result = {"type": "tool_result", "tool_use_id": block.id, "content": content}
+                if is_error:
+                    tool_result["is_error"] = True
+                tool_results.append(tool_result)
+
+            messages = messages + [
+                {"role": "assistant", "content": self._assistant_content(final_message)},
+                {"role": "user", "content": tool_results}
+            ]
+
+            # Compliance results get their own section in the UI
+            message_type = "compliance" if any(
+                block.name == "analyze_compliance" for block in tool_blocks
+            ) else "info"
+            yield {"type": "metadata", "message_type": message_type}
+
+    @staticmethod
+    def _assistant_content(message):
+        """Replayable content blocks of an assistant message (text and tool calls)"""
+        content = []
+        for block in message.content:
+            if block.type == "text" and block.text:
+                content.append({"type": "text", "text": block.text})
+            elif block.type == "tool_use":
+                content.append({"type": "tool_use", "id": block.id, "name": block.name, "input": block.input})
+        return content
+
+    @staticmethod
+    def _tool_within_cache_key(block, exporter_id):
+        """
+        Whether a tool call only reads data the cache fingerprint of a query with
+        context exporter_id covers. With a context exporter the fingerprint covers
+        that exporter's rows and profile alone; without one it covers all
+        reference data and profiles.
+        """
+        if block.name == "collect_exporter_info":
+            # Creates a profile, so the answer must not be replayed from cache
+            return False
+        if exporter_id is None:
+            return True
+        if block.name == "analyze_compliance":
+            return (block.input or {}).get("exporter_id") == exporter_id
+        # find_exporter and trace_links read across exporters
+        return False
+
+    def _tool_start_frames(self, block, turn, exporter_id=None):
+        """Frames announcing a tool call before it runs (exporter_id is the query's context exporter)"""
+        if not self._tool_within_cache_key(block, exporter_id):
+            turn["cacheable"] = False
+        if block.name == "collect_exporter_info":
+            # Create new section for tool usage
+            yield {
+                "type": "metadata",
+                "message_type": "tool_use",
+                "tool": "collect_exporter_info"
+            }
+            yield {
+                "type": "content",
+                "text": f"Collecting information about exporter...\n"
+            }
+        elif block.name == "analyze_compliance":
+            # Signal compliance analysis is starting
+            yield {
+                "type": "metadata",
+                "message_type": "compliance_analysis",
+                "exporter_id": block.input.get("exporter_id")
+            }
+
+    async def _execute_tool(self, block, snapshot):
+        """
+        Run one tool call. Returns (tool_result content, frames to emit, is_error);
+        failures are reported to the model as error results instead of ending the turn.
+        """
+        handler = self.tool_handlers.get(block.name)
+        if handler is None:
+            return json.dumps({"error": f"Unknown tool: {block.name}"}), [], True
+        try:
+            with timed(TOOL_SECONDS, tool=block.name):
+                result, frames = await handler(block.input or {}, snapshot)
         except Exception as e:
-            print(f"Error in _process_query_sync: {e}", flush=True)
-            yield json.dumps({"type": "metadata", "message_type": "error"}) + "\n"
-            yield json.dumps({"type": "content", "text": f"Error processing request: {str(e)}"}) + "\n"
+            logger.error(f"Tool {block.name} failed: {str(e)}")
+            return json.dumps({"error": str(e)}), [], True
+        return json.dumps(result), frames, False
+
+    async def _tool_collect_exporter_info(self, tool_input, snapshot):
+        fields = {field: tool_input.get(field) for field in (
+            "exporter_id", "exporter_name", "country_of_origin", "industry_focus",
+            "operation_size", "tech_level", "export_frequency", "shipping_modalities"
+        )}
+        if self.shared_profiles is None:
+            # In-memory update; stays on the event loop with the other readers of the profile index
+            exporter_profile = self.collect_exporter_info(**fields)
+        else:
+            # The cross-worker lock and file write run in a thread; the result is applied on the loop
+            profiles, exporter_profile = await asyncio.to_thread(self._update_shared_profiles, fields)
+            self._set_profiles(profiles)
+
+        # Signal profile creation result
+        if exporter_profile.get("status") == "incomplete":
+            frame = {"type": "metadata", "message_type": "warning"}
+        else:
+            frame = {
+                "type": "metadata",
+                "message_type": "profile_created",
+                "exporter_id": exporter_profile["Exporter ID"],
+                "exporter_name": exporter_profile.get("Exporter Name", "Unknown")
+            }
+        return exporter_profile, [frame]
+
+    async def _tool_find_exporter(self, tool_input, snapshot):
+        # Index lookups are cheap; stays on the event loop since the profile index is mutable
+        candidates = self.find_exporters(tool_input.get("query", ""), tool_input.get("limit") or 5, snapshot)
+        return {"candidates": candidates}, []
+
+    async def _tool_trace_links(self, tool_input, snapshot):
+        # The graph is immutable per snapshot, so walks can run off the event loop
+        record_id = tool_input.get("record_id", "")
+        walk = await asyncio.to_thread(
+            snapshot.get('links').walk, record_id, tool_input.get("max_depth") or LINK_WALK_DEFAULT_DEPTH
+        )
+        if walk is None:
+            return {"error": f"No document, shipment, traceability record, lot, batch or supplier with ID {record_id}"}, []
+        return walk, []
+
+    async def _tool_analyze_compliance(self, tool_input, snapshot):
+        exporter_id = tool_input.get("exporter_id")
+        snapshot = await self.exporter_snapshot(exporter_id, snapshot)
+        analysis = await asyncio.to_thread(self.analyze_compliance, exporter_id, snapshot)
+        return {"analysis": analysis}, []
 
-    async def process_query(self, query, exporter_id=None):
+    async def process_query(self, query, exporter_id=None, session_id=None, received_at=None):
         """
-        Asynchronous generator that wraps the synchronous _process_query_sync
-        using a background thread and an asyncio.Queue.
+        Asynchronous generator yielding the coalesced events of a query as NDJSON bytes.
         """
-        queue = asyncio.Queue()
+        async for event in self.stream_events(query, exporter_id, session_id, received_at):
+            yield encode_ndjson(event)
 
-        def run_in_thread():
-            try:
-                for chunk in self._process_query_sync(query, exporter_id):
-                    asyncio.run_coroutine_threadsafe(queue.put(chunk), loop)
-            finally:
-                asyncio.run_coroutine_threadsafe(queue.put(None), loop)
+    def stream_events(self, query, exporter_id=None, session_id=None, received_at=None):
+        """
+        Events of _process_query_stream with text deltas coalesced, for any transport.
+        received_at (time.perf_counter() when the request arrived) adds queueing time to the metrics.
+        """
+        trace = {}
+        self.sync_profiles()
+        events = self._process_query_stream(query, exporter_id, session_id, trace)
+        return coalesce_events(self._observe_query(events, trace, received_at))
 
-        loop = asyncio.get_running_loop()
-        threading.Thread(target=run_in_thread, daemon=True).start()
+    @staticmethod
+    async def _observe_query(events, trace, received_at=None):
+        """Pass a query's events through, recording its latency, outcome and token usage"""
+        started = time.perf_counter()
+        if received_at is not None:
+            CHAT_QUEUE_SECONDS.observe(started - received_at)
+        first_token = None
+        outcome = "cancelled"
+        try:
+            failed = False
+            async for event in events:
+                kind = event.get("type")
+                if kind == "content" and first_token is None:
+                    first_token = time.perf_counter() - started
+                elif kind == "metadata" and event.get("message_type") == "error":
+                    failed = True
+                elif kind == "usage" and not event.get("response_cache_hit"):
+                    record_usage(event.get("route", "unknown"), trace.get("exporter_id"), event)
+                yield event
+            outcome = "error" if failed else "ok"
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            route = trace.get("route", "unknown")
+            if first_token is not None:
+                CHAT_FIRST_TOKEN_SECONDS.observe(first_token, route=route)
+            CHAT_DURATION_SECONDS.observe(time.perf_counter() - started, route=route, outcome=outcome)
+            CHAT_REQUESTS.inc(route=route, outcome=outcome)
 
-        while True:
-            chunk = await queue.get()
-            if chunk is None:
-                break
-            # Ensure we yield bytes
-            if isinstance(chunk, str):
-                yield chunk.encode("utf-8")
-            else:
-                yield chunk
+    async def exporter_snapshot(self, exporter_id, snapshot):
+        """Snapshot scoped to one exporter from the reference backend, or snapshot itself"""
+        if self.reference_backend is None or not exporter_id:
+            return snapshot
+        return await self.reference_backend.exporter_snapshot(exporter_id, snapshot)
 
-    def analyze_compliance(self, exporter_id):
+    def analyze_compliance(self, exporter_id, snapshot=None):
         """Analyze compliance status for an exporter"""
-        if not exporter_id or exporter_id not in self.exporter_profiles:
+        snapshot = snapshot or self.reference_data.current
+        issue_index = snapshot.get('compliance')
+
+        if exporter_id in self.exporter_profiles:
+            exporter_profile = self.exporter_profiles[exporter_id]
+        elif exporter_id and issue_index.has_reference_data(exporter_id):
+            # Exporters known only from the reference CSVs
+            exporter_profile = {"Exporter Name": issue_index.exporter_names.get(exporter_id, exporter_id)}
+        else:
             return "Exporter ID not found. Please provide a valid exporter ID."
 
-        exporter_profile = self.exporter_profiles[exporter_id]
-        has_reference_data = False
-        analysis_results = []
-
-        if not self.documents_df.empty:
-            exporter_docs = self.documents_df[self.documents_df["Exporter ID"] == exporter_id]
-            if not exporter_docs.empty:
-                has_reference_data = True
-                pending_docs = exporter_docs[exporter_docs["Status"] == "Pending Review"]
-                if not pending_docs.empty:
-                    for _, doc in pending_docs.iterrows():
-                        analysis_results.append({
-                            "issue_type": "Document",
-                            "id": doc["Document ID"],
-                            "status": "Pending Review",
-                            "details": doc["Comments"],
-                            "severity": "Medium"
-                        })
-
-        if not self.shipments_df.empty:
-            exporter_shipments = self.shipments_df[self.shipments_df["Exporter ID"] == exporter_id]
-            if not exporter_shipments.empty:
-                has_reference_data = True
-                non_compliant = exporter_shipments[exporter_shipments["Compliance Status"] == "Non-Compliant"]
-                if not non_compliant.empty:
-                    for _, shipment in non_compliant.iterrows():
-                        analysis_results.append({
-                            "issue_type": "Shipment",
-                            "id": shipment["Shipment ID"],
-                            "status": "Non-Compliant",
-                            "details": f"Non-compliant shipment of {shipment['Product Description']} to {shipment['Arrival Port']}",
-                            "severity": "High"
-                        })
-
-        if not self.traceability_df.empty:
-            exporter_records = self.traceability_df[self.traceability_df["Exporter ID"] == exporter_id]
-            if not exporter_records.empty:
-                has_reference_data = True
-                failed_records = exporter_records[exporter_records["Compliance Flag"] == "Fail"]
-                if not failed_records.empty:
-                    for _, record in failed_records.iterrows():
-                        analysis_results.append({
-                            "issue_type": "Traceability Record",
-                            "id": record["Record ID"],
-                            "status": "Failed",
-                            "details": record["Comments"],
-                            "severity": "High"
-                        })
-
-        if not has_reference_data:
+        analysis_results = issue_index.issues_for(exporter_id)
+
+        if not issue_index.has_reference_data(exporter_id):
             industry_focus = exporter_profile.get("Industry Focus", "")
             product_type = industry_focus.split(" – ")[0] if " – " in industry_focus else industry_focus
             return f"""No reference data available for analysis. Based on profile information alone:
@@ -705,54 +1286,198 @@ No compliance issues found in the available reference data. All documents, shipm
 
 Recommendation: Continue current practices and stay updated on any FDA rule changes."""
         else:
-            analysis_results.sort(key=lambda x: 0 if x["severity"] == "High" else 1 if x["severity"] == "Medium" else 2)
+            # Issues arrive sorted by severity (High, then Medium)
             result_text = f"Compliance Analysis for {exporter_profile.get('Exporter Name')}:\n\n"
             result_text += f"Found {len(analysis_results)} compliance issues:\n\n"
             for i, issue in enumerate(analysis_results):
                 result_text += f"{i+1}. {issue['severity']} Priority: {issue['issue_type']} {issue['id']} - {issue['status']}\n"
                 result_text += f"   Details: {issue['details']}\n\n"
             result_text += "General Recommendations:\n"
-            if "temperature" in str(analysis_results):
+            if exporter_id in issue_index.temperature_exporters:
                 result_text += "1. Implement more robust temperature monitoring throughout the supply chain\n"
-            if "batch" in str(analysis_results) or "details" in str(analysis_results):
-                result_text += "2. Ensure complete batch documentation with all required Key Data Elements\n"
-            if "Non-Compliant" in str(analysis_results):
+            result_text += "2. Ensure complete batch documentation with all required Key Data Elements\n"
+            if any(issue["status"] == "Non-Compliant" for issue in analysis_results):
                 result_text += "3. Review FDA traceability requirements for all shipments before departure\n"
             return result_text
 
+    def exporter_directory(self):
+        """
+        All exporters (reference CSVs merged with profiles), sorted by ID.
+        Returns (version tag, exporters); the list is rebuilt only when the
+        reference data or the profiles change.
+        """
+        snapshot = self.reference_data.current
+        self.sync_profiles()
+        tag = f"{snapshot.version}-{self.profiles_version}"
+        cached = self._directory_cache
+        if cached is None or cached[0] != tag:
+            cached = (tag, snapshot.get('directory').merge_profiles(self.exporter_profiles))
+            self._directory_cache = cached
+        return cached
+
+    def compliance_summary(self, include_issues=False):
+        """Issue summary for every exporter in the current reference data"""
+        snapshot = self.reference_data.current
+        issue_index = snapshot.get('compliance')
+        exporters = issue_index.summary
+        if include_issues:
+            exporters = [
+                dict(entry, issues=issue_index.issues_for(entry["exporter_id"]))
+                for entry in exporters
+            ]
+        return {
+            "version": snapshot.version,
+            "exporters": exporters,
+            "total_count": len(exporters),
+            "total_issues": len(issue_index.issues)
+        }
+
+    def rollup_summary(self, exporter_id=None, names=None):
+        """Rollups for one exporter (or all exporters), or None for an unknown exporter"""
+        snapshot = self.reference_data.current
+        rollups = snapshot.get('rollups')
+        if exporter_id and exporter_id not in rollups.exporter_ids:
+            return None
+        return {
+            "version": snapshot.version,
+            "exporter_id": exporter_id,
+            "rollups": rollups.to_json(exporter_id, names)
+        }
+
+    def link_walk(self, record_id, max_depth=LINK_WALK_DEFAULT_DEPTH):
+        """Everything linked to a record within max_depth hops, or None for an unknown ID"""
+        snapshot = self.reference_data.current
+        walk = snapshot.get('links').walk(record_id, max_depth)
+        if walk is None:
+            return None
+        return {"version": snapshot.version, **walk}
+
+    def dangling_links(self, limit=100):
+        """Links to documents, shipments or traceability records missing from the reference data"""
+        snapshot = self.reference_data.current
+        return {"version": snapshot.version, **snapshot.get('links').dangling_report(limit)}
+
+    def fda_export(self, exporter_id=None, lot_number=None, product=None, start_date=None, end_date=None):
+        """FDA sortable spreadsheet of the matching traceability records, bound to the current snapshot"""
+        return FDASpreadsheetExport(
+            self.reference_data.current, exporter_id=exporter_id, lot_number=lot_number, product=product,
+            start_date=start_date, end_date=end_date
+        )
+
 # Global instance of the bot used by the FastAPI app
 bot = FDAComplianceBot()
 
-async def update_csv_files(files):
-    updated = False
+# Upload form field -> (reference table, live CSV path)
+UPLOAD_TARGETS = {
+    'documents_csv': ('documents', DOCUMENTS_CSV),
+    'shipments_csv': ('shipments', SHIPMENTS_CSV),
+    'traceability_csv': ('traceability', TRACEABILITY_CSV)
+}
+
+def _validate_csv_header(head, file_name, required_columns):
+    """Check the header line at the start of an upload against the required columns"""
+    header_line = head.split(b"\n", 1)[0].decode("utf-8-sig", errors="replace")
+    column_names = parse_csv_header(header_line)
+    if not any(column_names):
+        raise CSVValidationError(f"{file_name}: missing CSV header")
+    missing_columns = [col for col in required_columns if col not in column_names]
+    if missing_columns:
+        raise CSVValidationError(f"{file_name}: missing required columns {missing_columns}")
+
+async def _stage_upload(file_obj, target_path, required_columns):
+    """
+    Stream an upload in chunks to a temp file next to target_path, validating the
+    header as soon as it has arrived. Returns (temp path, bytes written).
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target_path) or ".", suffix=".upload")
+    file_name = file_obj.filename or os.path.basename(target_path)
+    bytes_written = 0
+    head = b""
     try:
-        if 'documents_csv' in files:
-            file_obj = files['documents_csv']
-            contents = await file_obj.read()
-            with open(DOCUMENTS_CSV, "wb") as f:
-                f.write(contents)
-            updated = True
-            
-        if 'shipments_csv' in files:
-            file_obj = files['shipments_csv']
-            contents = await file_obj.read()
-            with open(SHIPMENTS_CSV, "wb") as f:
-                f.write(contents)
-            updated = True
-            
-        if 'traceability_csv' in files:
-            file_obj = files['traceability_csv']
-            contents = await file_obj.read()
-            with open(TRACEABILITY_CSV, "wb") as f:
-                f.write(contents)
-            updated = True
-            
-        if updated:
-            # Reinitialize the bot to reload CSV data with validation
-            global bot
-            bot = FDAComplianceBot()
-            
-        return updated
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await file_obj.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if head is not None:
+                    # Hold data back until the full header line is available
+                    head += chunk
+                    if b"\n" not in head and len(head) < MAX_HEADER_BYTES:
+                        continue
+                    _validate_csv_header(head, file_name, required_columns)
+                    chunk, head = head, None
+                await asyncio.to_thread(out.write, chunk)
+                bytes_written += len(chunk)
+            if head is not None:
+                # Whole file fit in the header buffer (or was empty)
+                _validate_csv_header(head, file_name, required_columns)
+                out.write(head)
+                bytes_written += len(head)
+        return temp_path, bytes_written
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+async def _sync_to_pocketbase(tables):
+    """Upsert reloaded tables into PocketBase (pruning removed rows) and drop stale exporter caches"""
+    try:
+        reports = await PocketBaseSync(get_pocketbase_client()).sync_tables(tables, prune=True)
+        logger.info(f"PocketBase sync after upload: {reports}")
     except Exception as e:
-        print(f"Error updating CSV files: {e}")
-        return False
+        logger.error(f"PocketBase sync after upload failed: {str(e)}")
+    finally:
+        if bot.reference_backend is not None:
+            bot.reference_backend.invalidate()
+
+async def update_csv_files(files):
+    """
+    Stage every uploaded CSV, publish them with atomic renames and reload the
+    affected tables. Returns ingest stats per table, or None if nothing was uploaded.
+    Raises CSVValidationError (before anything is published) for invalid files.
+    """
+    staged = {}
+    try:
+        for field, file_obj in files.items():
+            if field not in UPLOAD_TARGETS:
+                continue
+            table, target_path = UPLOAD_TARGETS[field]
+            staged[table] = (target_path,) + await _stage_upload(
+                file_obj, target_path, bot.required_columns[table]
+            )
+    except BaseException:
+        for _, temp_path, _ in staged.values():
+            os.unlink(temp_path)
+        raise
+
+    if not staged:
+        return None
+
+    # Readers only ever see the old file or the complete new one
+    for target_path, temp_path, _ in staged.values():
+        os.replace(temp_path, target_path)
+
+    # Re-parse only the uploaded tables off the event loop; in-flight chats
+    # keep their snapshot and new chats pick up the new version
+    previous = bot.reference_data.current
+    started = time.perf_counter()
+    snapshot = await asyncio.to_thread(bot.reload_reference_data, list(staged))
+    parse_seconds = time.perf_counter() - started
+    bot.invalidate_responses(previous, snapshot)
+
+    if PB_SYNC_ON_UPLOAD and get_pocketbase_client() is not None:
+        # Mirror the new tables into PocketBase without holding up the upload response
+        asyncio.get_running_loop().create_task(
+            _sync_to_pocketbase({table: snapshot.tables[table] for table in staged})
+        )
+
+    return {
+        "version": snapshot.version,
+        "parse_seconds": round(parse_seconds, 3),
+        "tables": {
+            table: {
+                "bytes": bytes_written,
+                "rows": len(snapshot.tables[table])
+            }
+            for table, (_, _, bytes_written) in staged.items()
+        }
+    }
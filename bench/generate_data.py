@@ -0,0 +1,194 @@
+"""
+Synthetic reference data for benchmarks.
+
+Writes documents.csv, shipments.csv and traceability_records.csv in the same
+wrapped-record format as CSV/ (UTF-8 BOM, every record quoted as a single
+field), with the same columns and value shapes. Row i of each table belongs to
+the same exporter: document DOC-i covers shipment S-i, which links traceability
+record TR-i and sometimes a record filed under another exporter.
+
+Usage: python bench/generate_data.py --size 100k [--exporters 1000] [--skew 1.0] [--out bench/data/100k]
+"""
+import os
+import random
+import argparse
+
+SIZES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+# Rows formatted and written per chunk
+WRITE_CHUNK_ROWS = 50_000
+
+EXPORTERS = [
+    # (name stem, country, departure ports, products [(type, description, food, HS code)])
+    ("Iberian", "Spain", ["Valencia Port", "Port of Algeciras"], [
+        ("Fruit", "Fresh Apples", "Apples", "0808.10"), ("Fruit", "Oranges", "Oranges", "0805.10")]),
+    ("Bella", "Italy", ["Port of Genoa", "Port of La Spezia"], [
+        ("Vegetable", "Organic Carrots", "Carrots", "0707.10"), ("Vegetable", "Fresh Tomatoes", "Tomatoes", "0702.00")]),
+    ("Andes", "Peru", ["Port of Callao", "Paita"], [
+        ("Fruit", "Avocados", "Avocados", "0804.40"), ("Vegetable", "Asparagus", "Asparagus", "0709.20")]),
+    ("Pacific", "Chile", ["Port of Valparaiso", "San Antonio"], [
+        ("Seafood", "Frozen Salmon Fillets", "Salmon", "0304.81"), ("Fruit", "Table Grapes", "Grapes", "0806.10")]),
+    ("Mekong", "Vietnam", ["Cat Lai Port", "Hai Phong"], [
+        ("Seafood", "Frozen Shrimp", "Shrimp", "0306.17"), ("Fruit", "Dragon Fruit", "Dragon Fruit", "0810.90")]),
+    ("Anatolia", "Turkey", ["Port of Mersin", "Izmir"], [
+        ("Nuts", "Hazelnuts", "Hazelnuts", "0802.22"), ("Fruit", "Dried Figs", "Figs", "0804.20")]),
+    ("Sierra", "Mexico", ["Manzanillo", "Veracruz"], [
+        ("Vegetable", "Fresh Cucumbers", "Cucumbers", "0707.00"), ("Vegetable", "Hot Peppers", "Peppers", "0709.60")]),
+    ("Nordic", "Norway", ["Port of Bergen", "Alesund"], [
+        ("Seafood", "Fresh Cod", "Cod", "0302.51"), ("Seafood", "Smoked Salmon", "Salmon", "0305.41")]),
+]
+NAME_SUFFIXES = ["Orchard Exports", "Organics", "Fresh Produce", "Harvest Co.", "Foods", "Growers",
+                 "Seafood Traders", "Agro Export", "Farms", "Trading"]
+ARRIVAL_PORTS = ["Los Angeles", "New York", "Miami", "Houston", "Seattle", "Savannah", "Long Beach"]
+CARRIERS = {"Ocean Freight": ["MSC", "Maersk", "CMA CGM", "Hapag-Lloyd"],
+            "Air Freight": ["Alitalia Cargo", "LATAM Cargo", "Lufthansa Cargo"]}
+
+DOCUMENT_TYPES = ["Bill of Lading", "Export License", "Phytosanitary Certificate", "Certificate of Origin",
+                  "Commercial Invoice"]
+DOCUMENT_STATUSES = (["Approved", "Pending Review", "Rejected"], [0.75, 0.2, 0.05])
+DOCUMENT_COMMENTS = {
+    "Approved": "All documentation verified; complete record.",
+    "Pending Review": "Some documentation incomplete; needs update.",
+    "Rejected": "Missing signatures; resubmission required.",
+}
+SHIPMENT_STATUSES = (["Compliant", "Non-Compliant", "Pending"], [0.8, 0.12, 0.08])
+CTE_TYPES = ["Production", "Packaging", "Shipping", "Receiving", "Transformation"]
+RECORD_FLAGS = (["Pass", "Fail"], [0.9, 0.1])
+RECORD_COMMENTS = {
+    "Pass": "Record complete; all KDEs captured.",
+    "Fail": "Temperature deviation detected during transit.",
+}
+
+DOCUMENT_COLUMNS = ["Document ID", "Exporter ID", "Exporter Name", "Document Type", "Format", "Date Issued",
+                    "Validity Period", "Departure Port", "Linked Shipment ID", "Linked Traceability Record IDs",
+                    "Status", "Comments"]
+SHIPMENT_COLUMNS = ["Shipment ID", "Exporter ID", "Exporter Name", "Country of Origin", "Destination Country",
+                    "Product Type", "Product Description", "HS Code", "Quantity", "Export Date", "Departure Port",
+                    "Arrival Port", "Shipping Modality", "Carrier", "Compliance Status",
+                    "Linked Traceability Record IDs"]
+TRACEABILITY_COLUMNS = ["Record ID", "Exporter ID", "Food Product", "CTE Type", "KDE Details", "Timestamp",
+                        "Compliance Flag", "Temp (°C)", "Humidity (%)", "Location (Name & Coords)", "Lot Number",
+                        "Batch Number", "Supplier ID", "Comments"]
+
+
+def wrap_record(values):
+    """One line in the repo's export format: the record, itself CSV, quoted as a single field"""
+    inner = values[0] + "," + ",".join('"' + str(v).replace('"', '""') + '"' for v in values[1:])
+    return '"' + inner.replace('"', '""') + '"'
+
+
+def make_exporters(count, rng):
+    """(Exporter ID, name, country, ports, products) tuples, shuffled so skew is not tied to ID order"""
+    exporters = []
+    for i in range(count):
+        stem, country, ports, products = EXPORTERS[i % len(EXPORTERS)]
+        suffix = NAME_SUFFIXES[(i // len(EXPORTERS)) % len(NAME_SUFFIXES)]
+        generation = i // (len(EXPORTERS) * len(NAME_SUFFIXES))
+        name = f"{stem} {suffix}" + (f" {generation + 1}" if generation else "")
+        exporters.append((f"EX{i + 1:03d}", name, country, ports, products))
+    rng.shuffle(exporters)
+    return exporters
+
+
+def assign_exporters(rows, exporters, skew, rng):
+    """Exporter index per row; skew > 0 gives a Zipf-like long tail, 0 is uniform"""
+    weights = [1 / (rank + 1) ** skew for rank in range(len(exporters))]
+    return rng.choices(range(len(exporters)), weights=weights, k=rows)
+
+
+def generate(out_dir, rows, exporter_count, skew=0.0, cross_link_rate=0.1, seed=0):
+    rng = random.Random(seed)
+    exporters = make_exporters(exporter_count, rng)
+    owners = assign_exporters(rows, exporters, skew, rng)
+    width = max(4, len(str(rows)))
+    os.makedirs(out_dir, exist_ok=True)
+
+    def record_id(i):
+        return f"TR-{i + 1:0{width}d}"
+
+    def linked_records(i):
+        linked = [record_id(i)]
+        if rows > 1 and rng.random() < cross_link_rate:
+            linked.append(record_id(rng.randrange(rows)))
+        return ", ".join(dict.fromkeys(linked))
+
+    def date(i, offset=0):
+        # Days stop at 28 so every month (and the +1 day offset) stays valid
+        return f"2025-{(i % 12) + 1:02d}-{(i % 27) + 1 + offset:02d}"
+
+    def documents(i, owner, links):
+        exporter_id, name, _, ports, _ = owner
+        status = rng.choices(*DOCUMENT_STATUSES)[0]
+        return [f"DOC-{i + 1:0{width}d}", exporter_id, name, rng.choice(DOCUMENT_TYPES),
+                rng.choice(["Electronic", "Paper"]), date(i), rng.choice(["6 Months", "1 Year", "2 Years"]),
+                ports[i % len(ports)], f"S-{i + 1:0{width}d}", links, status, DOCUMENT_COMMENTS[status]]
+
+    def shipments(i, owner, links):
+        exporter_id, name, country, ports, products = owner
+        product_type, description, _, hs_code = products[i % len(products)]
+        modality = "Air Freight" if product_type == "Seafood" and i % 3 == 0 else rng.choice(list(CARRIERS))
+        return [f"S-{i + 1:0{width}d}", exporter_id, name, country, "United States", product_type, description,
+                hs_code, f"{rng.randrange(100, 5000, 50)} kg", date(i, 1), ports[i % len(ports)],
+                rng.choice(ARRIVAL_PORTS), modality, rng.choice(CARRIERS[modality]),
+                rng.choices(*SHIPMENT_STATUSES)[0], links]
+
+    def traceability(i, owner):
+        exporter_id, _, _, ports, products = owner
+        food = products[i % len(products)][2]
+        flag = rng.choices(*RECORD_FLAGS)[0]
+        temperature = rng.randint(-20, 4) if food in ("Salmon", "Shrimp", "Cod") else rng.randint(2, 24)
+        return [record_id(i), exporter_id, food, rng.choice(CTE_TYPES),
+                f"Lot traced; Quality: {rng.choice('ABC')}", f"{date(i)} {rng.randrange(6, 20):02d}:00", flag,
+                str(temperature), str(rng.randint(40, 95)),
+                f"{ports[i % len(ports)]} ({rng.uniform(-60, 60):.4f}° N, {rng.uniform(0, 120):.4f}° W)",
+                f"L-{food[:2].upper()}-{i % 1000:03d}", f"B{i % 500:03d}", f"SUP-{exporter_id}-{i % 20:02d}",
+                RECORD_COMMENTS[flag]]
+
+    paths = {
+        "documents": os.path.join(out_dir, "documents.csv"),
+        "shipments": os.path.join(out_dir, "shipments.csv"),
+        "traceability": os.path.join(out_dir, "traceability_records.csv"),
+    }
+    headers = {"documents": DOCUMENT_COLUMNS, "shipments": SHIPMENT_COLUMNS, "traceability": TRACEABILITY_COLUMNS}
+    files = {table: open(path, "w", encoding="utf-8-sig", newline="") for table, path in paths.items()}
+    try:
+        for table, f in files.items():
+            f.write(wrap_record(headers[table]) + "\n")
+        for start in range(0, rows, WRITE_CHUNK_ROWS):
+            lines = {table: [] for table in files}
+            for i in range(start, min(start + WRITE_CHUNK_ROWS, rows)):
+                owner = exporters[owners[i]]
+                links = linked_records(i)
+                lines["documents"].append(wrap_record(documents(i, owner, links)))
+                lines["shipments"].append(wrap_record(shipments(i, owner, links)))
+                lines["traceability"].append(wrap_record(traceability(i, owner)))
+            for table, f in files.items():
+                f.write("\n".join(lines[table]) + "\n")
+    finally:
+        for f in files.values():
+            f.close()
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic reference CSVs for benchmarks")
+    parser.add_argument("--size", choices=sorted(SIZES), help="Preset rows per table")
+    parser.add_argument("--rows", type=int, help="Rows per table (overrides --size)")
+    parser.add_argument("--exporters", type=int, help="Distinct exporters (default: rows / 100, at least 10)")
+    parser.add_argument("--skew", type=float, default=0.0, help="Zipf exponent of rows per exporter (0 = uniform)")
+    parser.add_argument("--cross-link-rate", type=float, default=0.1,
+                        help="Share of shipments also linking a record of another exporter")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="Output directory (default: bench/data/<size>)")
+    args = parser.parse_args()
+
+    rows = args.rows or SIZES[args.size or "1k"]
+    exporters = args.exporters or max(10, rows // 100)
+    label = args.size if args.size and not args.rows else str(rows)
+    out_dir = args.out or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", label)
+    paths = generate(out_dir, rows, exporters, args.skew, args.cross_link_rate, args.seed)
+    for path in paths.values():
+        print(f"{path}: {rows} rows, {os.path.getsize(path) / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
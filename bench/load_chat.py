@@ -0,0 +1,284 @@
+"""
+Load driver for /chat.
+
+Runs N concurrent chat sessions of several turns each against a running
+backend and reports time to first byte, time to first content, total latency
+(p50/p90/p99), output tokens per second and, given the server's PID, its peak
+thread count and memory. With --spawn it starts mock_llm.py and the backend
+itself, so a full run needs no API keys:
+
+    python bench/load_chat.py --spawn --sessions 50 --turns 3 --output load.json
+
+Against an already running backend:
+
+    python bench/load_chat.py --url http://127.0.0.1:8000 --server-pid 1234 --sessions 20
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import subprocess
+import statistics
+from datetime import datetime, timezone
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(os.path.dirname(BENCH_DIR), "Backend")
+
+# Turn queries; {exporter} is filled per session. The mix covers a routed rule
+# question, a tool call (analyze_compliance) and an exporter-scoped answer.
+DEFAULT_QUERIES = [
+    "What are the key data elements required by the food traceability rule?",
+    "Can you analyze compliance for {exporter}?",
+    "Which of the shipments for {exporter} need attention first?",
+]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(int(len(ordered) * fraction), len(ordered) - 1)], 4)
+
+
+def summarize(values):
+    return {"p50": percentile(values, 0.5), "p90": percentile(values, 0.9), "p99": percentile(values, 0.99),
+            "max": round(max(values), 4) if values else None}
+
+
+def process_stats(pid):
+    """Threads and resident memory (MiB) of a process, from /proc (Linux)"""
+    values = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Threads", "VmRSS"):
+                values[key] = int(value.split()[0])
+    return values.get("Threads", 0), values.get("VmRSS", 0) / 1024
+
+
+async def sample_process(pid, samples, interval=0.2):
+    while True:
+        try:
+            samples.append(process_stats(pid))
+        except OSError:
+            return
+        await asyncio.sleep(interval)
+
+
+def parse_frames(buffer, transport):
+    """Split complete frames off a response buffer; returns (frames, rest)"""
+    frames = []
+    if transport == "sse":
+        *blocks, rest = buffer.split("\r\n\r\n" if "\r\n\r\n" in buffer else "\n\n")
+        for block in blocks:
+            data = [line[5:].strip() for line in block.splitlines() if line.startswith("data:")]
+            if data:
+                frames.append(json.loads("\n".join(data)))
+    else:
+        *lines, rest = buffer.split("\n")
+        frames = [json.loads(line) for line in lines if line.strip()]
+    return frames, rest
+
+
+async def run_turn(client, url, payload, transport):
+    result = {"ttfb": None, "ttft": None, "total": None, "output_tokens": 0, "chars": 0, "error": None,
+              "cache_hit": False, "route": None}
+    started = time.perf_counter()
+    buffer = ""
+    try:
+        async with client.stream("POST", f"{url}/chat", json=dict(payload, transport=transport)) as response:
+            if response.status_code != 200:
+                result["error"] = f"HTTP {response.status_code}"
+            async for text in response.aiter_text():
+                if result["ttfb"] is None:
+                    result["ttfb"] = time.perf_counter() - started
+                frames, buffer = parse_frames(buffer + text, transport)
+                for frame in frames:
+                    kind = frame.get("type")
+                    if kind == "content":
+                        if result["ttft"] is None:
+                            result["ttft"] = time.perf_counter() - started
+                        result["chars"] += len(frame.get("text", ""))
+                    elif kind == "metadata" and frame.get("message_type") == "error":
+                        result["error"] = "error frame"
+                    elif kind == "usage":
+                        result["output_tokens"] += frame.get("output_tokens", 0)
+                        result["cache_hit"] = result["cache_hit"] or bool(frame.get("response_cache_hit"))
+                        result["route"] = frame.get("route", result["route"])
+    except (httpx.HTTPError, ValueError) as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["total"] = time.perf_counter() - started
+    return result
+
+
+async def run_session(client, url, index, args, queries, results):
+    session_id = str(uuid.uuid4())
+    exporter = args.exporters[index % len(args.exporters)]
+    for turn in range(args.turns):
+        query = queries[turn % len(queries)].format(exporter=exporter)
+        if not args.allow_cache_hits:
+            # Identical first turns would be answered from the response cache
+            query = f"{query} (load test session {index})"
+        payload = {"message": query, "session_id": session_id}
+        results.append(await run_turn(client, url, payload, args.transport))
+
+
+async def drive(args, server_pid):
+    samples = []
+    sampler = asyncio.ensure_future(sample_process(server_pid, samples)) if server_pid else None
+    results = []
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    limits = httpx.Limits(max_connections=args.sessions, max_keepalive_connections=args.sessions)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(run_session(client, args.url, index, args, queries, results)
+                               for index in range(args.sessions)))
+        elapsed = time.perf_counter() - started
+    if sampler:
+        sampler.cancel()
+
+    ok = [r for r in results if r["error"] is None]
+    rates = [r["output_tokens"] / (r["total"] - r["ttft"])
+             for r in ok if r["output_tokens"] and r["ttft"] is not None and r["total"] > r["ttft"]]
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "url": args.url,
+            "sessions": args.sessions,
+            "turns": args.turns,
+            "transport": args.transport,
+        },
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "error_samples": sorted({r["error"] for r in results if r["error"]})[:5],
+        "response_cache_hits": sum(r["cache_hit"] for r in ok),
+        "routes": {route: sum(r["route"] == route for r in ok) for route in {r["route"] for r in ok if r["route"]}},
+        "elapsed_seconds": round(elapsed, 3),
+        "requests_per_second": round(len(results) / elapsed, 2) if elapsed else None,
+        "ttfb_seconds": summarize([r["ttfb"] for r in ok if r["ttfb"] is not None]),
+        "ttft_seconds": summarize([r["ttft"] for r in ok if r["ttft"] is not None]),
+        "latency_seconds": summarize([r["total"] for r in ok]),
+        "output_tokens_per_second": {
+            "per_request_p50": percentile(rates, 0.5),
+            "aggregate": round(sum(r["output_tokens"] for r in ok) / elapsed, 1) if elapsed else None,
+        },
+    }
+    if samples:
+        threads = [s[0] for s in samples]
+        rss = [s[1] for s in samples]
+        report["server"] = {
+            "pid": server_pid,
+            "threads_peak": max(threads),
+            "threads_mean": round(statistics.mean(threads), 1),
+            "rss_mb_start": round(rss[0], 1),
+            "rss_mb_peak": round(max(rss), 1),
+            "rss_mb_end": round(rss[-1], 1),
+        }
+    return report
+
+
+def wait_for(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.25)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def spawn(args):
+    """Start mock_llm.py and the backend pointed at it; returns (processes, backend pid)"""
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    mock = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "mock_llm.py"), "--port", str(args.mock_port),
+        "--first-token-delay", str(args.first_token_delay), "--token-rate", str(args.token_rate),
+        "--answer-tokens", str(args.answer_tokens), "--error-rate", str(args.error_rate)
+    ])
+    env = dict(os.environ, ANTHROPIC_BASE_URL=mock_url, GROQ_BASE_URL=mock_url,
+               ANTHROPIC_API_KEY="load-test", GROQ_API_KEY="load-test", LOG_LEVEL="WARNING")
+    env.pop("POCKETBASE_URL", None)
+    if args.csv_dir:
+        env["CSV_DIR"] = os.path.abspath(args.csv_dir)
+    env.setdefault("CSV_DIR", os.path.join(os.path.dirname(BENCH_DIR), "CSV"))
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL
+    )
+    processes = [backend, mock]
+    try:
+        wait_for(f"{mock_url}/health", mock)
+        wait_for(f"http://127.0.0.1:{args.port}/list_csv", backend, timeout=300)
+    except Exception:
+        stop(processes)
+        raise
+    args.url = f"http://127.0.0.1:{args.port}"
+    return processes, backend.pid
+
+
+def stop(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent /chat load driver")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Backend base URL")
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent chat sessions")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per session")
+    parser.add_argument("--transport", choices=("ndjson", "sse"), default="ndjson")
+    parser.add_argument("--exporters", default="EX001,EX002,EX003", type=lambda s: s.split(","),
+                        help="Comma-separated Exporter IDs to spread sessions over")
+    parser.add_argument("--queries", help="File with one query per line ({exporter} is substituted)")
+    parser.add_argument("--allow-cache-hits", action="store_true",
+                        help="Send identical first turns, so the response cache answers most of them")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--server-pid", type=int, help="Backend PID to sample threads and memory of")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    spawned = parser.add_argument_group("spawned servers (--spawn)")
+    spawned.add_argument("--spawn", action="store_true", help="Start mock_llm.py and the backend for the run")
+    spawned.add_argument("--port", type=int, default=8010)
+    spawned.add_argument("--mock-port", type=int, default=8999)
+    spawned.add_argument("--csv-dir", help="Reference CSV directory for the spawned backend")
+    spawned.add_argument("--first-token-delay", type=float, default=0.3)
+    spawned.add_argument("--token-rate", type=float, default=80.0)
+    spawned.add_argument("--answer-tokens", type=int, default=150)
+    spawned.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    processes = []
+    server_pid = args.server_pid
+    if args.spawn:
+        processes, server_pid = spawn(args)
+    try:
+        report = asyncio.run(drive(args, server_pid))
+    finally:
+        stop(processes)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Local stand-in for the Anthropic and Groq APIs, for load tests without API spend.
+
+Serves the Anthropic Messages API (/v1/messages, streaming and not) and Groq's
+OpenAI-style chat completions (/openai/v1/chat/completions) with a configurable
+first-token delay and token rate. Point the backend at it with
+
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8999 GROQ_BASE_URL=http://127.0.0.1:8999
+
+Tool calls are scripted: the first rule whose regex matches the latest user
+query answers with those tool_use blocks (streamed as content_block_start and
+input_json_delta events), and the follow-up request carrying the tool_result
+gets a text answer. "$exporter" in a tool input becomes the first Exporter ID
+in the query and "$record" the first document, shipment or traceability record
+ID. Rules file format (--script):
+
+    [{"match": "analy[sz]e|complian", "tools": [{"name": "analyze_compliance",
+                                                   "input": {"exporter_id": "$exporter"}}]}]
+
+Usage: python bench/mock_llm.py [--port 8999] [--first-token-delay 0.3] [--token-rate 80] [--answer-tokens 150]
+"""
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_SCRIPT = [
+    {"match": r"\banaly[sz]e\b|\bcomplian", "tools": [
+        {"name": "analyze_compliance", "input": {"exporter_id": "$exporter"}}
+    ]},
+    {"match": r"\bconnected\b|\blinked\b|\btrace\b", "tools": [
+        {"name": "trace_links", "input": {"record_id": "$record", "max_depth": 3}}
+    ]},
+    {"match": r"\bwho is\b|\bfind\b|\bcompany\b", "tools": [
+        {"name": "find_exporter", "input": {"query": "$query", "limit": 3}}
+    ]},
+]
+EXPORTER_ID_PATTERN = re.compile(r"\bEX\d+\b", re.IGNORECASE)
+RECORD_ID_PATTERN = re.compile(r"\b(?:DOC|S|TR)-\d+\b", re.IGNORECASE)
+WORDS = ("the traceability rule requires key data elements for each critical tracking event so "
+         "records for this shipment should include the lot code location and date of every step").split()
+
+
+class MockConfig:
+    def __init__(self, first_token_delay=0.3, token_rate=80.0, answer_tokens=150, error_rate=0.0,
+                 script=DEFAULT_SCRIPT):
+        self.first_token_delay = first_token_delay
+        self.token_rate = token_rate
+        self.answer_tokens = answer_tokens
+        self.error_rate = error_rate
+        self.rules = [(re.compile(rule["match"], re.IGNORECASE), rule["tools"]) for rule in script]
+
+
+config = MockConfig()
+app = FastAPI()
+stats = {"anthropic_requests": 0, "groq_requests": 0, "tool_calls": 0, "errors_injected": 0}
+
+
+def _estimate_tokens(value):
+    return len(json.dumps(value)) // 4 + 1
+
+
+def _answer_tokens(seed):
+    rng = random.Random(seed)
+    return [rng.choice(WORDS) + " " for _ in range(config.answer_tokens)]
+
+
+def _text_of(content):
+    if isinstance(content, str):
+        return content
+    return " ".join(block.get("text", "") for block in content if block.get("type") == "text")
+
+
+def _planned_tools(body):
+    """tool_use blocks to answer with, or None for a text answer"""
+    messages = body.get("messages", [])
+    if not body.get("tools") or not messages or (body.get("tool_choice") or {}).get("type") == "none":
+        return None
+    last = messages[-1]
+    if last["role"] != "user" or not isinstance(last["content"], (str, list)):
+        return None
+    if isinstance(last["content"], list) and any(block.get("type") == "tool_result" for block in last["content"]):
+        return None
+    query = _text_of(last["content"])
+    exporter = EXPORTER_ID_PATTERN.search(query)
+    record = RECORD_ID_PATTERN.search(query)
+    for pattern, tools in config.rules:
+        if pattern.search(query):
+            substitutions = {"$exporter": exporter.group(0).upper() if exporter else "EX001", "$query": query,
+                             "$record": record.group(0).upper() if record else "S-1001"}
+            return [{
+                "type": "tool_use",
+                "id": f"toolu_{uuid.uuid4().hex[:24]}",
+                "name": tool["name"],
+                "input": {key: substitutions.get(value, value) if isinstance(value, str) else value
+                          for key, value in tool["input"].items()}
+            } for tool in tools]
+    return None
+
+
+def _overloaded(kind):
+    stats["errors_injected"] += 1
+    if kind == "anthropic":
+        return JSONResponse({"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}},
+                            status_code=529)
+    return JSONResponse({"error": {"message": "Service unavailable", "type": "internal_server_error"}},
+                        status_code=503)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _paced(tokens):
+    """Yield tokens after the first-token delay, at the configured rate"""
+    await asyncio.sleep(config.first_token_delay)
+    interval = 1 / config.token_rate if config.token_rate > 0 else 0
+    for token in tokens:
+        yield token
+        await asyncio.sleep(interval)
+
+
+@app.post("/v1/messages")
+async def messages(request: Request):
+    body = await request.json()
+    stats["anthropic_requests"] += 1
+    if random.random() < config.error_rate:
+        return _overloaded("anthropic")
+
+    tools = _planned_tools(body)
+    input_tokens = _estimate_tokens([body.get("system"), body.get("tools"), body.get("messages")])
+    message_id = f"msg_{uuid.uuid4().hex[:24]}"
+    text = _answer_tokens(message_id) if tools is None else []
+    stop_reason = "end_turn" if tools is None else "tool_use"
+    stats["tool_calls"] += len(tools or [])
+
+    if not body.get("stream"):
+        await asyncio.sleep(config.first_token_delay + len(text) / max(config.token_rate, 1e-9))
+        content = [{"type": "text", "text": "".join(text)}] if tools is None else tools
+        return JSONResponse({
+            "id": message_id, "type": "message", "role": "assistant", "model": body.get("model"),
+            "content": content, "stop_reason": stop_reason, "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": max(len(text), 1)}
+        })
+
+    async def events():
+        yield _sse("message_start", {"type": "message_start", "message": {
+            "id": message_id, "type": "message", "role": "assistant", "model": body.get("model"),
+            "content": [], "stop_reason": None, "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": 1}
+        }})
+        output_tokens = 0
+        if tools is None:
+            yield _sse("content_block_start", {"type": "content_block_start", "index": 0,
+                                               "content_block": {"type": "text", "text": ""}})
+            async for token in _paced(text):
+                output_tokens += 1
+                yield _sse("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                   "delta": {"type": "text_delta", "text": token}})
+            yield _sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+        else:
+            await asyncio.sleep(config.first_token_delay)
+            for index, tool in enumerate(tools):
+                yield _sse("content_block_start", {"type": "content_block_start", "index": index, "content_block": {
+                    "type": "tool_use", "id": tool["id"], "name": tool["name"], "input": {}
+                }})
+                arguments = json.dumps(tool["input"])
+                # Tool input arrives as partial JSON, a few characters per delta
+                for start in range(0, len(arguments), 16):
+                    output_tokens += 1
+                    yield _sse("content_block_delta", {"type": "content_block_delta", "index": index, "delta": {
+                        "type": "input_json_delta", "partial_json": arguments[start:start + 16]
+                    }})
+                yield _sse("content_block_stop", {"type": "content_block_stop", "index": index})
+        yield _sse("message_delta", {"type": "message_delta",
+                                     "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                                     "usage": {"output_tokens": output_tokens}})
+        yield _sse("message_stop", {"type": "message_stop"})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["groq_requests"] += 1
+    if random.random() < config.error_rate:
+        return _overloaded("groq")
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    text = _answer_tokens(completion_id)[:body.get("max_tokens") or config.answer_tokens]
+    usage = {"prompt_tokens": _estimate_tokens(body.get("messages")), "completion_tokens": len(text),
+             "total_tokens": 0}
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+    if not body.get("stream"):
+        await asyncio.sleep(config.first_token_delay + len(text) / max(config.token_rate, 1e-9))
+        return JSONResponse({
+            "id": completion_id, "object": "chat.completion", "created": created, "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(text)},
+                         "finish_reason": "stop"}],
+            "usage": usage
+        })
+
+    def chunk(delta, finish_reason=None, **extra):
+        return "data: " + json.dumps({
+            "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": body.get("model"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}], **extra
+        }) + "\n\n"
+
+    async def events():
+        yield chunk({"role": "assistant", "content": ""})
+        async for token in _paced(text):
+            yield chunk({"content": token})
+        yield chunk({}, "stop", x_groq={"id": completion_id, "usage": usage})
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/openai/v1/models/{model:path}")
+async def groq_model(model: str):
+    """Model lookup the app's Groq health probe uses"""
+    return {"id": model, "object": "model", "created": 0, "owned_by": "mock", "active": True}
+
+
+@app.get("/health")
+async def health():
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Anthropic/Groq stand-in for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8999)
+    parser.add_argument("--first-token-delay", type=float, default=0.3, help="Seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=80.0, help="Output tokens per second (0 = unpaced)")
+    parser.add_argument("--answer-tokens", type=int, default=150, help="Tokens per text answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered 529/503")
+    parser.add_argument("--script", help="JSON file of tool call rules (replaces the built-in rules)")
+    args = parser.parse_args()
+
+    global config
+    script = DEFAULT_SCRIPT
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+    config = MockConfig(args.first_token_delay, args.token_rate, args.answer_tokens, args.error_rate, script)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
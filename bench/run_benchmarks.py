@@ -0,0 +1,283 @@
+"""
+Benchmarks for the reference data path.
+
+Times CSV loading, prompt assembly, compliance analysis, exporter lookup and
+/list_exporters against a directory of reference CSVs (see generate_data.py),
+reporting wall time, peak RSS and prompt token size per step as JSON. Compare
+two runs to catch regressions between releases:
+
+    python bench/generate_data.py --size 100k
+    python bench/run_benchmarks.py --data bench/data/100k --output before.json
+    python bench/run_benchmarks.py --data bench/data/100k --output after.json --compare before.json
+
+No model or PocketBase calls are made.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import platform
+import resource
+import statistics
+import subprocess
+import threading
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Backend")
+TABLE_FILES = {"documents": "documents.csv", "shipments": "shipments.csv", "traceability": "traceability_records.csv"}
+
+# A step regresses when its median wall time grows by more than this fraction
+DEFAULT_THRESHOLD = 0.2
+# Steps faster than this are too noisy to flag
+MIN_COMPARABLE_SECONDS = 0.005
+
+
+def current_rss_mb():
+    """Resident set size now (Linux), or the peak so far elsewhere"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+class RssSampler:
+    """Samples RSS in a background thread to find the peak during one step"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = current_rss_mb()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb())
+
+
+def measure(fn, repeat, setup=None):
+    """Run fn repeat times; returns (timings and memory, last result)"""
+    timings = []
+    peak = 0.0
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        with RssSampler() as sampler:
+            started = time.perf_counter()
+            result = fn()
+            timings.append(time.perf_counter() - started)
+        peak = max(peak, sampler.peak)
+    return {
+        "wall_seconds": {
+            "min": round(min(timings), 6),
+            "median": round(statistics.median(timings), 6),
+            "max": round(max(timings), 6),
+        },
+        "peak_rss_mb": round(peak, 1),
+    }, result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=BACKEND_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(data_dir, repeat):
+    os.environ["CSV_DIR"] = os.path.abspath(data_dir)
+    os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.pop("POCKETBASE_URL", None)
+    sys.path.insert(0, BACKEND_DIR)
+
+    results = {}
+    rss_before = current_rss_mb()
+
+    # Import builds the bot, which loads every table and derived structure
+    # (its progress output goes to stderr so stdout stays valid JSON)
+    with RssSampler() as sampler, contextlib.redirect_stdout(sys.stderr):
+        started = time.perf_counter()
+        import utils
+        from context import estimate_tokens
+        from columnar_cache import cache_path_for
+        elapsed = time.perf_counter() - started
+    results["bot_init"] = {
+        "wall_seconds": {"min": round(elapsed, 6), "median": round(elapsed, 6), "max": round(elapsed, 6)},
+        "peak_rss_mb": round(sampler.peak, 1),
+        "rss_delta_mb": round(current_rss_mb() - rss_before, 1),
+    }
+    bot = utils.bot
+    snapshot = bot.reference_data.current
+
+    for table, file_name in TABLE_FILES.items():
+        path = os.path.join(os.environ["CSV_DIR"], file_name)
+        required = bot.required_columns[table]
+
+        def drop_cache(path=path):
+            if os.path.exists(cache_path_for(path)):
+                os.unlink(cache_path_for(path))
+
+        stats, df = measure(lambda: bot._load_csv_with_validation(path, required), repeat, setup=drop_cache)
+        results[f"load_csv.{table}.parse"] = dict(stats, rows=len(df))
+        bot._load_csv_with_validation(path, required)
+        stats, df = measure(lambda: bot._load_csv_with_validation(path, required), repeat)
+        results[f"load_csv.{table}.cached"] = dict(stats, rows=len(df))
+
+    stats, snapshot = measure(lambda: bot.reload_reference_data(list(TABLE_FILES)), repeat)
+    results["reload_reference_data"] = stats
+
+    # Largest exporter by row count, and a typical one, exercise both ends of the distribution
+    counts = snapshot.shipments_df["Exporter ID"].value_counts()
+    exporters = {"largest": counts.index[0], "median": counts.index[len(counts) // 2]}
+    context = snapshot.get('context')
+
+    stats, _ = measure(bot.create_system_prompt, repeat)
+    results["create_system_prompt"] = dict(stats, prompt_tokens=estimate_tokens(bot.system_prompt_rules))
+
+    stats, prompt = measure(lambda: bot.build_system_prompt(None, snapshot), repeat, setup=context._cache.clear)
+    results["build_system_prompt.summary"] = dict(stats, prompt_tokens=estimate_tokens(prompt))
+    for label, exporter_id in exporters.items():
+        stats, prompt = measure(lambda: bot.build_system_prompt(exporter_id, snapshot), repeat,
+                                setup=context._cache.clear)
+        results[f"build_system_prompt.{label}_exporter"] = dict(
+            stats, exporter_id=exporter_id, rows=int(counts[exporter_id]), prompt_tokens=estimate_tokens(prompt)
+        )
+
+    rollups = snapshot.get('rollups')
+
+    def clear_rollups():
+        rollups._views.clear()
+        rollups._rendered.clear()
+
+    # Aggregate questions get rollups in place of rows
+    for label, exporter_id in (("overall", None), *exporters.items()):
+        stats, prompt = measure(lambda: bot.build_system_blocks(exporter_id, snapshot, aggregate=True)[1]["text"],
+                                repeat, setup=clear_rollups)
+        results[f"build_system_prompt.rollups_{label}"] = dict(stats, prompt_tokens=estimate_tokens(prompt))
+
+    for label, exporter_id in exporters.items():
+        stats, analysis = measure(lambda: bot.analyze_compliance(exporter_id, snapshot), repeat)
+        results[f"analyze_compliance.{label}_exporter"] = dict(
+            stats, exporter_id=exporter_id, result_tokens=estimate_tokens(analysis)
+        )
+
+    names = snapshot.shipments_df.drop_duplicates("Exporter ID").set_index("Exporter ID")["Exporter Name"]
+    name = names[exporters["median"]]
+    queries = {
+        "exact": name,
+        "partial": name.split()[0],
+        "misspelled": name[:2] + name[3] + name[2] + name[4:],
+    }
+    for label, query in queries.items():
+        stats, found = measure(lambda: bot.find_exporter_by_name(query), repeat)
+        results[f"find_exporter_by_name.{label}"] = dict(stats, query=query, found=found)
+
+    from fastapi.testclient import TestClient
+    from app import app
+    client = TestClient(app)
+
+    def reset_directory():
+        bot._directory_cache = None
+
+    for label, params, setup in (
+        ("cold", {}, reset_directory),
+        ("cached", {}, None),
+        ("page_100", {"limit": 100}, None),
+    ):
+        stats, response = measure(lambda: client.get("/list_exporters", params=params), repeat, setup=setup)
+        body = response.json()
+        results[f"list_exporters.{label}"] = dict(
+            stats, status=response.status_code, exporters=len(body.get("exporters", [])),
+            response_bytes=len(response.content)
+        )
+
+    import pandas as pd
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "data_dir": os.environ["CSV_DIR"],
+            "rows": {table: len(df) for table, df in snapshot.tables.items()},
+            "exporters": len(context.exporter_ids()),
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "final_rss_mb": round(current_rss_mb(), 1),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """Print per-step changes against a baseline run; returns the steps that regressed"""
+    regressions = []
+    print(f"{'step':48} {'baseline s':>11} {'current s':>11} {'change':>8} {'rss MB':>8} {'tokens':>14}")
+    for step, result in current["results"].items():
+        before = baseline["results"].get(step)
+        if before is None:
+            print(f"{step:48} {'(new)':>11} {result['wall_seconds']['median']:>11.4f}")
+            continue
+        old, new = before["wall_seconds"]["median"], result["wall_seconds"]["median"]
+        change = (new - old) / old if old else 0.0
+        tokens = ""
+        if "prompt_tokens" in result:
+            tokens = f"{before.get('prompt_tokens')}->{result['prompt_tokens']}"
+        flags = []
+        if change > threshold and max(old, new) >= MIN_COMPARABLE_SECONDS:
+            flags.append("slower")
+        if result.get("prompt_tokens", 0) > (before.get("prompt_tokens") or 0) * (1 + threshold):
+            flags.append("more tokens")
+        if flags:
+            regressions.append((step, flags))
+        print(f"{step:48} {old:>11.4f} {new:>11.4f} {change:>+7.0%} {result['peak_rss_mb']:>8.1f} {tokens:>14}"
+              + (f"  REGRESSION: {', '.join(flags)}" if flags else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the reference data path")
+    parser.add_argument("--data", default=os.path.join(os.path.dirname(BACKEND_DIR), "CSV"),
+                        help="Directory with documents.csv, shipments.csv and traceability_records.csv")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per step (the median is compared)")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed fractional slowdown or token growth before a step counts as a regression")
+    args = parser.parse_args()
+
+    report = run(args.data, args.repeat)
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    elif not args.compare:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s)")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
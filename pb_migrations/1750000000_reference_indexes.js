@@ -0,0 +1,48 @@
+// reference_indexes.js
+// Fields the CSV sync carries over that the original collections lacked, plus
+// the indexes the bot's per-exporter queries and the sync's upserts rely on.
+const REFERENCE_FIELDS = {
+    documents: ["exporter_name", "linked_record_ids"],
+    shipments: ["exporter_name", "country_of_origin", "destination_country", "linked_record_ids"],
+    traceability_records: []
+}
+
+const REFERENCE_INDEXES = {
+    documents: [
+        "CREATE UNIQUE INDEX idx_documents_document_id ON documents (document_id)",
+        "CREATE INDEX idx_documents_exporter_id ON documents (exporter_id)"
+    ],
+    shipments: [
+        "CREATE UNIQUE INDEX idx_shipments_shipment_id ON shipments (shipment_id)",
+        "CREATE INDEX idx_shipments_exporter_id ON shipments (exporter_id)"
+    ],
+    traceability_records: [
+        "CREATE UNIQUE INDEX idx_traceability_records_record_id ON traceability_records (record_id)",
+        "CREATE INDEX idx_traceability_records_exporter_id ON traceability_records (exporter_id)"
+    ]
+}
+
+migrate((app) => {
+    for (const name of Object.keys(REFERENCE_INDEXES)) {
+        let collection = app.findCollectionByNameOrId(name)
+        for (const field of REFERENCE_FIELDS[name]) {
+            collection.fields.add(new TextField({
+                name: field,
+                required: false
+            }))
+        }
+        for (const index of REFERENCE_INDEXES[name]) {
+            collection.indexes.push(index)
+        }
+        app.save(collection)
+    }
+}, (app) => {
+    for (const name of Object.keys(REFERENCE_INDEXES)) {
+        let collection = app.findCollectionByNameOrId(name)
+        for (const field of REFERENCE_FIELDS[name]) {
+            collection.fields.removeByName(field)
+        }
+        collection.indexes = collection.indexes.filter((index) => !REFERENCE_INDEXES[name].includes(index))
+        app.save(collection)
+    }
+})
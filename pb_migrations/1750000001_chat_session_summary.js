@@ -0,0 +1,20 @@
+// chat_session_summary.js
+// Rolling summary of a session's older turns and how many turns it covers, so a
+// session reloaded from PocketBase keeps its compacted history.
+migrate((app) => {
+    let collection = app.findCollectionByNameOrId("chat_sessions")
+    collection.fields.add(new TextField({
+        name: "summary",
+        required: false
+    }))
+    collection.fields.add(new NumberField({
+        name: "summarized_turns",
+        required: false
+    }))
+    app.save(collection)
+}, (app) => {
+    let collection = app.findCollectionByNameOrId("chat_sessions")
+    collection.fields.removeByName("summary")
+    collection.fields.removeByName("summarized_turns")
+    app.save(collection)
+})
@@ -0,0 +1,38 @@
+import os
+import sys
+import shutil
+
+import pytest
+
+# Backend modules are imported by top-level name, as they are in the app container
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "Backend"))
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """
+    The FastAPI app over a copy of the sample CSVs, with no PocketBase, Groq or
+    shared directory. utils reads its configuration at import, so every test
+    using the bot shares this one instance.
+    """
+    csv_dir = tmp_path_factory.mktemp("csv")
+    for name in os.listdir(os.path.join(REPO_DIR, "CSV")):
+        if name.endswith(".csv"):
+            shutil.copy(os.path.join(REPO_DIR, "CSV", name), csv_dir)
+    os.environ.update({"CSV_DIR": str(csv_dir), "ANTHROPIC_API_KEY": "test-key", "LOG_LEVEL": "WARNING"})
+    for name in ("POCKETBASE_URL", "GROQ_API_KEY", "SHARED_REFERENCE_DIR"):
+        os.environ.pop(name, None)
+    import app
+    return app
+
+
+@pytest.fixture(scope="session")
+def bot(app_module):
+    return app_module.bot
+
+
+@pytest.fixture
+def client(app_module):
+    from fastapi.testclient import TestClient
+    return TestClient(app_module.app)
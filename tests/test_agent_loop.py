@@ -0,0 +1,127 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from response_cache import ResponseCache
+
+
+def tool_use(name, tool_input, block_id="tool-1"):
+    return SimpleNamespace(type="tool_use", id=block_id, name=name, input=tool_input)
+
+
+def text(value):
+    return SimpleNamespace(type="text", text=value)
+
+
+class FakeStream:
+    def __init__(self, message):
+        self.message = message
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for block in self.message.content:
+            if block.type == "tool_use":
+                yield SimpleNamespace(type="content_block_start", content_block=block)
+            elif block.type == "text":
+                yield SimpleNamespace(type="content_block_delta",
+                                      delta=SimpleNamespace(type="text_delta", text=block.text))
+
+    async def get_final_message(self):
+        return self.message
+
+
+class FakeMessages:
+    """Replays scripted steps: a list of content blocks per model call"""
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.requests = []
+
+    def stream(self, **request):
+        self.requests.append(request)
+        content = self.steps.pop(0) if self.steps else [text("done")]
+        stop_reason = "tool_use" if any(block.type == "tool_use" for block in content) else "end_turn"
+        usage = SimpleNamespace(input_tokens=1, output_tokens=1)
+        return FakeStream(SimpleNamespace(content=content, stop_reason=stop_reason, usage=usage))
+
+
+@pytest.fixture(autouse=True)
+def response_cache(bot, monkeypatch):
+    cache = ResponseCache(enabled=True)
+    monkeypatch.setattr(bot, "response_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def fake_model(bot, monkeypatch):
+    def install(steps):
+        messages = FakeMessages(steps)
+        monkeypatch.setattr(bot, "client", SimpleNamespace(messages=messages))
+        return messages
+    return install
+
+
+def ask(bot, query, exporter_id=None):
+    async def collect():
+        return [event async for event in bot._process_query_stream(query, exporter_id)]
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("block, cached", [
+    (tool_use("analyze_compliance", {"exporter_id": "EX001"}), True),
+    (tool_use("analyze_compliance", {"exporter_id": "EX002"}), False),
+    (tool_use("find_exporter", {"query": "orchard"}), False),
+    (tool_use("trace_links", {"record_id": "S-1002"}), False),
+])
+def test_only_answers_scoped_to_the_context_exporter_are_cached(bot, fake_model, block, cached):
+    fake_model([[block], [text("answer")]])
+    ask(bot, "how am I doing?", "EX001")
+
+    # A cached answer is replayed without calling the model again
+    second = fake_model([[text("fresh answer")]])
+    events = ask(bot, "how am I doing?", "EX001")
+    assert (second.requests == []) is cached
+    assert ({"type": "usage", "response_cache_hit": True} in events) is cached
+
+
+def test_cross_exporter_tools_are_cacheable_without_context(bot, fake_model, response_cache):
+    fake_model([[tool_use("trace_links", {"record_id": "S-1002"})], [text("answer")]])
+    ask(bot, "where did S-1002 come from?")
+    assert len(response_cache._entries) == 1
+
+
+def test_profile_creation_is_never_cached(bot):
+    block = tool_use("collect_exporter_info", {"exporter_name": "New Co"})
+    assert not bot._tool_within_cache_key(block, None)
+    assert not bot._tool_within_cache_key(block, "EX001")
+
+
+def test_tool_results_go_back_in_one_follow_up(bot, fake_model):
+    messages = fake_model([[tool_use("find_exporter", {"query": "orchard"}, "a"),
+                            tool_use("trace_links", {"record_id": "S-1002"}, "b")], [text("answer")]])
+    events = ask(bot, "which orchard shipped S-1002?")
+    assert len(messages.requests) == 2
+    results = messages.requests[1]["messages"][-1]["content"]
+    assert [result["tool_use_id"] for result in results] == ["a", "b"]
+    assert "".join(event["text"] for event in events if event["type"] == "content") == "answer"
+
+
+def test_agent_loop_stops_at_the_step_cap(bot, fake_model, monkeypatch):
+    import utils
+    monkeypatch.setattr(utils, "AGENT_MAX_STEPS", 3)
+    # The model keeps asking for tools
+    messages = fake_model([[tool_use("find_exporter", {"query": "orchard"}, f"call-{i}")] for i in range(10)])
+    ask(bot, "find the orchard")
+    assert len(messages.requests) == 3
+    assert [request.get("tool_choice") for request in messages.requests] == [None, None, {"type": "none"}]
+    # Each follow-up carries the previous step's call and result
+    assert len(messages.requests[-1]["messages"]) == 5
@@ -0,0 +1,96 @@
+import os
+
+import pandas as pd
+import pytest
+
+import columnar_cache
+from columnar_cache import cache_path_for, load_cached_table, map_table_file, write_table_file
+
+
+@pytest.fixture
+def csv_file(tmp_path):
+    path = tmp_path / "shipments.csv"
+    path.write_text("Shipment ID,Exporter ID\nS-1,EX001\nS-2,EX002\n")
+    return str(path)
+
+
+class Parser:
+    def __init__(self, path):
+        self.path = path
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return pd.read_csv(self.path, dtype=str)
+
+
+def test_second_load_maps_the_cache_instead_of_parsing(csv_file):
+    parse = Parser(csv_file)
+    first = load_cached_table(csv_file, parse)
+    assert os.path.exists(cache_path_for(csv_file))
+    second = load_cached_table(csv_file, parse)
+    assert parse.calls == 1
+    assert second["Shipment ID"].tolist() == first["Shipment ID"].tolist() == ["S-1", "S-2"]
+
+
+def test_changed_size_rebuilds_the_cache(csv_file):
+    parse = Parser(csv_file)
+    load_cached_table(csv_file, parse)
+    with open(csv_file, "a") as f:
+        f.write("S-3,EX003\n")
+    assert load_cached_table(csv_file, parse)["Shipment ID"].tolist() == ["S-1", "S-2", "S-3"]
+    assert parse.calls == 2
+
+
+def test_touched_file_with_same_content_reuses_the_cache(csv_file, monkeypatch):
+    parse = Parser(csv_file)
+    load_cached_table(csv_file, parse)
+    stat = os.stat(csv_file)
+    os.utime(csv_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    hashed = []
+    sha256 = columnar_cache.file_sha256
+    monkeypatch.setattr(columnar_cache, "file_sha256", lambda path: hashed.append(path) or sha256(path))
+    load_cached_table(csv_file, parse)
+    assert parse.calls == 1
+    assert hashed == [csv_file]
+
+
+def test_same_size_different_content_is_reparsed(csv_file):
+    parse = Parser(csv_file)
+    load_cached_table(csv_file, parse)
+    stat = os.stat(csv_file)
+    with open(csv_file, "w") as f:
+        f.write("Shipment ID,Exporter ID\nS-9,EX009\nS-8,EX008\n")
+    os.utime(csv_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert load_cached_table(csv_file, parse)["Shipment ID"].tolist() == ["S-9", "S-8"]
+    assert parse.calls == 2
+
+
+def test_corrupt_cache_is_rebuilt(csv_file):
+    parse = Parser(csv_file)
+    load_cached_table(csv_file, parse)
+    with open(cache_path_for(csv_file), "wb") as f:
+        f.write(b"not arrow")
+    assert load_cached_table(csv_file, parse)["Exporter ID"].tolist() == ["EX001", "EX002"]
+    assert parse.calls == 2
+    load_cached_table(csv_file, parse)
+    assert parse.calls == 2
+
+
+def test_disabled_cache_always_parses(csv_file, monkeypatch):
+    monkeypatch.setattr(columnar_cache, "CSV_CACHE_ENABLED", False)
+    parse = Parser(csv_file)
+    load_cached_table(csv_file, parse)
+    load_cached_table(csv_file, parse)
+    assert parse.calls == 2
+    assert not os.path.exists(cache_path_for(csv_file))
+
+
+def test_table_files_round_trip_with_metadata(tmp_path):
+    path = str(tmp_path / "table.arrow")
+    df = pd.DataFrame({"Record ID": ["TR-1", "TR-2"], "Comments": ["", None]})
+    write_table_file(df, path, {"version": "3"})
+    assert columnar_cache._read_cache_key(path)["version"] == "3"
+    assert map_table_file(path)["Record ID"].tolist() == ["TR-1", "TR-2"]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
@@ -0,0 +1,78 @@
+import pandas as pd
+
+from compliance import ComplianceIssueIndex
+
+
+def build(documents=None, shipments=None, traceability=None):
+    return ComplianceIssueIndex(
+        pd.DataFrame(documents or {}), pd.DataFrame(shipments or {}), pd.DataFrame(traceability or {})
+    )
+
+
+DOCUMENTS = {
+    "Exporter ID": ["EX001", " EX002 ", "EX001"],
+    "Exporter Name": ["Iberian Orchard", "BellaCarota", "Iberian Orchard"],
+    "Document ID": ["D-1", "D-2", "D-3"],
+    "Status": ["Pending Review", "Pending Review", "Approved"],
+    "Comments": ["Missing signature", None, ""],
+}
+SHIPMENTS = {
+    "Exporter ID": ["EX001", "EX003"],
+    "Shipment ID": ["S-1", "S-2"],
+    "Compliance Status": ["Non-Compliant", "Compliant"],
+    "Product Description": ["Fresh Apples", "Carrots"],
+    "Arrival Port": ["Los Angeles", "Miami"],
+}
+TRACEABILITY = {
+    "Exporter ID": ["EX001", "EX002"],
+    "Record ID": ["TR-1", "TR-2"],
+    "Compliance Flag": ["Fail", "Pass"],
+    "Comments": ["Cold chain temperature excursion", "OK"],
+}
+
+
+def test_issues_per_exporter_are_ordered_by_severity():
+    index = build(DOCUMENTS, SHIPMENTS, TRACEABILITY)
+    issues = index.issues_for("EX001")
+    assert [(issue["issue_type"], issue["id"]) for issue in issues] == [
+        ("Shipment", "S-1"), ("Traceability Record", "TR-1"), ("Document", "D-1")
+    ]
+    assert issues[0]["details"] == "Non-compliant shipment of Fresh Apples to Los Angeles"
+    assert [issue["severity"] for issue in issues] == ["High", "High", "Medium"]
+
+
+def test_exporter_ids_are_stripped_and_missing_details_are_blank():
+    index = build(DOCUMENTS, SHIPMENTS, TRACEABILITY)
+    assert index.issues_for("EX002") == [
+        {"issue_type": "Document", "id": "D-2", "status": "Pending Review", "details": "", "severity": "Medium"}
+    ]
+
+
+def test_exporters_without_issues_still_have_reference_data():
+    index = build(DOCUMENTS, SHIPMENTS, TRACEABILITY)
+    assert index.issues_for("EX003") == []
+    assert index.has_reference_data("EX003")
+    assert not index.has_reference_data("EX999")
+
+
+def test_temperature_exporters():
+    assert build(DOCUMENTS, SHIPMENTS, TRACEABILITY).temperature_exporters == {"EX001"}
+
+
+def test_summary_counts():
+    summary = {row["exporter_id"]: row for row in build(DOCUMENTS, SHIPMENTS, TRACEABILITY).summary}
+    assert list(summary) == ["EX001", "EX002", "EX003"]
+    assert summary["EX001"] == {
+        "exporter_id": "EX001", "exporter_name": "Iberian Orchard", "pending_documents": 1,
+        "non_compliant_shipments": 1, "failed_traceability_records": 1, "total_issues": 3, "high_severity": 2,
+    }
+    assert summary["EX003"]["total_issues"] == 0
+    assert summary["EX003"]["exporter_name"] == "Unknown"
+
+
+def test_missing_columns_and_empty_tables_are_skipped():
+    index = build({"Exporter ID": ["EX001"], "Document ID": ["D-1"]}, None, None)
+    assert index.issues_for("EX001") == []
+    assert index.summary[0]["total_issues"] == 0
+    empty = build()
+    assert empty.summary == [] and empty.issues.empty
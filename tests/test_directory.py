@@ -0,0 +1,84 @@
+import pandas as pd
+import pytest
+
+from directory import ExporterDirectory, decode_cursor, encode_cursor, filter_exporters, paginate
+
+
+def exporters(count):
+    return [{"exporter_id": f"EX{i:03d}", "country": "Spain" if i % 2 else "Italy",
+             "industry": "Fresh Fruit", "has_profile": i % 3 == 0} for i in range(1, count + 1)]
+
+
+def test_cursor_round_trip():
+    for exporter_id in ("EX001", "exporter/with+symbols?", "ÉX-ü"):
+        cursor = encode_cursor(exporter_id)
+        assert "=" not in cursor
+        assert decode_cursor(cursor) == exporter_id
+
+
+def test_pages_cover_every_exporter_once():
+    rows = exporters(23)
+    seen, cursor = [], None
+    while True:
+        page, cursor = paginate(rows, cursor, limit=5)
+        seen.extend(row["exporter_id"] for row in page)
+        if cursor is None:
+            break
+    assert seen == [row["exporter_id"] for row in rows]
+
+
+def test_keyset_cursor_is_stable_when_rows_are_inserted():
+    rows = exporters(10)
+    page, cursor = paginate(rows, None, limit=4)
+    # A new exporter sorting before the cursor does not shift the next page
+    rows = sorted(rows + [{"exporter_id": "EX000", "country": "Spain", "industry": "", "has_profile": False}],
+                  key=lambda row: row["exporter_id"])
+    page, _ = paginate(rows, cursor, limit=4)
+    assert [row["exporter_id"] for row in page] == ["EX005", "EX006", "EX007", "EX008"]
+
+
+def test_no_limit_returns_everything_without_a_cursor():
+    assert paginate(exporters(3)) == (exporters(3), None)
+    assert paginate(exporters(3), limit=3) == (exporters(3), None)
+
+
+def test_invalid_cursor_raises_value_error():
+    with pytest.raises(ValueError):
+        paginate(exporters(3), "%%%not-base64", limit=1)
+
+
+def test_filters_are_case_insensitive():
+    rows = exporters(6)
+    assert {row["exporter_id"] for row in filter_exporters(rows, country="spain")} == {"EX001", "EX003", "EX005"}
+    assert len(filter_exporters(rows, industry="FRUIT")) == 6
+    assert [row["exporter_id"] for row in filter_exporters(rows, has_profile=True)] == ["EX003", "EX006"]
+
+
+def test_directory_merges_profiles_over_csv_entries():
+    documents = pd.DataFrame({"Exporter ID": ["EX001"], "Exporter Name": ["Docs Name"]})
+    shipments = pd.DataFrame({"Exporter ID": ["EX001", "EX002"], "Exporter Name": ["Ship Name", "Second"],
+                              "Country of Origin": ["Spain", "Italy"], "Product Type": ["Fruit", "Vegetables"]})
+    directory = ExporterDirectory(documents, shipments)
+    assert directory.entries["EX001"]["exporter_name"] == "Docs Name"
+    merged = directory.merge_profiles({"EX003": {"Exporter Name": "Chat Co", "Country of Origin": "Peru"}})
+    assert [row["exporter_id"] for row in merged] == ["EX001", "EX002", "EX003"]
+    assert merged[2] == {"exporter_id": "EX003", "exporter_name": "Chat Co", "country": "Peru",
+                         "industry": "Unknown", "has_profile": True}
+
+
+def test_list_exporters_pages_and_revalidates_with_etag(client):
+    first = client.get("/list_exporters", params={"limit": 2})
+    assert first.status_code == 200
+    body = first.json()
+    assert len(body["exporters"]) == 2 and body["next_cursor"]
+
+    rest = client.get("/list_exporters", params={"limit": 1000, "cursor": body["next_cursor"]}).json()
+    ids = [row["exporter_id"] for row in body["exporters"] + rest["exporters"]]
+    assert ids == sorted(ids) and len(ids) == body["total_count"] and rest["next_cursor"] is None
+
+    etag = first.headers["ETag"]
+    assert client.get("/list_exporters", params={"limit": 2}, headers={"If-None-Match": etag}).status_code == 304
+    # A different view gets a different tag
+    other = client.get("/list_exporters", params={"limit": 3})
+    assert other.headers["ETag"] != etag
+    assert client.get("/list_exporters", params={"cursor": "%%%"}).status_code == 400
@@ -0,0 +1,86 @@
+import io
+import zipfile
+from xml.etree import ElementTree
+
+import pandas as pd
+import pytest
+
+from fda_export import EXPORT_COLUMNS, FDASpreadsheetExport, _column_letter, _xlsx_rows
+
+SHEET_NS = {"s": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+
+@pytest.fixture
+def snapshot(bot):
+    return bot.reference_data.current
+
+
+def read_csv(chunks):
+    data = b"".join(chunks)
+    assert data.startswith(b"\xef\xbb\xbf")
+    return pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, encoding="utf-8-sig")
+
+
+def read_xlsx(chunks):
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.testzip() is None
+    sheet = ElementTree.fromstring(archive.read("xl/worksheets/sheet1.xml"))
+    rows = [[cell.findtext("s:is/s:t", "", SHEET_NS) for cell in row.findall("s:c", SHEET_NS)]
+            for row in sheet.findall("s:sheetData/s:row", SHEET_NS)]
+    return archive, sheet, rows
+
+
+def test_csv_has_one_row_per_event_ordered_by_lot_and_time(snapshot):
+    export = FDASpreadsheetExport(snapshot)
+    frame = read_csv(export.csv_chunks())
+    assert list(frame.columns) == EXPORT_COLUMNS
+    assert len(frame) == len(export) == len(snapshot.traceability_df)
+    keys = list(zip(frame["Traceability Lot Code"], frame["Event Date/Time"]))
+    assert keys == sorted(keys)
+
+
+def test_chunking_does_not_change_the_output(snapshot):
+    whole = b"".join(FDASpreadsheetExport(snapshot).csv_chunks())
+    chunks = list(FDASpreadsheetExport(snapshot, chunk_rows=2).csv_chunks())
+    assert len(chunks) > 2
+    assert b"".join(chunks) == whole
+
+
+def test_filters_narrow_the_rows(snapshot):
+    frame = read_csv(FDASpreadsheetExport(snapshot, exporter_id="EX001").csv_chunks())
+    assert len(frame) and set(frame["Exporter ID"]) == {"EX001"}
+    lot = frame["Traceability Lot Code"].iloc[0]
+    assert set(read_csv(FDASpreadsheetExport(snapshot, lot_number=lot).csv_chunks())["Traceability Lot Code"]) == {lot}
+    assert len(FDASpreadsheetExport(snapshot, exporter_id="EX999")) == 0
+
+
+def test_xlsx_matches_the_csv(snapshot):
+    export = FDASpreadsheetExport(snapshot, chunk_rows=3)
+    archive, sheet, rows = read_xlsx(export.xlsx_chunks())
+    csv_rows = read_csv(FDASpreadsheetExport(snapshot).csv_chunks())
+    assert rows[0] == EXPORT_COLUMNS
+    assert rows[1:] == csv_rows.values.tolist()
+    last_cell = f"{_column_letter(len(EXPORT_COLUMNS) - 1)}{len(export) + 1}"
+    assert sheet.find("s:autoFilter", SHEET_NS).get("ref") == f"A1:{last_cell}"
+    assert {"[Content_Types].xml", "_rels/.rels", "xl/workbook.xml"} <= set(archive.namelist())
+
+
+def test_xlsx_cells_are_escaped_and_stripped_of_control_characters():
+    xml = _xlsx_rows(pd.DataFrame({"a": ["<b> & c\x01"], "b": ["line\x0bbreak"]}))
+    row = ElementTree.fromstring(xml)
+    assert [cell.findtext("is/t") for cell in row] == ["<b> & c", "linebreak"]
+
+
+def test_file_names_are_safe(snapshot):
+    export = FDASpreadsheetExport(snapshot, lot_number="LOT/../1 2")
+    assert export.file_name("csv") == f"fda_traceability_LOT_1_2_v{snapshot.version}.csv"
+
+
+def test_export_endpoint_streams_both_formats(client):
+    response = client.get("/export/fda", params={"exporter_id": "EX001"})
+    assert response.status_code == 200
+    assert int(response.headers["X-Record-Count"]) == len(read_csv([response.content]))
+    assert 'filename="fda_traceability_EX001_v' in response.headers["Content-Disposition"]
+    xlsx = client.get("/export/fda", params={"exporter_id": "EX001", "format": "xlsx"})
+    assert len(read_xlsx([xlsx.content])[2]) == int(response.headers["X-Record-Count"]) + 1
+    assert client.get("/export/fda", params={"exporter_id": "EX999"}).status_code == 404
@@ -0,0 +1,110 @@
+import json
+import asyncio
+
+from framing import coalesce_events, encode_ndjson, sse_message
+
+INFO = {"type": "metadata", "message_type": "info"}
+
+
+def content(text):
+    return {"type": "content", "text": text}
+
+
+async def from_list(events, delay=0):
+    for event in events:
+        if delay:
+            await asyncio.sleep(delay)
+        yield event
+
+
+def collect(events, **options):
+    async def run():
+        return [event async for event in coalesce_events(events, echo=False, **options)]
+    return asyncio.run(run())
+
+
+def test_deltas_are_merged_and_metadata_keeps_its_position():
+    events = [INFO, content("Hel"), content("lo"), {"type": "metadata", "message_type": "compliance"},
+              content(" wor"), content("ld")]
+    assert collect(from_list(events), window_ms=1000) == [
+        INFO, content("Hello"), {"type": "metadata", "message_type": "compliance"}, content(" world")
+    ]
+
+
+def test_text_is_never_lost_or_reordered():
+    deltas = [content(f"{i} ") for i in range(200)]
+    frames = collect(from_list(deltas), window_ms=1000, max_bytes=64)
+    assert "".join(frame["text"] for frame in frames) == "".join(delta["text"] for delta in deltas)
+    assert all(len(frame["text"].encode()) < 64 + 8 for frame in frames)
+    assert len(frames) > 1
+
+
+def test_window_flushes_while_the_producer_is_idle():
+    async def slow():
+        yield content("first")
+        await asyncio.sleep(0.2)
+        yield content("second")
+
+    async def run():
+        received = []
+        started = asyncio.get_running_loop().time()
+        async for event in coalesce_events(slow(), window_ms=20, echo=False):
+            received.append((event["text"], asyncio.get_running_loop().time() - started))
+        return received
+
+    received = asyncio.run(run())
+    assert [text for text, _ in received] == ["first", "second"]
+    # "first" went out after the window, not when "second" arrived
+    assert received[0][1] < 0.15
+
+
+def test_tasks_are_only_created_while_text_is_buffered(monkeypatch):
+    import framing
+    created = []
+    ensure_future = asyncio.ensure_future
+
+    def counting(awaitable):
+        created.append(awaitable)
+        return ensure_future(awaitable)
+
+    monkeypatch.setattr(framing.asyncio, "ensure_future", counting)
+    events = [INFO, {"type": "metadata", "message_type": "compliance"}, content("a"), content("b"), INFO]
+    assert collect(from_list(events), window_ms=1000) == [
+        INFO, {"type": "metadata", "message_type": "compliance"}, content("ab"), INFO
+    ]
+    # Only the two events read while "a" and then "ab" waited on the timer
+    assert len(created) == 2
+
+
+def test_content_frames_with_extra_fields_are_not_merged():
+    events = [content("a"), {"type": "content", "text": "b", "source": "cache"}, content("c")]
+    assert collect(from_list(events), window_ms=1000) == events
+
+
+def test_closing_the_stream_stops_the_producer():
+    closed = asyncio.Event()
+
+    async def endless():
+        try:
+            while True:
+                await asyncio.sleep(0.001)
+                yield content("x")
+        finally:
+            closed.set()
+
+    async def run():
+        stream = coalesce_events(endless(), window_ms=5, echo=False)
+        await stream.__anext__()
+        await stream.aclose()
+        return closed.is_set()
+
+    assert asyncio.run(run())
+
+
+def test_wire_formats():
+    event = {"type": "content", "text": "naïve \"quoted\"\nline"}
+    line = encode_ndjson(event)
+    assert line.endswith(b"\n") and line.count(b"\n") == 1
+    assert json.loads(line) == event
+    assert sse_message(event) == {"event": "content", "data": json.dumps(event)}
+    assert sse_message({"text": "no type"})["event"] == "message"
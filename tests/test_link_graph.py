@@ -0,0 +1,109 @@
+import pandas as pd
+import pytest
+
+from link_graph import LinkGraph
+
+
+@pytest.fixture
+def graph():
+    documents = pd.DataFrame({
+        "Document ID": ["D-1", "D-2"],
+        "Exporter ID": ["EX001", "EX002"],
+        "Document Type": ["Invoice", "Certificate"],
+        "Date Issued": ["2024-01-01", "2024-01-02"],
+        "Status": ["Valid", "Valid"],
+        "Linked Shipment ID": ["S-1", "S-404"],
+        "Linked Traceability Record IDs": ["TR-1, TR-2", None],
+    })
+    shipments = pd.DataFrame({
+        "Shipment ID": ["S-1", "S-2"],
+        "Exporter ID": ["EX001", "EX002"],
+        "Product Description": ["Mangoes", "Shrimp"],
+        "Export Date": ["2024-01-03", "2024-01-04"],
+        "Arrival Port": ["Miami", "Houston"],
+        "Compliance Status": ["Compliant", "Pending"],
+        "Linked Traceability Record IDs": ["TR-1,TR-9", "TR-3"],
+    })
+    traceability = pd.DataFrame({
+        "Record ID": ["TR-1", "TR-2", "TR-3"],
+        "Exporter ID": ["EX001", "EX001", "EX002"],
+        "Food Product": ["Mangoes", "Mangoes", "Shrimp"],
+        "CTE Type": ["Harvest", "Shipping", "Harvest"],
+        "Timestamp": ["2024-01-01", "2024-01-02", "2024-01-03"],
+        "Compliance Flag": ["Yes", "Yes", "No"],
+        "Lot Number": ["LOT-A", "LOT-A", "LOT-B"],
+        "Batch Number": ["B1", "B2", "B3"],
+        "Supplier ID": ["SUP-1", "SUP-1", "SUP-2"],
+    })
+    return LinkGraph(documents, shipments, traceability)
+
+
+def node_ids(walk):
+    return {node["id"] for node in walk["nodes"]}
+
+
+def test_dangling_links_are_reported_per_column(graph):
+    report = graph.dangling_report()
+    assert report["total"] == 2
+    assert report["by_column"] == {"documents.Linked Shipment ID": 1, "shipments.Linked Traceability Record IDs": 1}
+    assert sorted((link["source_id"], link["missing_id"], link["target_kind"]) for link in report["links"]) == [
+        ("D-2", "S-404", "shipment"), ("S-1", "TR-9", "record")
+    ]
+    assert len(graph.dangling_report(limit=1)["links"]) == 1
+    assert graph.dangling_report(limit=1)["total"] == 2
+
+
+def test_walk_follows_links_both_ways_and_flags_missing_rows(graph):
+    walk = graph.walk("S-1", max_depth=1)
+    assert node_ids(walk) == {"S-1", "TR-1", "TR-9", "D-1"}
+    assert walk["dangling"] == ["TR-9"]
+    missing = next(node for node in walk["nodes"] if node["id"] == "TR-9")
+    assert missing["missing"] and missing["details"] is None
+    assert {"from": "D-1", "to": "S-1", "relation": "linked_shipment"} in walk["edges"]
+    assert {"from": "S-1", "to": "TR-1", "relation": "linked_record"} in walk["edges"]
+
+
+def test_walk_depth_and_details(graph):
+    walk = graph.walk("TR-3", max_depth=3)
+    assert node_ids(walk) == {"TR-3", "S-2", "LOT-B", "B3", "SUP-2"}
+    depths = {node["id"]: node["depth"] for node in walk["nodes"]}
+    assert depths["TR-3"] == 0 and depths["S-2"] == 1
+    details = next(node for node in walk["nodes"] if node["id"] == "S-2")["details"]
+    assert details["Product Description"] == "Shrimp"
+
+
+def test_hubs_are_only_expanded_from_the_root(graph):
+    # TR-2 reaches LOT-A and SUP-1 but does not pass through them to every other record
+    from_record = graph.walk("TR-2", max_depth=2)
+    assert {"LOT-A", "SUP-1"} <= node_ids(from_record)
+    lot = next(node for node in from_record["nodes"] if node["id"] == "LOT-A")
+    assert lot["depth"] == 1
+    assert not any(edge["from"] != "TR-2" and edge["to"] == "LOT-A" for edge in from_record["edges"])
+    from_lot = graph.walk("LOT-A", max_depth=1)
+    assert node_ids(from_lot) == {"LOT-A", "TR-1", "TR-2"}
+
+
+def test_walk_is_capped_and_unknown_ids_return_none(graph):
+    walk = graph.walk("D-1", max_depth=6, max_nodes=3)
+    assert len(walk["nodes"]) == 3 and walk["truncated"]
+    assert graph.walk("NOPE") is None
+    assert graph.walk(" S-1 ")["id"] == "S-1"
+
+
+def test_dangling_target_is_resolvable(graph):
+    assert graph.resolve("S-404") == ["shipment"]
+    assert graph.details("shipment", "S-404") is None
+    assert graph.walk("S-404", max_depth=1)["dangling"] == ["S-404"]
+
+
+def test_linking_rows_returns_source_row_positions(graph):
+    record = graph.codes["record"]["TR-1"]
+    assert graph.linking_rows(("shipment", "linked_record", "record"), record).tolist() == [0]
+    assert graph.linking_rows(("document", "linked_record", "record"), record).tolist() == [0]
+    assert graph.linking_rows(("shipment", "linked_record", "record"), graph.codes["record"]["TR-2"]).tolist() == []
+
+
+def test_empty_tables_build_an_empty_graph():
+    graph = LinkGraph(pd.DataFrame(), pd.DataFrame(), pd.DataFrame())
+    assert graph.dangling_report() == {"total": 0, "by_column": {}, "links": []}
+    assert graph.walk("S-1") is None
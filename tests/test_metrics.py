@@ -0,0 +1,62 @@
+import os
+import time
+
+from metrics import MetricsRegistry, SharedMetrics
+
+
+def registry(worker):
+    metrics = MetricsRegistry(worker=worker)
+    requests = metrics.counter("requests_total", "Requests", ("route",))
+    latency = metrics.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+    metrics.gauge("version", "Version", lambda: 7)
+    return metrics, requests, latency
+
+
+def test_series_are_labelled_with_the_worker():
+    metrics, requests, latency = registry("w1")
+    requests.inc(route="claude")
+    latency.observe(0.5)
+    lines = metrics.render().splitlines()
+    assert 'requests_total{route="claude",worker="w1"} 1' in lines
+    assert 'latency_seconds_bucket{worker="w1",le="1"} 1' in lines
+    assert 'latency_seconds_count{worker="w1"} 1' in lines
+    assert 'version{worker="w1"} 7' in lines
+
+
+def test_default_worker_is_the_process_id():
+    metrics, requests, _ = registry(None)
+    requests.inc(route="groq")
+    assert f'requests_total{{route="groq",worker="{os.getpid()}"}} 1' in metrics.render()
+
+
+def test_any_worker_renders_every_workers_series_once(tmp_path):
+    first, first_requests, _ = registry("w1")
+    second, second_requests, _ = registry("w2")
+    first_requests.inc(route="claude")
+    second_requests.inc(3, route="claude")
+    SharedMetrics(str(tmp_path), first).publish()
+    shared = SharedMetrics(str(tmp_path), second)
+    shared.publish()
+
+    text = second.render(shared.collect())
+    assert 'requests_total{route="claude",worker="w1"} 1' in text
+    assert 'requests_total{route="claude",worker="w2"} 3' in text
+    # One HELP/TYPE header per metric family
+    assert text.count("# TYPE requests_total counter") == 1
+
+
+def test_snapshots_of_stopped_workers_are_dropped(tmp_path):
+    first, _, _ = registry("w1")
+    second, _, _ = registry("w2")
+    SharedMetrics(str(tmp_path), first, interval=1).publish()
+    path = tmp_path / "w1.json"
+    stale = time.time() - 10
+    os.utime(path, (stale, stale))
+    assert SharedMetrics(str(tmp_path), second, interval=1).collect() == {}
+    assert not path.exists()
+
+
+def test_metrics_endpoint(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert f'fdabot_reference_data_version{{worker="{os.getpid()}"}}' in response.text
@@ -0,0 +1,68 @@
+import pandas as pd
+
+from name_index import ExporterNameIndex, normalize_tokens, search_exporters, trigrams
+
+
+def reference_index():
+    documents = pd.DataFrame({"Exporter ID": ["EX001", "EX002", "EX003"],
+                              "Exporter Name": ["Agrícola Carrots SRL", "Verde Fruit Co", "Nordic Fish AS"]})
+    shipments = pd.DataFrame({
+        "Exporter ID": ["EX001", "EX002", "EX003"],
+        "Exporter Name": ["Agrícola Carrots SRL", "Verde Fruit Co", "Nordic Fish AS"],
+        "Country of Origin": ["Italy", "Spain", "Norway"],
+        "Product Type": ["Vegetables", "Fruit", "Seafood"],
+        "Product Description": ["Fresh carrots", "Oranges", "Salmon fillets"],
+    })
+    return ExporterNameIndex.from_reference_data(documents, shipments, pd.DataFrame())
+
+
+def test_tokens_are_normalized_and_accents_stripped():
+    assert normalize_tokens("Agrícola-Carrots, S.R.L.") == ["agricola", "carrots", "s", "r", "l"]
+    assert trigrams("ab") == {"$ab", "ab$"}
+
+
+def test_exact_name_ranks_first():
+    results = search_exporters([reference_index()], "Verde Fruit")
+    assert results[0]["exporter_id"] == "EX002"
+    assert results[0]["exporter_name"] == "Verde Fruit Co"
+
+
+def test_misspelled_and_unaccented_names_still_match():
+    index = reference_index()
+    assert search_exporters([index], "agricola carots")[0]["exporter_id"] == "EX001"
+    assert search_exporters([index], "nordik fish")[0]["exporter_id"] == "EX003"
+
+
+def test_name_hits_outrank_attribute_hits():
+    documents = pd.DataFrame({"Exporter ID": ["EX010"], "Exporter Name": ["Salmon Brothers"]})
+    shipments = pd.DataFrame({"Exporter ID": ["EX011"], "Exporter Name": ["Other Exporter"],
+                              "Product Description": ["Salmon"]})
+    index = ExporterNameIndex.from_reference_data(documents, shipments, pd.DataFrame())
+    assert [row["exporter_id"] for row in search_exporters([index], "salmon")] == ["EX010", "EX011"]
+
+
+def test_stopwords_do_not_match_everything():
+    index = reference_index()
+    assert search_exporters([index], "the company") == []
+
+
+def test_exporter_id_tokens_match_exactly():
+    results = search_exporters([reference_index()], "what about ex003")
+    assert results[0]["exporter_id"] == "EX003"
+    assert results[0]["matched"] == ["EX003"]
+
+
+def test_profiles_are_searched_alongside_reference_data():
+    profiles = ExporterNameIndex()
+    profiles.add_profile({"Exporter ID": "EX900", "Exporter Name": "Andes Berries",
+                          "Country of Origin": "Peru", "Industry Focus": "Fruit"})
+    results = search_exporters([reference_index(), profiles], "andes berries")
+    assert results[0] == {"exporter_id": "EX900", "exporter_name": "Andes Berries",
+                          "score": 1.0, "matched": ["andes", "berries"]}
+
+
+def test_limit_and_tie_order_are_deterministic():
+    index = ExporterNameIndex()
+    for exporter_id in ("EX003", "EX001", "EX002"):
+        index.add_text(exporter_id, "Coffee", 1.0)
+    assert [row["exporter_id"] for row in search_exporters([index], "coffee", limit=2)] == ["EX001", "EX002"]
@@ -0,0 +1,90 @@
+import re
+import asyncio
+
+import pytest
+
+from pb_backend import PocketBaseReferenceBackend
+from pb_sync import COLLECTIONS, to_records
+
+
+class FakePocketBase:
+    """Serves synced reference records, evaluating the equality/OR filters the backend sends"""
+
+    def __init__(self, snapshot):
+        self.collections = {
+            COLLECTIONS[table][0]: to_records(table, df) for table, df in (
+                ("documents", snapshot.documents_df),
+                ("shipments", snapshot.shipments_df),
+                ("traceability", snapshot.traceability_df),
+            )
+        }
+        self.requests = []
+        self.fail = False
+
+    async def json(self, method, path, params=None):
+        self.requests.append((path, params["filter"]))
+        if self.fail:
+            raise ConnectionError("PocketBase is down")
+        collection = path.split("/")[3]
+        terms = [re.match(r'(\w+)="(.*)"$', term).groups() for term in params["filter"].split(" || ")]
+        matches = [item for item in self.collections[collection]
+                   if any(str(item.get(field)) == value for field, value in terms)]
+        start = (params["page"] - 1) * params["perPage"]
+        return {"items": matches[start:start + params["perPage"]]}
+
+
+@pytest.fixture
+def snapshot(bot):
+    return bot.reference_data.current
+
+
+def scoped(backend, exporter_id, snapshot):
+    return asyncio.run(backend.exporter_snapshot(exporter_id, snapshot))
+
+
+def test_exporter_snapshot_holds_only_that_exporters_rows(bot, snapshot):
+    backend = PocketBaseReferenceBackend(FakePocketBase(snapshot))
+    exporter = scoped(backend, "EX001", snapshot)
+    assert exporter is not snapshot
+    assert set(exporter.documents_df["Exporter ID"]) == {"EX001"}
+    assert set(exporter.shipments_df["Shipment ID"]) >= set(
+        snapshot.shipments_df.loc[snapshot.shipments_df["Exporter ID"] == "EX001", "Shipment ID"])
+    assert len(exporter.traceability_df) < len(snapshot.traceability_df)
+    # Same answer as the in-memory tables, built from the scoped rows
+    assert bot.analyze_compliance("EX001", exporter) == bot.analyze_compliance("EX001", snapshot)
+    assert exporter.get("context").build("EX001") == snapshot.get("context").build("EX001")
+
+
+def test_exporter_snapshots_are_cached_per_version_until_invalidated(snapshot):
+    pocketbase = FakePocketBase(snapshot)
+    backend = PocketBaseReferenceBackend(pocketbase)
+    first = scoped(backend, "EX001", snapshot)
+    requests = len(pocketbase.requests)
+    assert scoped(backend, "EX001", snapshot) is first
+    assert len(pocketbase.requests) == requests
+
+    backend.invalidate()
+    assert scoped(backend, "EX001", snapshot) is not first
+    assert len(pocketbase.requests) > requests
+
+
+def test_cache_is_bounded(snapshot):
+    backend = PocketBaseReferenceBackend(FakePocketBase(snapshot), max_entries=1)
+    scoped(backend, "EX001", snapshot)
+    scoped(backend, "EX002", snapshot)
+    assert [key[0] for key in backend._cache] == ["EX002"]
+
+
+def test_falls_back_to_memory_when_pocketbase_fails_or_has_no_rows(snapshot):
+    pocketbase = FakePocketBase(snapshot)
+    backend = PocketBaseReferenceBackend(pocketbase)
+    assert scoped(backend, "EX999", snapshot) is snapshot
+    pocketbase.fail = True
+    assert scoped(backend, "EX001", snapshot) is snapshot
+
+
+def test_filter_values_are_quoted(snapshot):
+    pocketbase = FakePocketBase(snapshot)
+    backend = PocketBaseReferenceBackend(pocketbase)
+    scoped(backend, 'EX"1\\', snapshot)
+    assert pocketbase.requests[0][1] == 'exporter_id="EX\\"1\\\\"'
@@ -0,0 +1,120 @@
+import json
+import time
+import base64
+import asyncio
+
+import httpx
+import pytest
+
+from pocketbase_client import SUPERUSER_AUTH_PATH, PocketBaseClient, PocketBaseError, token_expiry
+
+
+def make_token(expires_at):
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": expires_at}).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+class FakeServer:
+    def __init__(self, token_ttl=3600):
+        self.token_ttl = token_ttl
+        self.logins = 0
+        self.valid_tokens = set()
+        self.requests = []
+
+    def handler(self, request):
+        if request.url.path == SUPERUSER_AUTH_PATH:
+            self.logins += 1
+            token = make_token(time.time() + self.token_ttl) + str(self.logins)
+            self.valid_tokens.add(token)
+            return httpx.Response(200, json={"token": token})
+        self.requests.append(request.headers.get("Authorization"))
+        if request.url.path == "/api/health":
+            return httpx.Response(200, json={"code": 200})
+        if request.headers.get("Authorization") not in self.valid_tokens:
+            return httpx.Response(401, json={"message": "expired"})
+        return httpx.Response(200, json={"items": []})
+
+
+def client_for(server):
+    client = PocketBaseClient("http://pb", "admin@example.com", "secret")
+    client.http = httpx.AsyncClient(base_url="http://pb", transport=httpx.MockTransport(server.handler))
+    return client
+
+
+def test_token_expiry_reads_the_jwt_payload():
+    assert token_expiry(make_token(1234)) == 1234
+    assert token_expiry("not-a-jwt") is None
+
+
+def test_concurrent_requests_share_one_login():
+    server = FakeServer()
+
+    async def run():
+        client = client_for(server)
+        responses = await asyncio.gather(*(client.request("GET", "/api/collections/x/records") for _ in range(20)))
+        await client.request("GET", "/api/collections/x/records")
+        await client.close()
+        return responses
+
+    assert all(response.status_code == 200 for response in asyncio.run(run()))
+    assert server.logins == 1
+    assert len(set(server.requests)) == 1
+
+
+def test_token_near_expiry_is_refreshed_before_use():
+    # Expires inside the refresh margin, so every request re-authenticates first
+    server = FakeServer(token_ttl=60)
+
+    async def run():
+        client = client_for(server)
+        await client.request("GET", "/api/collections/x/records")
+        await client.request("GET", "/api/collections/x/records")
+        await client.close()
+
+    asyncio.run(run())
+    assert server.logins == 2
+
+
+def test_revoked_token_is_replaced_once_on_401():
+    server = FakeServer()
+
+    async def run():
+        client = client_for(server)
+        await client.request("GET", "/api/collections/x/records")
+        server.valid_tokens.clear()
+        response = await client.request("GET", "/api/collections/x/records")
+        await client.close()
+        return response
+
+    assert asyncio.run(run()).status_code == 200
+    assert server.logins == 2
+
+
+def test_unauthenticated_requests_skip_login():
+    server = FakeServer()
+
+    async def run():
+        client = client_for(server)
+        response = await client.health()
+        await client.close()
+        return response
+
+    assert asyncio.run(run()).status_code == 200
+    assert server.logins == 0
+
+
+def test_failed_login_and_failed_json_request_raise():
+    def reject(request):
+        return httpx.Response(400, json={"message": "bad credentials"})
+
+    async def run():
+        client = PocketBaseClient("http://pb", "admin@example.com", "wrong")
+        client.http = httpx.AsyncClient(base_url="http://pb", transport=httpx.MockTransport(reject))
+        try:
+            with pytest.raises(PocketBaseError) as error:
+                await client.json("GET", "/api/collections/x/records")
+            return error.value.status_code
+        finally:
+            await client.close()
+
+    assert asyncio.run(run()) == 400
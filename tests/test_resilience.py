@@ -0,0 +1,209 @@
+import asyncio
+
+import pytest
+
+import resilience
+from resilience import (CircuitBreaker, CircuitOpenError, ProviderCandidate, _run_candidate, hedged_events,
+                        new_turn, wait_until_won)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Replaces the module's time rather than time.monotonic, which the event loop also uses
+    fake = FakeClock()
+    monkeypatch.setattr(resilience, "time", fake)
+    return fake
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0)
+
+
+BACKOFF_DELAY = resilience.backoff_delay
+
+
+def open_breaker(name="p", threshold=2, reset=30):
+    breaker = CircuitBreaker(name, failure_threshold=threshold, reset_seconds=reset)
+    for _ in range(threshold):
+        breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_threshold_and_lets_one_trial_through(clock):
+    breaker = CircuitBreaker("p", failure_threshold=3, reset_seconds=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    clock.now += 30
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow() and breaker.allow()
+
+
+def test_backoff_is_full_jitter_and_capped():
+    for attempt in range(12):
+        delays = [BACKOFF_DELAY(attempt, base=0.25, cap=4.0) for _ in range(50)]
+        assert all(0 <= delay <= min(4.0, 0.25 * 2 ** attempt) for delay in delays)
+
+
+def candidate(name, start, breaker=None, retryable=lambda error: isinstance(error, ConnectionError)):
+    return ProviderCandidate(name, f"route-{name}", breaker or CircuitBreaker(name), start, retryable)
+
+
+def answer(text, delay=0.0, log=None, name=None):
+    async def start(turn):
+        if log is not None:
+            log.append(name)
+        await asyncio.sleep(delay)
+        turn["answer_parts"].append(text)
+        yield {"type": "content", "text": text}
+    return start
+
+
+async def collect(candidates, turn, **options):
+    return [event async for event in hedged_events(candidates, turn, **options)]
+
+
+def test_cancelled_half_open_trial_releases_the_breaker(clock):
+    breaker = open_breaker()
+    clock.now += 30
+
+    async def hang(turn):
+        await asyncio.sleep(3600)
+        yield {"type": "content", "text": "never"}
+
+    async def run():
+        task = asyncio.ensure_future(_run_candidate(0, candidate("p", hang, breaker), asyncio.Queue(), 0))
+        await asyncio.sleep(0.01)
+        assert breaker.trial_in_flight and not breaker.allow()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert not breaker.trial_in_flight
+    assert breaker.allow()
+
+
+def test_trial_losing_the_hedge_does_not_take_the_provider_out(clock):
+    breaker = open_breaker("slow")
+    clock.now += 30
+
+    async def slow(turn):
+        await asyncio.sleep(3600)
+        yield {"type": "content", "text": "late"}
+
+    turn = new_turn()
+    events = asyncio.run(collect([candidate("slow", slow, breaker), candidate("fast", answer("hi"))],
+                                 turn, hedge_after=0.01))
+    assert events == [{"type": "content", "text": "hi"}]
+    assert turn["provider"] == "fast"
+    assert breaker.allow()
+
+
+def test_slow_candidate_is_hedged_and_the_first_token_wins():
+    turn = new_turn()
+    started = []
+    events = asyncio.run(collect([candidate("a", answer("slow", 0.5, started, "a")),
+                                  candidate("b", answer("fast", 0.0, started, "b"))], turn, hedge_after=0.05))
+    assert events == [{"type": "content", "text": "fast"}]
+    assert started == ["a", "b"]
+    assert turn["route"] == "route-b" and turn["answer_parts"] == ["fast"]
+
+
+def test_no_hedge_before_the_deadline():
+    started = []
+    asyncio.run(collect([candidate("a", answer("one", 0.01, started, "a")),
+                         candidate("b", answer("two", 0.0, started, "b"))], new_turn(), hedge_after=1))
+    assert started == ["a"]
+
+
+def test_retryable_failure_before_first_token_is_retried():
+    attempts = []
+
+    async def flaky(turn):
+        attempts.append(len(attempts))
+        if len(attempts) < 3:
+            raise ConnectionError("reset")
+        yield {"type": "content", "text": "ok"}
+
+    turn = new_turn()
+    events = asyncio.run(collect([candidate("a", flaky)], turn, retries=2))
+    assert events == [{"type": "content", "text": "ok"}]
+    assert len(attempts) == 3
+
+
+def test_non_retryable_failure_fails_over_and_all_failures_raise_the_last():
+    async def broken(turn):
+        raise ValueError("bad request")
+        yield
+
+    turn = new_turn()
+    events = asyncio.run(collect([candidate("a", broken), candidate("b", answer("backup"))], turn, hedge_after=5))
+    assert events == [{"type": "content", "text": "backup"}] and turn["provider"] == "b"
+
+    with pytest.raises(ValueError):
+        asyncio.run(collect([candidate("a", broken), candidate("b", broken)], new_turn(), hedge_after=5))
+
+
+def test_open_circuit_skips_the_provider():
+    breaker = open_breaker("a")
+    turn = new_turn()
+    events = asyncio.run(collect([candidate("a", answer("no"), breaker), candidate("b", answer("yes"))], turn))
+    assert events == [{"type": "content", "text": "yes"}]
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(collect([candidate("a", answer("no"), breaker)], new_turn()))
+
+
+def test_winner_failing_mid_stream_raises():
+    async def dies(turn):
+        yield {"type": "content", "text": "partial"}
+        raise ConnectionError("dropped")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(collect([candidate("a", dies), candidate("b", answer("other"))], new_turn(), hedge_after=5))
+
+
+def test_losers_never_run_tools():
+    ran_tools = []
+
+    def calls_tool(name, delay):
+        async def start(turn):
+            await asyncio.sleep(delay)
+            yield {"type": "metadata", "message_type": "tool_use", "tool": "lookup"}
+            await wait_until_won(turn)
+            ran_tools.append(name)
+            yield {"type": "content", "text": f"{name} answer"}
+        return start
+
+    async def run():
+        turn = new_turn()
+        events = await collect([candidate("a", calls_tool("a", 0.05)), candidate("b", calls_tool("b", 0.05))],
+                               turn, hedge_after=0)
+        # Give a cancelled loser every chance to run its tool
+        await asyncio.sleep(0.05)
+        return events, turn
+
+    events, turn = asyncio.run(run())
+    assert ran_tools == ["a"]
+    assert turn["provider"] == "a"
+    assert events[-1] == {"type": "content", "text": "a answer"}
@@ -0,0 +1,105 @@
+import pandas as pd
+
+import response_cache
+from response_cache import ExporterFingerprints, ResponseCache, merge_content_frames, normalize_query
+
+FINGERPRINT = (True, 1, "profile")
+
+
+def frames(text):
+    return [{"type": "metadata", "message_type": "info"}, {"type": "content", "text": text}]
+
+
+def test_normalized_queries_share_an_entry():
+    assert normalize_query("  What is   FSMA 204?? ") == normalize_query("what is fsma 204")
+    cache = ResponseCache()
+    cache.put("What is FSMA 204?", "EX001", FINGERPRINT, frames("answer"), "answer")
+    assert cache.get("what is   fsma 204", "EX001", FINGERPRINT) == (frames("answer"), "answer")
+
+
+def test_entries_are_per_exporter_and_fingerprint():
+    cache = ResponseCache()
+    cache.put("status?", "EX001", FINGERPRINT, frames("one"), "one")
+    assert cache.get("status?", "EX002", FINGERPRINT) is None
+    assert cache.get("status?", None, FINGERPRINT) is None
+    # A changed fingerprint invalidates the entry for good
+    assert cache.get("status?", "EX001", (True, 2, "profile")) is None
+    assert cache.get("status?", "EX001", FINGERPRINT) is None
+    assert cache.stats()["misses"] == 4
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    cache = ResponseCache(ttl=60)
+    cache.put("q", "EX001", FINGERPRINT, frames("a"), "a")
+    now[0] += 59
+    assert cache.get("q", "EX001", FINGERPRINT) is not None
+    now[0] += 2
+    assert cache.get("q", "EX001", FINGERPRINT) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", None, FINGERPRINT, frames("a"), "a")
+    cache.put("b", None, FINGERPRINT, frames("b"), "b")
+    cache.get("a", None, FINGERPRINT)
+    cache.put("c", None, FINGERPRINT, frames("c"), "c")
+    assert cache.get("b", None, FINGERPRINT) is None
+    assert cache.get("a", None, FINGERPRINT) is not None
+
+    small = ResponseCache(max_bytes=200)
+    small.put("big", None, FINGERPRINT, frames("x" * 500), "x" * 500)
+    assert small.stats()["entries"] == 0
+    small.put("one", None, FINGERPRINT, frames("x" * 60), "x" * 60)
+    small.put("two", None, FINGERPRINT, frames("y" * 60), "y" * 60)
+    assert small.get("one", None, FINGERPRINT) is None
+    assert small.stats()["size_bytes"] <= 200
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResponseCache(enabled=False)
+    cache.put("q", None, FINGERPRINT, frames("a"), "a")
+    assert cache.get("q", None, FINGERPRINT) is None
+
+
+def test_content_deltas_are_merged_but_metadata_kept():
+    merged = merge_content_frames([
+        {"type": "metadata", "message_type": "info"},
+        {"type": "content", "text": "Hel"}, {"type": "content", "text": "lo"},
+        {"type": "metadata", "message_type": "compliance"},
+        {"type": "content", "text": "!"},
+    ])
+    assert merged == [
+        {"type": "metadata", "message_type": "info"}, {"type": "content", "text": "Hello"},
+        {"type": "metadata", "message_type": "compliance"}, {"type": "content", "text": "!"},
+    ]
+
+
+def tables(shipment_status="Compliant"):
+    documents = pd.DataFrame({"Exporter ID": ["EX001", "EX002"], "Document ID": ["D1", "D2"]})
+    shipments = pd.DataFrame({"Exporter ID": ["EX001", "EX002"], "Shipment ID": ["S1", "S2"],
+                              "Compliance Status": [shipment_status, "Compliant"]})
+    traceability = pd.DataFrame({"Exporter ID": ["EX002"], "Record ID": ["R1"]})
+    return documents, shipments, traceability
+
+
+def test_fingerprints_change_only_for_the_edited_exporter():
+    before = ExporterFingerprints(*tables())
+    after = ExporterFingerprints(*tables(shipment_status="Non-Compliant"))
+    assert after.changed_exporters(before) == {"EX001"}
+    assert after.for_exporter("EX002") == before.for_exporter("EX002")
+    assert after.for_exporter("EX001") != before.for_exporter("EX001")
+    # Unknown exporters depend on the overall data
+    assert after.for_exporter("EX999") == (False, after.overall)
+    assert after.overall != before.overall
+
+
+def test_invalidation_drops_changed_exporters_and_unscoped_answers():
+    cache = ResponseCache()
+    cache.put("q", "EX001", (True, 1, "p"), frames("a"), "a")
+    cache.put("q", "EX002", (True, 2, "p"), frames("b"), "b")
+    cache.put("q", None, (False, 3, 0), frames("c"), "c")
+    assert cache.invalidate_exporters({"EX001"}) == 2
+    assert cache.get("q", "EX002", (True, 2, "p")) is not None
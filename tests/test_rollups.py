@@ -0,0 +1,56 @@
+import pytest
+
+from rollups import ReferenceRollups, is_aggregate_question
+
+
+@pytest.mark.parametrize("query", [
+    "How are we doing overall?",
+    "How many shipments were rejected?",
+    "What is our compliance rate by month?",
+    "Give me a breakdown by carrier",
+    "Which carrier has the most rejected shipments?",
+    "Show the trend of pending documents",
+    "What percentage of records passed?",
+])
+def test_aggregate_questions(query):
+    assert is_aggregate_question(query)
+
+
+@pytest.mark.parametrize("query", [
+    "When did my most recent shipment leave?",
+    "What is the total quantity on shipment S-1001?",
+    "Is document D-2001 at least approved?",
+    "Can you count on the FDA accepting my certificate?",
+    "What exchange rate applies to my invoice?",
+    "",
+])
+def test_questions_about_specific_records_are_not_aggregate(query):
+    assert not is_aggregate_question(query)
+
+
+def test_exporter_totals_add_up_to_overall(snapshot_rollups):
+    overall = snapshot_rollups.view()["shipments_totals"]["Total"].iloc[0]
+    per_exporter = sum(snapshot_rollups.view(eid)["shipments_totals"]["Total"].iloc[0]
+                       for eid in snapshot_rollups.exporter_ids if "shipments_totals" in snapshot_rollups.view(eid))
+    assert overall == per_exporter
+    assert snapshot_rollups.view("EX999") == {}
+
+
+@pytest.fixture
+def snapshot_rollups(bot):
+    snapshot = bot.reference_data.current
+    return ReferenceRollups(snapshot.documents_df, snapshot.shipments_df, snapshot.traceability_df)
+
+
+def test_aggregate_prompts_keep_the_exporters_rows(bot):
+    rows = bot.build_system_blocks("EX001")[1]["text"]
+    aggregate = bot.build_system_blocks("EX001", aggregate=True)[1]["text"]
+    assert aggregate.startswith(rows)
+    assert "REFERENCE DATA ROLLUPS (exporter EX001" in aggregate
+
+
+def test_aggregate_prompts_without_an_exporter_use_overall_rollups(bot):
+    text = bot.build_system_blocks(None, aggregate=True)[1]["text"]
+    assert text.startswith("REFERENCE DATA ROLLUPS (all exporters")
+    # Unknown exporters get the overall rollups too, not another exporter's rows
+    assert bot.build_system_blocks("EX999", aggregate=True)[1]["text"] == text
@@ -0,0 +1,38 @@
+import pytest
+
+from router import ROUTE_CLAUDE, ROUTE_GROQ, ModelRouter
+
+
+@pytest.fixture
+def router():
+    return ModelRouter(groq_available=lambda: True, enabled=True)
+
+
+@pytest.mark.parametrize("query", [
+    "What are the KDEs required for exports to the US?",
+    "Does the Food Traceability Rule apply to produce shipped to the U.S.?",
+    "What is the US FDA deadline to comply by?",
+    "Explain the FSMA 204 rule for food entering the United States",
+])
+def test_general_rule_questions_about_the_us_go_to_groq(router, query):
+    assert router.classify(query) == (ROUTE_GROQ, "general_rule_question")
+
+
+@pytest.mark.parametrize("query", [
+    "What rule applies to us?",
+    "Us exporters need to know the KDEs, what are they?",
+    "What is required for my shipments?",
+    "We're shipping to the US, what is the rule?",
+])
+def test_pronouns_and_tool_phrases_stay_on_claude(router, query):
+    assert router.classify(query) == (ROUTE_CLAUDE, "tool_intent")
+
+
+def test_exporter_context_and_ids_stay_on_claude(router):
+    assert router.route("What is the rule?", "EX001") == (ROUTE_CLAUDE, "exporter_context")
+    assert router.classify("What is the rule for EX001?") == (ROUTE_CLAUDE, "exporter_id")
+
+
+def test_groq_unavailable_falls_back_to_claude():
+    router = ModelRouter(groq_available=lambda: False, enabled=True)
+    assert router.route("What is the FTL?") == (ROUTE_CLAUDE, "groq_unavailable")
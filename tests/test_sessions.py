@@ -0,0 +1,239 @@
+import re
+import asyncio
+import itertools
+
+import httpx
+import pytest
+
+import sessions
+from sessions import ChatSession, SessionStore, PocketBaseSessionPersistence
+
+
+class FakePocketBase:
+    """The slice of the PocketBase records API the session persistence uses"""
+
+    def __init__(self):
+        self.collections = {"chat_sessions": {}, "chat_messages": {}}
+
+    async def request(self, method, path, json=None, params=None):
+        parts = path.strip("/").split("/")
+        records = self.collections[parts[2]]
+        record_id = parts[4] if len(parts) > 4 else None
+        if method == "GET" and record_id:
+            if record_id not in records:
+                return self._response(method, path, 404, {})
+            return self._response(method, path, 200, records[record_id])
+        if method == "GET":
+            return self._response(method, path, 200, self._list(records, params))
+        if method == "PATCH":
+            if record_id not in records:
+                return self._response(method, path, 404, {})
+            records[record_id].update(json)
+            return self._response(method, path, 200, records[record_id])
+        if method == "POST":
+            if json["id"] in records:
+                return self._response(method, path, 400, {})
+            records[json["id"]] = dict(json)
+            return self._response(method, path, 200, json)
+        raise AssertionError(f"unexpected {method} {path}")
+
+    @staticmethod
+    def _list(records, params):
+        conditions = re.findall(r'(\w+)(=|>=)"([^"]*)"', params["filter"])
+        items = [
+            record for record in records.values()
+            if all(record[field] == value if op == "=" else record[field] >= value
+                   for field, op, value in conditions)
+        ]
+        field = params["sort"].lstrip("-")
+        items.sort(key=lambda record: record[field], reverse=params["sort"].startswith("-"))
+        page, per_page = params["page"], params["perPage"]
+        return {"items": items[(page - 1) * per_page:page * per_page], "totalItems": len(items)}
+
+    @staticmethod
+    def _response(method, path, status_code, body):
+        return httpx.Response(status_code, json=body, request=httpx.Request(method, f"http://pb{path}"))
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    """Strictly increasing timestamps, so turn order does not depend on wall-clock resolution"""
+    ticks = itertools.count()
+    monkeypatch.setattr(sessions, "_now_iso", lambda: f"2026-01-01 00:00:00.{next(ticks):06d}Z")
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def new_store(pocketbase, summarizer=None, token_budget=100000):
+    return SessionStore(PocketBaseSessionPersistence(pocketbase, page_size=4), summarizer, token_budget=token_budget)
+
+
+async def record_turns(store, session_id, count, start=0):
+    session = await store.get(session_id)
+    for i in range(start, start + count):
+        store.record_turn(session, f"question {i}", f"answer {i}")
+    await store.flush()
+    return session
+
+
+def test_reload_returns_every_turn_across_pages_in_order():
+    pocketbase = FakePocketBase()
+    run(record_turns(new_store(pocketbase), "s1", 11))
+
+    session = run(new_store(pocketbase).get("s1"))
+    assert session.turns == [(f"question {i}", f"answer {i}") for i in range(11)]
+
+
+def test_unknown_session_starts_empty():
+    session = run(new_store(FakePocketBase()).get("nobody"))
+    assert session.turns == [] and session.summary == ""
+
+
+def test_history_messages_drop_oldest_turns_over_budget():
+    store = SessionStore(token_budget=12)
+    session = run(store.get("s1"))
+    session.turns = [("a" * 20, "b" * 20), ("short", "reply")]
+    assert store.history_messages(session) == [
+        {"role": "user", "content": "short"}, {"role": "assistant", "content": "reply"}
+    ]
+
+
+def test_compacted_summary_is_persisted_and_summarized_turns_are_not_reloaded(monkeypatch):
+    monkeypatch.setattr(sessions, "SESSION_KEEP_RECENT_TURNS", 2)
+
+    async def summarizer(previous, turns):
+        return (previous + " " + ",".join(user for user, _ in turns)).strip()
+
+    async def converse(store):
+        session = await store.get("s1")
+        for i in range(6):
+            store.record_turn(session, f"question {i}", f"answer {i} " + "x" * 40)
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        await store.flush()
+        return session
+
+    pocketbase = FakePocketBase()
+    session = run(converse(new_store(pocketbase, summarizer, token_budget=30)))
+    assert session.summarized_turns > 0
+
+    reloaded = run(new_store(pocketbase).get("s1"))
+    assert reloaded.summary == session.summary
+    assert reloaded.summarized_turns == session.summarized_turns
+    assert reloaded.turns == session.turns
+    assert len(reloaded.turns) == 6 - session.summarized_turns
+
+
+def test_cleared_session_id_is_not_reloaded():
+    pocketbase = FakePocketBase()
+    store = new_store(pocketbase)
+    run(record_turns(store, "s1", 3))
+
+    store.clear("s1")
+    # Not reloaded even before the close reaches PocketBase
+    assert run(store.get("s1")).turns == []
+    store.clear("s1")
+    run(store.flush())
+    assert run(new_store(pocketbase).get("s1")).turns == []
+
+    # A reused ID keeps only the turns recorded after it was cleared
+    run(record_turns(store, "s1", 2, start=10))
+    session = run(new_store(pocketbase).get("s1"))
+    assert session.turns == [("question 10", "answer 10"), ("question 11", "answer 11")]
+    assert session.summary == ""
+
+
+def test_failed_flush_keeps_writes_for_the_next_attempt():
+    class FlakyPersistence:
+        def __init__(self):
+            self.fail = True
+            self.batches = []
+
+        async def write(self, batch):
+            if self.fail:
+                raise ConnectionError("PocketBase unreachable")
+            self.batches.append(batch)
+
+    persistence = FlakyPersistence()
+    store = SessionStore(persistence)
+    session = ChatSession("s1")
+    store.record_turn(session, "q", "a")
+    with pytest.raises(ConnectionError):
+        run(store.flush())
+    persistence.fail = False
+    run(store.flush())
+    assert [kind for batch in persistence.batches for kind, _, _ in batch] == ["turn"]
+
+
+def shared_store(pocketbase):
+    return SessionStore(PocketBaseSessionPersistence(pocketbase, page_size=4), shared=True)
+
+
+async def settle():
+    """Let write-through flushes scheduled by record_turn and clear finish"""
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+def test_workers_see_turns_recorded_by_each_other():
+    async def converse():
+        pocketbase = FakePocketBase()
+        first, second = shared_store(pocketbase), shared_store(pocketbase)
+        session = await first.get("s1")
+        first.record_turn(session, "question 0", "answer 0")
+        await settle()
+
+        # Written through, so the next request can go to another worker
+        other = await second.get("s1")
+        assert other.turns == [("question 0", "answer 0")]
+        second.record_turn(other, "question 1", "answer 1")
+        await settle()
+
+        # The first worker's hot copy is stale and is reloaded
+        session = await first.get("s1")
+        assert session.turns == [("question 0", "answer 0"), ("question 1", "answer 1")]
+        # Unchanged sessions stay in the hot tier
+        assert await first.get("s1") is session
+
+    run(converse())
+
+
+def test_a_session_cleared_on_another_worker_starts_over():
+    async def converse():
+        pocketbase = FakePocketBase()
+        first, second = shared_store(pocketbase), shared_store(pocketbase)
+        session = await first.get("s1")
+        first.record_turn(session, "question 0", "answer 0")
+        await settle()
+        await second.get("s1")
+        second.clear("s1")
+        await settle()
+        assert (await first.get("s1")).turns == []
+
+    run(converse())
+
+
+def test_unflushed_turns_are_not_dropped_by_the_freshness_check():
+    async def converse():
+        pocketbase = FakePocketBase()
+        store = shared_store(pocketbase)
+        session = await store.get("s1")
+        store.record_turn(session, "question 0", "answer 0")
+        await settle()
+
+        async def unreachable(batch):
+            raise ConnectionError("PocketBase unreachable")
+
+        write = store.persistence.write
+        store.persistence.write = unreachable
+        store.record_turn(session, "question 1", "answer 1")
+        await settle()
+        # The stored session is older than the hot one, which keeps its newer turn
+        assert (await store.get("s1")).turns == [("question 0", "answer 0"), ("question 1", "answer 1")]
+        store.persistence.write = write
+        await store.flush()
+        assert (await shared_store(pocketbase).get("s1")).turns == session.turns
+
+    run(converse())
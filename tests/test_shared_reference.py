@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from shared_reference import LOCK_FILE, POINTER_FILE, SharedProfiles, SharedReferenceStore
+
+
+@pytest.fixture
+def sources(tmp_path):
+    paths = {}
+    for name, rows in (("documents", 3), ("shipments", 2)):
+        path = tmp_path / f"{name}.csv"
+        pd.DataFrame({"Exporter ID": [f"EX{i:03d}" for i in range(rows)], "Status": ["ok"] * rows}).to_csv(
+            path, index=False)
+        paths[name] = (str(path), name)
+    return paths
+
+
+class CountingLoader:
+    def __init__(self):
+        self.loaded = []
+
+    def __call__(self, path, name):
+        self.loaded.append(name)
+        return pd.read_csv(path)
+
+
+def arrow_files(store):
+    return sorted(name for name in os.listdir(store.directory) if name.endswith(".arrow"))
+
+
+def touch(path, rows):
+    pd.DataFrame({"Exporter ID": [f"EX{i:03d}" for i in range(rows)], "Status": ["new"] * rows}).to_csv(
+        path, index=False)
+
+
+def test_first_worker_publishes_and_the_rest_reuse(tmp_path, sources):
+    loader = CountingLoader()
+    store = SharedReferenceStore(str(tmp_path / "shared"))
+    pointer = store.ensure_published(sources, loader)
+    assert pointer["version"] == 1 and sorted(loader.loaded) == ["documents", "shipments"]
+    assert arrow_files(store) == ["documents.v1.arrow", "shipments.v1.arrow"]
+    assert os.path.exists(os.path.join(store.directory, POINTER_FILE))
+
+    # Another worker over the same directory finds everything published
+    other = CountingLoader()
+    assert SharedReferenceStore(store.directory).ensure_published(sources, other) == pointer
+    assert other.loaded == []
+
+    tables = store.map_tables(pointer, ["documents"])
+    assert list(tables["documents"]["Exporter ID"]) == ["EX000", "EX001", "EX002"]
+
+
+def test_only_changed_sources_are_republished(tmp_path, sources):
+    store = SharedReferenceStore(str(tmp_path / "shared"))
+    store.ensure_published(sources, CountingLoader())
+    touch(sources["shipments"][0], 5)
+    loader = CountingLoader()
+    pointer = store.ensure_published(sources, loader)
+    assert loader.loaded == ["shipments"]
+    assert pointer["version"] == 2
+    assert pointer["tables"]["documents"]["file"] == "documents.v1.arrow"
+    assert len(store.map_tables(pointer, ["shipments"])["shipments"]) == 5
+
+
+def test_a_missing_table_file_is_republished(tmp_path, sources):
+    store = SharedReferenceStore(str(tmp_path / "shared"))
+    store.ensure_published(sources, CountingLoader())
+    os.unlink(os.path.join(store.directory, "documents.v1.arrow"))
+    loader = CountingLoader()
+    assert store.ensure_published(sources, loader)["tables"]["documents"]["file"] == "documents.v2.arrow"
+    assert loader.loaded == ["documents"]
+
+
+def test_prune_keeps_the_current_and_previous_versions(tmp_path, sources):
+    store = SharedReferenceStore(str(tmp_path / "shared"))
+    store.ensure_published(sources, CountingLoader())
+    frame = pd.DataFrame({"Exporter ID": ["EX009"], "Status": ["ok"]})
+    store.publish({"shipments": frame}, sources)
+    store.publish({"shipments": frame}, sources)
+    # v1 shipments are two versions old; documents v1 is still current
+    assert arrow_files(store) == ["documents.v1.arrow", "shipments.v2.arrow", "shipments.v3.arrow"]
+    assert store.read_pointer()["version"] == 3
+
+
+def test_profiles_written_by_one_worker_are_seen_by_another(tmp_path):
+    directory = str(tmp_path / "shared")
+    first, second = SharedProfiles(SharedReferenceStore(directory)), SharedProfiles(SharedReferenceStore(directory))
+    assert second.read() == {} and not second.changed()
+    with first.update() as profiles:
+        profiles["EX001"] = {"Exporter Name": "One"}
+    assert not first.changed()
+    assert second.changed()
+    assert second.read() == {"EX001": {"Exporter Name": "One"}}
+    assert not second.changed()
+
+
+def test_profile_updates_do_not_wait_for_a_publish(tmp_path):
+    store = SharedReferenceStore(str(tmp_path / "shared"))
+    profiles = SharedProfiles(store)
+    done = threading.Event()
+
+    def update():
+        with profiles.update() as current:
+            current["EX001"] = {}
+        done.set()
+
+    with store.lock():
+        threading.Thread(target=update).start()
+        # Finishes while the publish lock is held
+        assert done.wait(5)
+    assert os.path.exists(os.path.join(store.directory, LOCK_FILE))
+
+
+def test_profile_updates_are_serialized(tmp_path):
+    directory = str(tmp_path / "shared")
+
+    def add(count):
+        profiles = SharedProfiles(SharedReferenceStore(directory))
+        for _ in range(count):
+            with profiles.update() as current:
+                current[f"EX{len(current) + 1:03d}"] = {}
+                time.sleep(0.001)
+
+    threads = [threading.Thread(target=add, args=(10,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(SharedProfiles(SharedReferenceStore(directory)).read()) == 40
+
+
+def test_profile_tool_waits_for_the_lock_off_the_event_loop(bot, tmp_path, monkeypatch):
+    import asyncio
+    from shared_reference import PROFILES_LOCK_FILE
+
+    store = SharedReferenceStore(str(tmp_path / "shared"))
+    monkeypatch.setattr(bot, "shared_profiles", SharedProfiles(store))
+    monkeypatch.setattr(bot, "exporter_profiles", {})
+    # Restored afterwards, since the tool replaces the profile name index
+    monkeypatch.setattr(bot, "profile_name_index", bot.profile_name_index)
+    held, release = threading.Event(), threading.Event()
+
+    def hold_lock():
+        with store.lock(PROFILES_LOCK_FILE):
+            held.set()
+            release.wait(5)
+
+    async def run():
+        threading.Thread(target=hold_lock).start()
+        held.wait(5)
+        tool = asyncio.ensure_future(bot._tool_collect_exporter_info({"exporter_name": "Locked Co"}, None))
+        ticks = 0
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert not tool.done()
+        release.set()
+        return ticks, await tool
+
+    ticks, (profile, frames) = asyncio.run(run())
+    assert ticks == 5
+    assert profile["Exporter ID"] == "EX001" and frames[0]["message_type"] == "profile_created"
+    assert bot.exporter_profiles == {"EX001": profile}
+    assert SharedProfiles(store).read() == {"EX001": profile}
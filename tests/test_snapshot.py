@@ -0,0 +1,101 @@
+import threading
+
+import pandas as pd
+
+from snapshot import ReferenceDataStore
+
+
+def make_store(sources=("documents", "shipments", "traceability")):
+    parsed = []
+
+    def loader(file_path, required_columns):
+        parsed.append(file_path)
+        return pd.DataFrame({"path": [file_path], "parse": [len(parsed)]})
+
+    store = ReferenceDataStore({name: (f"{name}.csv", []) for name in sources}, loader)
+    builds = []
+
+    def builder(name, depends_on):
+        def build(tables):
+            builds.append(name)
+            return {table: tables[table]["parse"].iloc[0] for table in depends_on}
+        return build
+
+    store.register("context", ["documents", "shipments", "traceability"],
+                   builder("context", ["documents", "shipments", "traceability"]))
+    store.register("compliance", ["traceability"], builder("compliance", ["traceability"]))
+    store.register("links", ["documents", "shipments"], builder("links", ["documents", "shipments"]))
+    return store, parsed, builds
+
+
+def test_load_parses_every_table_and_builds_every_structure():
+    store, parsed, builds = make_store()
+    snapshot = store.load()
+    assert snapshot.version == 1
+    assert sorted(parsed) == ["documents.csv", "shipments.csv", "traceability.csv"]
+    assert sorted(builds) == ["compliance", "context", "links"]
+    assert snapshot.table_versions == {"documents": 1, "shipments": 1, "traceability": 1}
+    assert store.current is snapshot
+
+
+def test_reload_reparses_only_changed_tables_and_reuses_unaffected_structures():
+    store, parsed, builds = make_store()
+    first = store.load()
+    parsed.clear()
+    builds.clear()
+
+    second = store.reload(["shipments"])
+    assert second.version == 2
+    assert parsed == ["shipments.csv"]
+    assert sorted(builds) == ["context", "links"]
+    # Unchanged tables and structures are the same objects, not copies
+    assert second.documents_df is first.documents_df
+    assert second.traceability_df is first.traceability_df
+    assert second.get("compliance") is first.get("compliance")
+    assert second.get("links") is not first.get("links")
+    assert second.table_versions == {"documents": 1, "shipments": 2, "traceability": 1}
+
+
+def test_snapshot_pinned_by_a_reader_is_unchanged_by_reload():
+    store, _, _ = make_store()
+    pinned = store.load()
+    shipments = pinned.shipments_df
+    store.reload(["shipments"])
+    assert pinned.version == 1
+    assert pinned.shipments_df is shipments
+    assert store.current.version == 2
+
+
+def test_reload_with_loaded_tables_skips_the_loader():
+    store, parsed, _ = make_store()
+    store.load()
+    parsed.clear()
+    table = pd.DataFrame({"path": ["shared"], "parse": [99]})
+    snapshot = store.reload([], loaded={"traceability": table})
+    assert parsed == []
+    assert snapshot.traceability_df is table
+    assert snapshot.get("compliance") == {"traceability": 99}
+
+
+def test_reload_with_stale_version_keeps_current_snapshot():
+    store, parsed, _ = make_store()
+    store.load()
+    newer = store.reload(["documents"], version=5)
+    assert newer.version == 5
+    parsed.clear()
+    assert store.reload(["documents"], version=5) is newer
+    assert store.reload(["documents"], version=3) is newer
+    assert parsed == []
+    assert store.reload(["documents"]).version == 6
+
+
+def test_concurrent_reloads_publish_distinct_versions():
+    store, _, _ = make_store()
+    store.load()
+    threads = [threading.Thread(target=store.reload, args=(["shipments"],)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.current.version == 9
+    assert store.current.table_versions["shipments"] == 9